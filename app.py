@@ -12,97 +12,154 @@ This class follows the Controller pattern in MVC. It's responsible for:
 
 import tkinter as tk
 from tkinter import filedialog
-from PIL import Image
-import json
 import threading
+import time
 
 # Import our refactored modules
 from view import MainView
 from core import ModelManager, WikipediaService
+from sequence import SequenceClassifier, is_sequence
+from history import HistoryStore
+from dedup import DedupClassifier
+import embedding_index
+import gallery
+import image_loader
+import perf_profiles
+import profiling
+from stall_watchdog import StallWatchdog, tracked
+from runtime import BackgroundRuntime
 from theme_manager import ThemeManager
-from config import WINDOW_SIZE_MAP
+from translations import Translator
+from config import (WINDOW_SIZE_MAP, DEFAULT_MODEL_NAME, MULTI_CROP_MODE, EMBEDDINGS_ENABLED, DEDUP_HAMMING_THRESHOLD,
+                    WATCHDOG_ENABLED, GALLERY_THUMBNAIL_CHUNK, GALLERY_BATCH_SIZE, DEFAULT_LANGUAGE)
 
 class AppController:
     """The main controller for the Tkinter application."""
-    def __init__(self, root):
+    def __init__(self, root, view_factory=MainView, model_manager=None, wiki_service=None, history=None,
+                 variable_factory=tk.StringVar, theme_manager_factory=ThemeManager):
         """
         Initialize the application.
 
         Args:
             root (tk.Tk): The root Tkinter window.
+
+        The remaining arguments replace the real components, so the controller
+        can run headless with stand-ins (see loadtest.py); they default to the
+        desktop application's own.
         """
         self.root = root
         
         # --- State Management ---
         # These variables hold the current state of the application.
         self.last_prediction = None
+        self.last_file_path = None   # The image the results page shows
         self.model_loaded = False
         self.all_labels = []
+        self.gallery = None          # GalleryItems of the current multi-image selection
+        self.gallery_classified = 0
+        self._gallery_keys = []      # Runtime keys of the selection's outstanding tasks
 
         # --- Initialize Managers and Services ---
         # The controller creates and owns all the major components.
-        self.model_manager = ModelManager()
-        self.wiki_service = WikipediaService()
+        self.model_manager = model_manager or ModelManager()
+        self.wiki_service = wiki_service or WikipediaService()
+        self.history = history or HistoryStore()
+        self.embedding_index = None  # Opened on first use for the active model
+        self._index_lock = threading.Lock()
+        self.dedup = DedupClassifier(self.model_manager) if DEDUP_HAMMING_THRESHOLD > 0 else None
+        # Single files and gallery batches classify on runtime workers, never both at once
+        self._inference_lock = threading.Lock()
+        # All background work (model loading, Wikipedia lookups) runs on one event loop
+        self.runtime = BackgroundRuntime(root)
+        # Measures how long Tk's event loop is blocked, and by which action
+        self.watchdog = StallWatchdog(root).start() if WATCHDOG_ENABLED else None
         
         # --- Load Settings and Translations ---
         self._load_translations()
-        self._setup_tkinter_variables()
+        self._setup_tkinter_variables(variable_factory)
 
         # Initialize the Theme Manager AFTER setting up Tkinter variables
-        self.theme_manager = ThemeManager(self.theme_mode, self.text_size)
+        self.theme_manager = theme_manager_factory(self.theme_mode, self.text_size)
         
         # --- Initialize the Main View ---
         # The view is given a reference to the controller to send back user actions.
-        self.view = MainView(root, self)
+        self.view = view_factory(root, self)
         
         # --- Final Setup ---
         self.apply_initial_settings()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         self._load_model_async()
 
     def _load_translations(self):
-        """Loads language strings from the JSON file."""
-        try:
-            with open('languages.json', 'r', encoding='utf-8') as f:
-                self.translations = json.load(f)
-        except FileNotFoundError:
-            # Fallback in case the JSON is missing
-            self.translations = {"en": {"error_message": "Language file not found."}}
-            print("Error: languages.json not found!")
-
-    def _setup_tkinter_variables(self):
+        """Loads the compiled language bundles (see translations.py)."""
+        self.translator = Translator()
+        self.translations = self.translator.bundles
+
+    def _setup_tkinter_variables(self, variable_factory=tk.StringVar):
         """Sets up the Tkinter StringVars that will be used to track settings."""
-        self.current_lang = tk.StringVar(value='en')
-        self.theme_mode = tk.StringVar(value='light')
-        self.text_size = tk.StringVar(value='Medium')
-        self.window_size = tk.StringVar(value='Standard')
+        self.current_lang = variable_factory(value=DEFAULT_LANGUAGE)
+        # The active table is swapped when the variable changes, not looked up per call
+        self.translator.bind(self.current_lang)
+        self.theme_mode = variable_factory(value='light')
+        self.text_size = variable_factory(value='Medium')
+        self.window_size = variable_factory(value='Standard')
+        self.active_model = variable_factory(value=DEFAULT_MODEL_NAME)
+        self.crop_mode = variable_factory(value=MULTI_CROP_MODE)
 
     def apply_initial_settings(self):
         """Applies the default settings when the app starts."""
-        self.root.title(self.translations['en'].get('window_title', 'FaunaLens'))
+        self.root.title(self.translations[DEFAULT_LANGUAGE].get('window_title', 'FaunaLens'))
         self.apply_window_size()
         self.change_language() # Apply default language
 
-    def _load_model_async(self):
+    def _load_model_async(self, model_name=None):
         """
-        Loads the heavyweight TensorFlow model in a separate thread
-        to prevent the UI from freezing on startup.
+        Loads the heavyweight TensorFlow model on the background runtime
+        to prevent the UI from freezing on startup or when switching models.
+        A newer request supersedes an older one that has not finished yet.
         """
+        self.model_loaded = False
         self.view.show_loading_view()
+        self.view.request_refresh("AIPage")
         
         def task():
-            self.model_loaded = self.model_manager.load_model()
-            self.all_labels = self.model_manager.get_labels()
-            # Once loaded, update the UI from the main thread
-            self.root.after(0, self.on_model_loaded)
+            if model_name:
+                loaded = self.model_manager.set_active_model(model_name)
+            else:
+                loaded = self.model_manager.load_model()
+            return loaded, self.model_manager.get_labels()
 
-        threading.Thread(target=task, daemon=True).start()
+        self.runtime.submit('model_load', task, on_done=self.on_model_loaded,
+                            on_error=self.on_model_load_failed, category='model')
 
-    def on_model_loaded(self):
-        """Callback function executed after the model is loaded."""
+    def on_model_loaded(self, result):
+        """Callback executed on the Tk thread after the model is loaded."""
+        self.model_loaded, self.all_labels = result
         print("Model loading complete. UI is now active.")
+        # Keep the selector in sync if switching models failed and the previous one stayed active
+        self.active_model.set(self.model_manager.active_model_name)
         # Re-enable the upload button and refresh the view
         self.view.show_initial_view()
-        self.view.refresh_ui()
+        self.view.request_refresh()
+
+    def on_model_load_failed(self, error):
+        """Callback executed on the Tk thread if loading the model raised."""
+        print(f"Error loading model: {error}")
+        self.on_model_loaded((False, []))
+
+    def on_close(self):
+        """Stops background work and flushes history before the window closes."""
+        if self.watchdog:
+            print(self.watchdog.summary())
+            self.watchdog.stop()
+        if self.model_manager.cascade is not None:
+            print(self.model_manager.cascade.summary())
+        print(self.view.render_summary())
+        self.runtime.shutdown()
+        self.history.close()
+        if self.embedding_index is not None:
+            self.embedding_index.close()
+        self.root.destroy()
 
     # --- Event Handlers from the View ---
 
@@ -111,57 +168,277 @@ class AppController:
         self.view.show_frame(page_name)
 
     def upload_and_predict(self):
-        """Handles the 'Select File' button click."""
-        file_path = filedialog.askopenfilename(
+        """Handles the 'Select File' button click; selecting several files opens a gallery."""
+        file_paths = filedialog.askopenfilenames(
             title=self.get_translation("file_dialog_title"),
             filetypes=[
-                (self.get_translation("file_types_images"), "*.jpg *.jpeg *.png *.bmp"),
+                (self.get_translation("file_types_images"), "*.jpg *.jpeg *.png *.bmp *.gif *.tif *.tiff *.webp"),
                 (self.get_translation("file_types_all"), "*.*")
             ]
         )
-        if not file_path:
+        if not file_paths:
             return
+        if len(file_paths) == 1:
+            self.classify_file(file_paths[0])
+        else:
+            self.classify_files(file_paths)
 
-        try:
-            pil_image = Image.open(file_path)
+    def upload_folder(self):
+        """Handles the 'Select Folder' button click."""
+        directory = filedialog.askdirectory(title=self.get_translation("folder_dialog_title"))
+        if directory:
+            self.classify_files([directory])
+
+    @tracked('classify_file')
+    def classify_file(self, file_path):
+        """
+        Classifies an image file on the background runtime and shows the results
+        (or an error popup). A newer file supersedes one still being classified.
+        """
+        self._cancel_gallery()
+        self.gallery = None
+        # Shares the 'model' slot with gallery batches, so the Tk thread never waits for inference
+        self.runtime.submit('classify_file', self._classify_file_task, file_path, self.crop_mode.get(),
+                            on_done=lambda result: self._on_file_classified(file_path, result),
+                            on_error=self._on_file_classify_failed, category='model')
+
+    def _classify_file_task(self, file_path, crop_mode):
+        """Decodes and classifies one file. Runs on a background worker."""
+        with self._inference_lock, profiling.section('predict'):
+            # Rejects oversized files from their header before any pixels are decoded
+            with image_loader.open_checked(file_path) as source:
+                if is_sequence(source):
+                    # Animated or multi-page files are classified frame by frame
+                    batch_size = perf_profiles.active_profile()['batch_size']
+                    result = SequenceClassifier(self.model_manager, batch_size=batch_size).classify(source)
+                    print(result.summary())
+                    return image_loader.decode(source), result.predictions
+                # Only a reduced, upright copy is kept; the source is closed right after
+                pil_image = image_loader.decode(source)
+                if crop_mode != 'off':
+                    return pil_image, self.model_manager.predict_multicrop(pil_image, mode=crop_mode)
+                return pil_image, self._predict_single(file_path, pil_image)
+
+    def _on_file_classified(self, file_path, result):
+        """Callback executed on the Tk thread with a file's image and predictions."""
+        pil_image, predictions = result
+        if predictions:
+            self.last_prediction = predictions
+            self.last_file_path = file_path
+            self.history.record(file_path, predictions, self.model_manager.active_model_name)
+            self.view.show_results_view(pil_image, predictions)
+            self.view.request_refresh()
+        else:
+            self.view.show_popup("Error", "Failed to get a prediction.")
+
+    def _on_file_classify_failed(self, error):
+        print(f"Error processing file: {error}")
+        self.view.show_popup("Error", f"Could not open or process the file:\n{error}")
+
+    def _predict_single(self, file_path, pil_image):
+        """
+        Classifies one still image, reusing the predictions of an earlier
+        near-duplicate when there is one.
+        """
+        image_hash, predictions = self.dedup.lookup(pil_image) if self.dedup else (None, None)
+        if predictions is not None:
+            self.dedup.record(reused=True)
+            print(f"Reused predictions of a near-duplicate image. {self.dedup.summary()}")
+            return predictions
+
+        started = time.perf_counter()
+        if self.model_manager.cascade is not None:
+            # Confident images never reach the full model, so there is no embedding to index;
+            # each stage preprocesses the image for its own input size
+            predictions = self.model_manager.classify_images([pil_image], top=3)[0]
+        elif EMBEDDINGS_ENABLED:
+            # One forward pass yields both the labels and the vector for similar-image search
             processed_image = self.model_manager.preprocess_image(pil_image)
-            predictions = self.model_manager.predict(processed_image)
-            
+            scores, embeddings = self.model_manager.predict_with_embeddings(processed_image)
+            predictions = self.model_manager.decode_scores(scores, top=3)[0]
+            self._index_embedding(file_path, embeddings)
+        else:
+            predictions = self.model_manager.predict(self.model_manager.preprocess_image(pil_image))
+        if self.dedup:
+            self.dedup.record(reused=False, seconds=time.perf_counter() - started)
+            self.dedup.remember(image_hash, predictions)
+        return predictions
+
+    # --- Gallery ---
+
+    @tracked('classify_files')
+    def classify_files(self, paths):
+        """
+        Opens a gallery of several files and folders and classifies them in the background.
+        Thumbnails and predictions are inserted as their tasks finish.
+        """
+        self._cancel_gallery()
+        items = [gallery.GalleryItem(path) for path in gallery.collect_images(paths)]
+        if not items:
+            self.view.show_popup("Error", self.get_translation("gallery_empty"))
+            return
+        self.gallery = items
+        self.gallery_classified = 0
+        self.view.show_gallery_view()
+        self.view.request_refresh()
+
+        for start in range(0, len(items), GALLERY_THUMBNAIL_CHUNK):
+            chunk = items[start:start + GALLERY_THUMBNAIL_CHUNK]
+            key = f"gallery_thumbnails:{start}"
+            self._gallery_keys.append(key)
+            self.runtime.submit(key, gallery.make_thumbnails, [item.path for item in chunk],
+                                on_done=lambda results, chunk=chunk: self._on_gallery_thumbnails(chunk, results),
+                                category='thumbnail')
+        # The model category runs one task at a time, so batches finish in selection order
+        for start in range(0, len(items), GALLERY_BATCH_SIZE):
+            chunk = items[start:start + GALLERY_BATCH_SIZE]
+            key = f"gallery_predictions:{start}"
+            self._gallery_keys.append(key)
+            self.runtime.submit(key, gallery.classify_paths, self._classify_gallery_batch, [item.path for item in chunk],
+                                on_done=lambda results, chunk=chunk: self._on_gallery_predictions(chunk, results),
+                                on_error=lambda error, chunk=chunk: self._on_gallery_predictions(chunk, [(None, error)] * len(chunk)),
+                                category='model')
+
+    def _classify_gallery_batch(self, pil_images):
+        """Classifies one gallery batch; runs on a runtime worker."""
+        with self._inference_lock:
+            if self.dedup:
+                return self.dedup.classify_batch(pil_images)
+            return self.model_manager.classify_images(pil_images, top=3)
+
+    def _on_gallery_thumbnails(self, chunk, results):
+        for item, (thumbnail, error) in zip(chunk, results):
+            item.thumbnail = thumbnail
+            item.error = item.error or error
+        self.view.update_gallery()
+
+    def _on_gallery_predictions(self, chunk, results):
+        model_name = self.model_manager.active_model_name
+        for item, (predictions, error) in zip(chunk, results):
             if predictions:
-                self.last_prediction = predictions
-                self.view.show_results_view(pil_image, predictions)
-                self.view.refresh_ui()
+                item.predictions = predictions
+                self.history.record(item.path, predictions, model_name)
             else:
-                self.view.show_popup("Error", "Failed to get a prediction.")
+                item.error = item.error or error or "Failed to get a prediction."
+            self.gallery_classified += 1
+        self.view.update_gallery()
+
+    def _cancel_gallery(self):
+        """Drops the outstanding tasks of the current selection."""
+        for key in self._gallery_keys:
+            self.runtime.cancel(key)
+        self._gallery_keys = []
 
-        except Exception as e:
-            print(f"Error processing file: {e}")
-            self.view.show_popup("Error", f"Could not open or process the file:\n{e}")
+    def open_gallery_item(self, item):
+        """Shows the full results of one gallery image."""
+        if item.predictions:
+            self.last_prediction = item.predictions
+            self.last_file_path = item.path
+            self.view.show_results_view(item.thumbnail or gallery.make_thumbnails([item.path])[0][0], item.predictions)
+            self.view.request_refresh()
+        elif item.error:
+            self.view.show_popup("Error", f"Could not open or process the file:\n{item.error}")
+
+    def show_gallery(self):
+        """Returns from a single result to the gallery it was opened from."""
+        if self.gallery:
+            self.view.show_gallery_view()
+            self.view.request_refresh()
+
+    def _active_index(self, dim=None):
+        """
+        Returns the similar-image index of the active model, reusing the open one.
+        Must be called with `_index_lock` held.
+
+        Raises:
+            FileNotFoundError: If the model has no index yet and `dim` is not given.
+        """
+        model_name = self.model_manager.active_model_name
+        if self.embedding_index is None or self.embedding_index.meta.get('model') != model_name:
+            index = embedding_index.open_index(model_name, dim=dim)
+            if self.embedding_index is not None:
+                self.embedding_index.close()
+            self.embedding_index = index
+        return self.embedding_index
+
+    def _index_embedding(self, file_path, embeddings):
+        """Adds an image's embedding to the similar-image index of the active model."""
+        try:
+            with self._index_lock:
+                self._active_index(dim=embeddings.shape[1]).add([file_path], embeddings)
+        except (OSError, ValueError) as e:
+            print(f"Could not index embedding for '{file_path}': {e}")
+
+    def show_similar_images(self):
+        """Handles the 'Similar' button: lists earlier images that look like the one shown."""
+        file_path = self.last_file_path
+        if not file_path:
+            return
+
+        def on_done(matches):
+            if matches:
+                lines = [f"{similarity:.0%}\t{path}" for path, similarity in matches]
+                self.view.show_popup(self.get_translation("similar_title"), "\n".join(lines))
+            else:
+                self.view.show_popup(self.get_translation("similar_title"), self.get_translation("similar_none"))
+
+        def on_error(error):
+            print(f"Similar-image search failed: {error}")
+            self.view.show_popup("Error", f"Could not open or process the file:\n{error}")
+
+        self.runtime.submit('find_similar', self._find_similar_file, file_path,
+                            on_done=on_done, on_error=on_error, category='model')
+
+    def _find_similar_file(self, file_path, k=10):
+        """Runs find_similar for an image file, leaving the file itself out. Runs on a background worker."""
+        matches = self.find_similar(image_loader.load_image(file_path), k=k + 1)
+        return [(path, similarity) for path, similarity in matches if path != file_path][:k]
+
+    def find_similar(self, pil_image, k=10):
+        """
+        Returns up to k (image_path, similarity) pairs of previously classified
+        images that look like `pil_image`, most similar first.
+        """
+        with self._inference_lock:
+            processed_image = self.model_manager.preprocess_image(pil_image)
+            embedding = self.model_manager.extract_embeddings(processed_image)[0]
+        with self._index_lock:
+            try:
+                index = self._active_index()
+            except FileNotFoundError:
+                return []
+            return index.search(embedding, k=k)
 
     def reset_to_initial_view(self):
         """Handles the 'Clear' button click."""
+        self._cancel_gallery()
+        self.gallery = None
         self.view.show_initial_view()
-        self.view.refresh_ui()
+        self.view.request_refresh()
 
     def search_wikipedia(self, query):
         """
         Handles clicks on result rows to search Wikipedia.
-        This runs in a separate thread to keep the UI responsive.
+        The lookup runs on the background runtime to keep the UI responsive;
+        only the most recent search is shown if several overlap.
         """
-        lang = self.current_lang.get()
+        lang = self.translator.language
         self.view.set_search_result_text(self.get_translation("searching"), "gray")
 
-        def task():
-            title, summary = self.wiki_service.fetch_summary(query, lang)
+        def on_done(result):
+            title, summary = result
             if summary:
-                # Show popup from the main thread
-                self.root.after(0, lambda: self.view.show_popup(title, summary))
-                self.root.after(0, lambda: self.view.set_search_result_text("", "black"))
+                self.view.show_popup(title, summary)
+                self.view.set_search_result_text("", "black")
             else:
-                # Show error from the main thread
-                self.root.after(0, lambda: self.view.set_search_result_text(self.get_translation("page_not_found"), "red"))
-        
-        threading.Thread(target=task, daemon=True).start()
+                self.view.set_search_result_text(self.get_translation("page_not_found"), "red")
+
+        def on_error(error):
+            print(f"Wikipedia search failed: {error}")
+            self.view.set_search_result_text(self.get_translation("page_not_found"), "red")
+
+        self.runtime.submit('wiki_search', self.wiki_service.fetch_summary, query, lang,
+                            on_done=on_done, on_error=on_error, category='wiki')
 
     def manual_search(self):
         """Handles a manual search from the entry box."""
@@ -171,13 +448,16 @@ class AppController:
         else:
             self.view.set_search_result_text(self.get_translation("search_enter_keyword"), "red")
 
+    @tracked('search_labels')
     def search_labels(self, query):
         """Live search through the loaded ImageNet labels."""
         if not query:
             self.view.set_search_result_text("", "black")
+            self.view.show_label_matches([])
             return
             
         matches = [label for label in self.all_labels if query.lower() in label.lower()]
+        self.view.show_label_matches(matches)
         
         if matches:
             result_text = f"{self.get_translation('search_found')} {len(matches)} {self.get_translation('search_total')}"
@@ -187,24 +467,35 @@ class AppController:
 
     # --- Settings Handlers ---
 
+    @tracked('change_language')
     def change_language(self, event=None):
         """Applies the selected language and refreshes the entire UI."""
-        print(f"Language changed to: {self.current_lang.get()}")
+        print(f"Language changed to: {self.translator.language}")
         self.root.title(self.get_translation('window_title'))
-        self.view.refresh_ui()
+        self.view.request_refresh()
 
+    @tracked('toggle_theme')
     def toggle_theme(self):
         """Switches between 'light' and 'dark' themes."""
         new_theme = 'dark' if self.theme_mode.get() == 'light' else 'light'
         self.theme_mode.set(new_theme)
         print(f"Theme changed to: {self.theme_mode.get()}")
-        self.view.refresh_ui()
+        self.view.request_refresh()
 
+    @tracked('apply_text_size')
     def apply_text_size(self, event=None):
         """Applies the selected text size."""
         self.theme_manager.update_fonts()
         print(f"Text size changed to: {self.text_size.get()}")
-        self.view.refresh_ui()
+        self.view.request_refresh()
+
+    def change_model(self, event=None):
+        """Switches the classification model without restarting the application."""
+        model_name = self.active_model.get()
+        if model_name == self.model_manager.active_model_name and self.model_loaded:
+            return
+        print(f"Model changed to: {model_name}")
+        self._load_model_async(model_name)
 
     def apply_window_size(self, event=None):
         """Applies the selected window size."""
@@ -217,4 +508,4 @@ class AppController:
 
     def get_translation(self, key, default=""):
         """Safely gets a translated string for the current language."""
-        return self.translations.get(self.current_lang.get(), {}).get(key, default)
+        return self.translator.table.get(key, default)
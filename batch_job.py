@@ -0,0 +1,391 @@
+# batch_job.py
+# -*- coding: utf-8 -*-
+"""
+Sharded, resumable batch classification for the FaunaLens application.
+
+Reprocessing an archive of millions of images is split over independent
+workers without any coordinator:
+
+    python batch_job.py manifest /archive -o archive.txt    # one image path per line
+    python batch_job.py work archive.txt --shard 3 --shards 16 --output out/
+    python batch_job.py merge out/ --shards 16 -o results.jsonl
+
+or, on one machine, `python batch_job.py launch archive.txt --workers 4 --output out/`,
+which runs every shard as a local process and merges the results.
+
+A path belongs to shard `blake2b(path) mod N`. The manifest and N alone decide
+the split, so any process or node can take any shard. A worker writes one
+JSON line per path to `shard-XXXXX-of-NNNNN.jsonl`, in manifest order, and after
+every few batches it fsyncs that file and atomically replaces a small
+checkpoint holding the committed byte offset and line count. A restarted
+worker cuts off anything past the last checkpoint and skips that many paths,
+so every path is written exactly once however often a worker is killed.
+The merge step refuses to run until every shard's checkpoint reports it complete.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from config import (WATCH_IMAGE_EXTENSIONS, BATCH_JOB_BATCH_SIZE, BATCH_JOB_CHECKPOINT_EVERY,
+                    DEDUP_HAMMING_THRESHOLD)
+
+
+def shard_of(path, shards):
+    """Returns the shard a manifest path belongs to; stable across processes and machines."""
+    digest = hashlib.blake2b(path.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % shards
+
+
+def shard_name(shard, shards):
+    return f"shard-{shard:05d}-of-{shards:05d}"
+
+
+def manifest_digest(manifest_path):
+    """Returns the SHA-256 of a manifest, so workers and the merge agree on the job."""
+    sha = hashlib.sha256()
+    with open(manifest_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def iter_manifest(manifest_path, shard=None, shards=1):
+    """Yields the paths of a manifest in order, optionally only those of one shard."""
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            path = line.rstrip('\n')
+            if path and (shard is None or shard_of(path, shards) == shard):
+                yield path
+
+
+def write_manifest(roots, output):
+    """
+    Lists every image under the given directories into a manifest file, in a stable order.
+
+    Returns:
+        int: The number of paths written.
+    """
+    count = 0
+    with open(f"{output}.tmp", 'w', encoding='utf-8') as f:
+        for root in roots:
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    if name.lower().endswith(WATCH_IMAGE_EXTENSIONS):
+                        f.write(os.path.join(dirpath, name) + "\n")
+                        count += 1
+    os.replace(f"{output}.tmp", output)
+    return count
+
+
+# --- Checkpoints ---
+
+def _write_json_atomic(path, data):
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{path}.tmp", path)
+
+
+def read_checkpoint(output_dir, shard, shards):
+    """Returns a shard's checkpoint dict, or None if the shard has not started."""
+    try:
+        with open(os.path.join(output_dir, f"{shard_name(shard, shards)}.checkpoint.json"), 'r',
+                  encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+class ShardWriter:
+    """Append-only results of one shard, committed through an atomically replaced checkpoint."""
+    def __init__(self, output_dir, shard, shards, digest):
+        """
+        Opens the shard's results and resumes from its last checkpoint.
+
+        Raises:
+            ValueError: If the existing checkpoint belongs to a different manifest or shard count.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        name = shard_name(shard, shards)
+        self.results_path = os.path.join(output_dir, f"{name}.jsonl")
+        self.checkpoint_path = os.path.join(output_dir, f"{name}.checkpoint.json")
+        self.state = read_checkpoint(output_dir, shard, shards) or {
+            'shard': shard, 'shards': shards, 'manifest_sha256': digest,
+            'offset': 0, 'done': 0, 'failed': 0, 'complete': False,
+        }
+        if self.state['manifest_sha256'] != digest:
+            raise ValueError(f"{self.checkpoint_path} belongs to a different manifest; "
+                             f"use a new output directory.")
+        self._file = open(self.results_path, 'a+b')
+        # Lines written after the last checkpoint may be torn or duplicated on resume
+        self._file.truncate(self.state['offset'])
+        self._file.seek(self.state['offset'])
+        self.uncommitted = 0
+
+    def write(self, entries):
+        for entry in entries:
+            self._file.write((json.dumps(entry, ensure_ascii=False) + "\n").encode('utf-8'))
+            self.state['failed'] += 'error' in entry
+        self.uncommitted += len(entries)
+
+    def checkpoint(self, complete=False):
+        """Makes everything written so far durable, then records it in the checkpoint."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.state['offset'] = self._file.tell()
+        self.state['done'] += self.uncommitted
+        self.state['complete'] = complete
+        self.state['updated'] = time.time()
+        self.uncommitted = 0
+        _write_json_atomic(self.checkpoint_path, self.state)
+
+    def close(self):
+        self._file.close()
+
+
+# --- Worker ---
+
+def _classify_batch(classify, paths):
+    """
+    Classifies a batch, isolating the files that make it fail.
+
+    A decoder or model error the batch call does not handle is retried path by
+    path, so one bad file becomes an error entry instead of wedging the shard.
+
+    Returns:
+        list: (predictions or None, error or None) for every path.
+    """
+    from gallery import classify_paths
+
+    try:
+        return classify_paths(classify, paths)
+    except Exception as e:
+        print(f"Batch of {len(paths)} failed ({e}); retrying one path at a time.")
+    results = []
+    for path in paths:
+        try:
+            results.extend(classify_paths(classify, [path]))
+        except Exception as e:
+            results.append((None, e))
+    return results
+
+
+def run_shard(model_manager, manifest_path, shard, shards, output_dir, batch_size=BATCH_JOB_BATCH_SIZE,
+              checkpoint_every=BATCH_JOB_CHECKPOINT_EVERY, should_stop=None):
+    """
+    Classifies every path of one shard that is not yet checkpointed.
+
+    Args:
+        model_manager (ModelManager): A manager whose model is already loaded.
+        manifest_path (str): File with one image path per line.
+        shard, shards (int): Which shard of how many this worker takes.
+        output_dir (str): Directory shared by all shards of the job.
+        batch_size (int): Images per forward pass.
+        checkpoint_every (int): Results per checkpoint.
+        should_stop (callable, optional): Checked between batches; True ends the run early.
+
+    Returns:
+        dict: The shard's final checkpoint.
+    """
+    from dedup import DedupClassifier
+
+    writer = ShardWriter(output_dir, shard, shards, manifest_digest(manifest_path))
+    if writer.state['complete']:
+        writer.close()
+        print(f"{shard_name(shard, shards)} is already complete.")
+        return writer.state
+    dedup = DedupClassifier(model_manager) if DEDUP_HAMMING_THRESHOLD > 0 else None
+    classify = dedup.classify_batch if dedup else (lambda images: model_manager.classify_images(images, top=3))
+    model_name = model_manager.active_model_name
+    skip = writer.state['done']
+    print(f"{shard_name(shard, shards)}: resuming after {skip} paths." if skip else
+          f"{shard_name(shard, shards)}: starting.")
+
+    paths = iter_manifest(manifest_path, shard, shards)
+    for _ in zip(range(skip), paths):
+        pass
+    started, processed, stopped = time.perf_counter(), 0, False
+    try:
+        while True:
+            batch = [path for _, path in zip(range(batch_size), paths)]
+            if not batch:
+                break
+            entries = []
+            for path, (predictions, error) in zip(batch, _classify_batch(classify, batch)):
+                if predictions:
+                    entries.append({'path': path, 'model': model_name,
+                                    'predictions': [[label, float(score)] for (_, label, score) in predictions]})
+                else:
+                    entries.append({'path': path, 'error': str(error or "Failed to get a prediction.")})
+            writer.write(entries)
+            processed += len(entries)
+            if writer.uncommitted >= checkpoint_every:
+                writer.checkpoint()
+            if should_stop is not None and should_stop():
+                stopped = True
+                break
+        writer.checkpoint(complete=not stopped)
+    finally:
+        writer.close()
+    rate = processed / max(time.perf_counter() - started, 1e-9)
+    print(f"{shard_name(shard, shards)}: {writer.state['done']} done ({writer.state['failed']} failed), "
+          f"{processed} this run at {rate:.1f} images/s" + (", stopped early." if stopped else "."))
+    return writer.state
+
+
+# --- Merge ---
+
+def merge(output_dir, shards, output, allow_partial=False):
+    """
+    Concatenates the committed results of every shard into one JSON-lines file.
+
+    Returns:
+        dict: Counts of merged, failed and incomplete shards, or None if shards are
+              unfinished and allow_partial is False.
+    """
+    checkpoints = [read_checkpoint(output_dir, shard, shards) for shard in range(shards)]
+    incomplete = [shard for shard, cp in enumerate(checkpoints) if not (cp and cp['complete'])]
+    if incomplete and not allow_partial:
+        print(f"{len(incomplete)} of {shards} shards are not complete: {incomplete[:20]}")
+        return None
+    digests = {cp['manifest_sha256'] for cp in checkpoints if cp}
+    if len(digests) > 1:
+        raise ValueError("Shards were produced from different manifests.")
+
+    merged = failed = 0
+    with open(f"{output}.tmp", 'wb') as out:
+        for shard, cp in enumerate(checkpoints):
+            if not cp:
+                continue
+            remaining = cp['offset']
+            # Only the checkpointed prefix is part of the result
+            with open(os.path.join(output_dir, f"{shard_name(shard, shards)}.jsonl"), 'rb') as f:
+                while remaining:
+                    block = f.read(min(remaining, 1 << 20))
+                    if not block:
+                        raise ValueError(f"{shard_name(shard, shards)} is shorter than its checkpoint.")
+                    out.write(block)
+                    remaining -= len(block)
+            merged += cp['done']
+            failed += cp['failed']
+    os.replace(f"{output}.tmp", output)
+    summary = {'results': merged, 'failed': failed, 'incomplete_shards': incomplete}
+    print(f"Merged {merged} results ({failed} failed) from {shards - len(incomplete)} shards into {output}.")
+    return summary
+
+
+# --- Local launcher ---
+
+def launch(manifest_path, workers, output_dir, shards=None, output=None, perf_profile='throughput'):
+    """
+    Runs every shard as a local worker process, then merges them.
+    Shards beyond `workers` are handed out as earlier workers finish.
+
+    Returns:
+        int: 0 on success, 1 if a worker failed or the merge was incomplete.
+    """
+    import perf_profiles
+
+    shards = shards or workers
+    threads = max(1, perf_profiles.available_cpus() // workers)
+    queued, running, failed = list(range(shards)), {}, []
+    while queued or running:
+        while queued and len(running) < workers:
+            shard = queued.pop(0)
+            command = [sys.executable, os.path.abspath(__file__), 'work', manifest_path,
+                       '--shard', str(shard), '--shards', str(shards), '--output', output_dir,
+                       '--perf-profile', perf_profile, '--threads', str(threads)]
+            running[shard] = subprocess.Popen(command)
+        time.sleep(0.2)
+        for shard, proc in list(running.items()):
+            if proc.poll() is not None:
+                del running[shard]
+                if proc.returncode != 0:
+                    failed.append(shard)
+    if failed:
+        print(f"Workers for shards {failed} failed; rerun to resume them.")
+        return 1
+    result = merge(output_dir, shards, output or os.path.join(output_dir, 'results.jsonl'))
+    return 0 if result is not None else 1
+
+
+def _work(args):
+    """Entry point of one worker process."""
+    import perf_profiles
+
+    profile = perf_profiles.resolve_profile(args.perf_profile, fallback='throughput')
+    if args.threads:
+        # Several workers share the machine; each gets its slice of the cores
+        profile.update(intra_op_threads=args.threads, inter_op_threads=1)
+    perf_profiles.apply_profile(profile)
+
+    from core import ModelManager
+
+    manager = ModelManager()
+    if not (manager.set_active_model(args.model) if args.model else manager.load_model()):
+        return 1
+    stop = []
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.append(True))
+    state = run_shard(manager, args.manifest, args.shard, args.shards, args.output,
+                      batch_size=args.batch_size or profile['batch_size'],
+                      should_stop=lambda: bool(stop))
+    return 0 if state['complete'] else 1
+
+
+def main(argv=None):
+    """Command-line interface: build a manifest, work one shard, merge, or launch locally."""
+    parser = argparse.ArgumentParser(description="Sharded, resumable batch classification.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    build = sub.add_parser('manifest', help="List every image under the given directories.")
+    build.add_argument('roots', nargs='+')
+    build.add_argument('-o', '--output', required=True)
+
+    work = sub.add_parser('work', help="Classify one shard of a manifest (resumes if interrupted).")
+    work.add_argument('manifest')
+    work.add_argument('--shard', type=int, required=True)
+    work.add_argument('--shards', type=int, required=True)
+    work.add_argument('--output', required=True, help="Directory shared by all shards.")
+    work.add_argument('--model', default=None, help="Registry model (default: the configured one).")
+    work.add_argument('--batch-size', type=int, default=None)
+    work.add_argument('--perf-profile', default='throughput')
+    work.add_argument('--threads', type=int, default=None, help="Intra-op threads for this worker.")
+
+    join = sub.add_parser('merge', help="Combine the results of every shard.")
+    join.add_argument('output_dir')
+    join.add_argument('--shards', type=int, required=True)
+    join.add_argument('-o', '--output', required=True)
+    join.add_argument('--partial', action='store_true', help="Merge even if some shards are unfinished.")
+
+    local = sub.add_parser('launch', help="Run all shards as local processes, then merge.")
+    local.add_argument('manifest')
+    local.add_argument('--workers', type=int, default=2)
+    local.add_argument('--shards', type=int, default=None, help="Default: one per worker.")
+    local.add_argument('--output', required=True, help="Directory for shard results.")
+    local.add_argument('--merged', default=None, help="Merged file (default: OUTPUT/results.jsonl).")
+    local.add_argument('--perf-profile', default='throughput')
+    args = parser.parse_args(argv)
+
+    if args.command == 'manifest':
+        print(f"{write_manifest(args.roots, args.output)} images listed in {args.output}.")
+        return 0
+    if args.command == 'work':
+        if not 0 <= args.shard < args.shards:
+            parser.error("--shard must be between 0 and --shards - 1")
+        return _work(args)
+    if args.command == 'merge':
+        return 0 if merge(args.output_dir, args.shards, args.output, args.partial) is not None else 1
+    return launch(args.manifest, args.workers, args.output, args.shards, args.merged, args.perf_profile)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,214 @@
+# cascade.py
+# -*- coding: utf-8 -*-
+"""
+Confidence-gated model cascade for the FaunaLens application.
+
+Most photos are easy. A cheap first-stage model (MobileNetV2 with a 0.35
+width multiplier at 128px by default) classifies every image. Only an image
+whose first-stage top-1 probability is below the confidence threshold, or
+whose lead over the runner-up is below the margin threshold, is sent on to
+the full model. Both models must predict the same classes.
+
+`python cascade.py tune DIR` runs both models over a sample of images and
+picks the cheapest thresholds that still reach a target accuracy. Accuracy
+is measured against ground-truth labels when given, otherwise against the
+full model's own answers. The result is saved and used by later sessions.
+"""
+
+import argparse
+import csv
+import json
+import os
+import time
+
+import numpy as np
+
+from config import (CASCADE_FIRST_STAGE, CASCADE_CONFIDENCE, CASCADE_MARGIN, CASCADE_TUNED_PATH,
+                    WATCH_IMAGE_EXTENSIONS)
+
+
+def top_two(scores):
+    """Returns the top-1 probability and its margin over the runner-up for every row."""
+    best_two = -np.partition(-np.atleast_2d(scores), 1, axis=1)[:, :2]
+    return best_two[:, 0], best_two[:, 0] - best_two[:, 1]
+
+
+def load_thresholds(path=CASCADE_TUNED_PATH):
+    """Returns the (confidence, margin) saved by the tuner, or None."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            tuned = json.load(f)
+        return tuned['confidence'], tuned['margin']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+class Cascade:
+    """Routing thresholds of a two-stage cascade and the statistics of its decisions."""
+    def __init__(self, first_stage=CASCADE_FIRST_STAGE, confidence=None, margin=None):
+        """
+        Args:
+            first_stage (str): Registry name of the cheap model.
+            confidence (float, optional): Minimum first-stage top-1 probability to accept.
+            margin (float, optional): Minimum lead of top-1 over top-2 to accept.
+
+        Thresholds that are not given come from the tuned file, then from config.
+        """
+        tuned = load_thresholds()
+        self.first_stage = first_stage
+        self.confidence = confidence if confidence is not None else (tuned[0] if tuned else CASCADE_CONFIDENCE)
+        self.margin = margin if margin is not None else (tuned[1] if tuned else CASCADE_MARGIN)
+        self.images = 0
+        self.escalated = 0
+        self.stage_seconds = [0.0, 0.0]
+
+    def route(self, first_scores):
+        """Returns a boolean mask of the images that must go on to the full model."""
+        top1, margin = top_two(first_scores)
+        return (top1 < self.confidence) | (margin < self.margin)
+
+    def record(self, images, escalated, first_seconds, full_seconds):
+        self.images += images
+        self.escalated += escalated
+        self.stage_seconds[0] += first_seconds
+        self.stage_seconds[1] += full_seconds
+
+    def report(self):
+        """Returns a dict with per-stage routing and timing statistics."""
+        accepted = self.images - self.escalated
+        return {
+            'images': self.images,
+            'accepted_first_stage': accepted,
+            'escalated': self.escalated,
+            'escalation_rate': self.escalated / self.images if self.images else 0.0,
+            'first_stage_ms_per_image': 1000 * self.stage_seconds[0] / self.images if self.images else 0.0,
+            'full_ms_per_escalated_image': 1000 * self.stage_seconds[1] / self.escalated if self.escalated else 0.0,
+            'confidence': self.confidence,
+            'margin': self.margin,
+        }
+
+    def summary(self):
+        """Returns the report as a one-line, human-readable string."""
+        r = self.report()
+        return (f"Cascade: {r['images']} images, {r['accepted_first_stage']} answered by '{self.first_stage}', "
+                f"{r['escalated']} escalated ({r['escalation_rate']:.1%}); "
+                f"{r['first_stage_ms_per_image']:.1f} ms/image first stage, "
+                f"{r['full_ms_per_escalated_image']:.1f} ms/image full model")
+
+
+# --- Threshold tuning ---
+
+def tune(first_scores, full_scores, truth=None, target=0.99, first_cost=1.0, full_cost=4.0):
+    """
+    Finds the (confidence, margin) pair with the lowest expected cost per image
+    whose cascade accuracy reaches `target`.
+
+    Args:
+        first_scores, full_scores (ndarray): (N, classes) scores of both models on the same images.
+        truth (ndarray, optional): Correct class index per image (-1 if unknown). Without it the
+                                   full model's top-1 is taken as correct, so `target` is the
+                                   agreement with running the full model on everything.
+        target (float): Required accuracy, as a fraction of the full model's own accuracy.
+        first_cost, full_cost (float): Relative per-image cost of the two models.
+
+    Returns:
+        dict with confidence, margin, accuracy, escalation_rate and relative_cost,
+        or None if no threshold reaches the target.
+    """
+    first_top = first_scores.argmax(axis=1)
+    full_top = full_scores.argmax(axis=1)
+    known = np.ones(len(first_top), dtype=bool) if truth is None else truth >= 0
+    truth = full_top if truth is None else truth
+    first_ok = (first_top == truth)[known]
+    full_ok = (full_top == truth)[known]
+    top1, margin = (a[known] for a in top_two(first_scores))
+    if not len(top1):
+        return None
+    required = target * full_ok.mean()
+
+    confidences = np.linspace(0.0, 1.0, 51)
+    margins = np.linspace(0.0, 0.5, 26)
+    # escalate[c, m, i]: image i goes to the full model under thresholds (c, m)
+    escalate = (top1[None, None, :] < confidences[:, None, None]) | (margin[None, None, :] < margins[None, :, None])
+    accuracy = np.where(escalate, full_ok, first_ok).mean(axis=2)
+    escalation = escalate.mean(axis=2)
+    cost = (first_cost + escalation * full_cost) / full_cost
+    cost = np.where(accuracy >= required, cost, np.inf)
+    c, m = np.unravel_index(np.argmin(cost), cost.shape)
+    if not np.isfinite(cost[c, m]):
+        return None
+    return {'confidence': float(confidences[c]), 'margin': float(margins[m]),
+            'accuracy': float(accuracy[c, m]), 'full_model_accuracy': float(full_ok.mean()),
+            'escalation_rate': float(escalation[c, m]), 'relative_cost': float(cost[c, m])}
+
+
+def _score_all(manager, images, model_name, batch_size=32):
+    """Returns (scores, seconds per image) of a model over a list of PIL images."""
+    scores, started = [], time.perf_counter()
+    for i in range(0, len(images), batch_size):
+        batch = manager.preprocess_batch(images[i:i + batch_size], model_name)
+        scores.append(manager.predict_scores(batch, model_name))
+    return np.concatenate(scores), (time.perf_counter() - started) / max(1, len(images))
+
+
+def main(argv=None):
+    """Command-line interface: tune the cascade thresholds on a directory of images."""
+    import image_loader
+    from core import ModelManager
+
+    parser = argparse.ArgumentParser(description="Tune the confidence-gated model cascade.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    run = sub.add_parser('tune', help="Pick thresholds that reach a target accuracy at the lowest cost.")
+    run.add_argument('directory')
+    run.add_argument('--labels', help="CSV of 'filename,label' ground truth (default: agree with the full model).")
+    run.add_argument('--target', type=float, default=0.99,
+                     help="Required accuracy relative to the full model alone (default: %(default)s).")
+    run.add_argument('--model', default=None, help="Full model (default: the configured one).")
+    run.add_argument('--first-stage', default=CASCADE_FIRST_STAGE)
+    run.add_argument('--output', default=CASCADE_TUNED_PATH)
+    args = parser.parse_args(argv)
+
+    manager = ModelManager()
+    full_model = args.model or manager.active_model_name
+    names = sorted(n for n in os.listdir(args.directory) if n.lower().endswith(WATCH_IMAGE_EXTENSIONS))
+    images = [image_loader.load_image(os.path.join(args.directory, n)) for n in names]
+    if not images:
+        print(f"No images found in {args.directory}.")
+        return 1
+
+    first_scores, first_seconds = _score_all(manager, images, args.first_stage)
+    full_scores, full_seconds = _score_all(manager, images, full_model)
+    if first_scores.shape[1] != full_scores.shape[1]:
+        print("The two models predict different classes and cannot form a cascade.")
+        return 1
+
+    truth = None
+    if args.labels:
+        entry = manager.registry.get(full_model)
+        # Decoding an identity matrix yields the label of every output in order
+        decoded = entry.decode(np.eye(full_scores.shape[1], dtype=np.float32), top=1)
+        index_of = {row[0][1].casefold(): i for i, row in enumerate(decoded)}
+        with open(args.labels, 'r', encoding='utf-8', newline='') as f:
+            wanted = {row[0]: row[1].strip().replace(' ', '_').casefold() for row in csv.reader(f) if len(row) >= 2}
+        truth = np.array([index_of.get(wanted.get(n, ''), -1) for n in names])
+
+    result = tune(first_scores, full_scores, truth, args.target, first_seconds, full_seconds)
+    if result is None:
+        print(f"No thresholds reach {args.target:.1%} of the full model's accuracy.")
+        return 1
+    result.update({'first_stage': args.first_stage, 'model': full_model, 'images': len(images),
+                   'first_stage_ms': first_seconds * 1000, 'full_model_ms': full_seconds * 1000})
+    with open(f"{args.output}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    os.replace(f"{args.output}.tmp", args.output)
+    print(f"confidence >= {result['confidence']:.2f}, margin >= {result['margin']:.2f}: "
+          f"accuracy {result['accuracy']:.1%} (full model {result['full_model_accuracy']:.1%}), "
+          f"{result['escalation_rate']:.1%} escalated, {result['relative_cost']:.0%} of full-model cost "
+          f"-> saved to {args.output}")
+    if result['relative_cost'] >= 1.0:
+        print("Warning: at this target the cascade is slower than running the full model alone.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,170 @@
+# classifier.py
+# -*- coding: utf-8 -*-
+"""
+Embeddable classifier API for using FaunaLens from other Python programs.
+
+    from classifier import Classifier
+
+    clf = Classifier()                       # or Classifier(model="efficientnet_b0", top=5)
+    clf.classify("fox.jpg")                  # [Prediction(wnid, label, score), ...]
+    clf.classify_many(["a.jpg", "b.jpg"])    # one batched forward pass per chunk
+    await clf.aclassify(image_bytes)         # from asyncio code
+
+Importing this module is cheap: TensorFlow is loaded when the first image is
+classified, and neither tkinter nor wikipediaapi is imported unless
+`wikipedia_summary` is called. All Classifier instances in a process share
+one model registry, so a model is loaded once however many instances use it,
+and every method may be called from any thread.
+
+Defaults come from config.py, which reads the FAUNALENS_MODEL, FAUNALENS_TOP_K,
+FAUNALENS_CROP_MODE and FAUNALENS_CLASSIFIER_WORKERS environment variables;
+constructor arguments override them.
+"""
+
+import asyncio
+import collections
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+import image_loader
+from config import CLASSIFIER_MODEL, CLASSIFIER_TOP_K, CLASSIFIER_CROP_MODE, CLASSIFIER_WORKERS
+
+Prediction = collections.namedtuple('Prediction', ['wnid', 'label', 'score'])
+
+_shared_lock = threading.Lock()
+_shared_registry = None
+
+
+def _registry():
+    """Returns the process-wide ModelRegistry, creating it on first use."""
+    global _shared_registry
+    with _shared_lock:
+        if _shared_registry is None:
+            from model_registry import ModelRegistry
+            _shared_registry = ModelRegistry()
+        return _shared_registry
+
+
+class Classifier:
+    """A thread-safe, Tk-free animal classifier."""
+    def __init__(self, model=None, top=None, crop_mode=None, workers=None, registry=None):
+        """
+        Args:
+            model (str, optional): Registry model name (see config.MODEL_SPECS).
+            top (int, optional): Number of predictions returned per image.
+            crop_mode (str, optional): 'off', 'five_crop' or 'tiles' (see multicrop.py).
+            workers (int, optional): Threads used by the async methods.
+            registry (ModelRegistry, optional): Use a private registry instead of the shared one.
+        """
+        from core import ModelManager
+
+        self.model_name = model or CLASSIFIER_MODEL
+        self.top = top or CLASSIFIER_TOP_K
+        self.crop_mode = crop_mode or CLASSIFIER_CROP_MODE
+        self._manager = ModelManager(registry or _registry())
+        self._manager.active_model_name = self.model_name
+        self._executor = ThreadPoolExecutor(max_workers=workers or CLASSIFIER_WORKERS,
+                                            thread_name_prefix='faunalens-classifier')
+        self._wiki = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Stops the worker threads of the async methods. The shared model stays loaded."""
+        self._executor.shutdown(wait=False)
+
+    def load(self):
+        """Loads and warms up the model now instead of on the first call."""
+        self._manager.registry.get(self.model_name)
+        return self
+
+    @property
+    def labels(self):
+        """Every class name the model can predict."""
+        return self._manager.registry.get(self.model_name).labels
+
+    # --- Synchronous API ---
+
+    def _to_image(self, image):
+        """Accepts a path, bytes, a binary file object, a PIL Image or an HxWx3 uint8 array."""
+        if isinstance(image, Image.Image):
+            return image
+        if isinstance(image, np.ndarray):
+            return Image.fromarray(image)
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            image = io.BytesIO(image)
+        elif isinstance(image, os.PathLike):
+            image = os.fspath(image)
+        # Paths and streams get the same size limits as the desktop application
+        with image_loader.open_checked(image) as source:
+            return image_loader.decode(source)
+
+    def _predict(self, pil_images, top):
+        """Runs one forward pass over already decoded images."""
+        manager = self._manager
+        # ModelManager serializes the forward passes of each model it runs, including
+        # a cascade's first stage, so concurrent calls need no lock of their own here
+        if self.crop_mode != 'off':
+            decoded = [manager.predict_multicrop(img, mode=self.crop_mode, model_name=self.model_name, top=top)
+                       for img in pil_images]
+            if any(row is None for row in decoded):
+                raise RuntimeError("Multi-crop prediction failed.")
+        else:
+            decoded = manager.classify_images(pil_images, top=top, model_name=self.model_name)
+        return [[Prediction(wnid, label, float(score)) for wnid, label, score in row] for row in decoded]
+
+    def classify(self, image, top=None):
+        """
+        Classifies one image.
+
+        Args:
+            image: A file path, bytes, a binary file object, a PIL Image or an RGB array.
+            top (int, optional): Number of predictions. Defaults to the instance setting.
+
+        Returns:
+            list of Prediction(wnid, label, score), best first.
+        """
+        return self._predict([self._to_image(image)], top or self.top)[0]
+
+    def classify_many(self, images, top=None, batch_size=32):
+        """
+        Classifies several images, batching them into as few forward passes as possible.
+
+        Returns:
+            A list with one prediction list per input image, in input order.
+        """
+        top = top or self.top
+        results = []
+        images = list(images)
+        for start in range(0, len(images), batch_size):
+            chunk = [self._to_image(image) for image in images[start:start + batch_size]]
+            results.extend(self._predict(chunk, top))
+        return results
+
+    def wikipedia_summary(self, query, lang='en'):
+        """Returns (title, summary) for a label, or (query, None) if there is none."""
+        if self._wiki is None:
+            from core import WikipediaService
+            self._wiki = WikipediaService()
+        return self._wiki.fetch_summary(query, lang)
+
+    # --- Async API ---
+
+    async def aclassify(self, image, top=None):
+        """Async version of classify; inference runs in the classifier's worker threads."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.classify, image, top)
+
+    async def aclassify_many(self, images, top=None, batch_size=32):
+        """Async version of classify_many."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.classify_many, list(images), top, batch_size)
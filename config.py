@@ -7,6 +7,10 @@ This file holds all static configuration data, making it easy to update the
 application's appearance and behavior without changing the core logic.
 It centralizes theme colors, font sizes, and window dimensions.
 """
+import os
+
+# Directory containing this file; used to resolve bundled data paths.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # --- Font and Sizing Configuration ---
 # Defines different text size profiles for UI scalability.
@@ -77,3 +81,172 @@ THEMES = {
         "buttonShadow": "#101010",
     }
 }
+
+# --- Model Artifact Store ---
+# Local, versioned model files so the classifier can start without network access.
+# The store path can be overridden per machine with the FAUNALENS_MODEL_STORE variable.
+MODEL_STORE_DIR = os.environ.get("FAUNALENS_MODEL_STORE", os.path.join(BASE_DIR, "models"))
+DEFAULT_MODEL_NAME = "mobilenet_v2"
+DEFAULT_MODEL_VERSION = None  # None selects the latest version in the store
+MODEL_STORE_VERIFY_CHECKSUMS = True
+# When no local artifact exists, fall back to downloading weights through Keras.
+MODEL_STORE_ALLOW_DOWNLOAD = True
+
+# --- Model Registry ---
+# Every classifier the application can switch between. Models are built on first
+# use from the local store (by name), a saved model file ('path' plus an optional
+# 'labels' text file), or a Keras download of 'builder' with 'kwargs'.
+# 'preprocess' names the tf.keras.applications module whose preprocess_input fits the model.
+MODEL_SPECS = {
+    "mobilenet_v2": {
+        "builder": "MobileNetV2", "kwargs": {},
+        "input_size": 224, "preprocess": "mobilenet_v2",
+    },
+    "mobilenet_v2_0.35_128": {
+        "builder": "MobileNetV2", "kwargs": {"alpha": 0.35, "input_shape": [128, 128, 3]},
+        "input_size": 128, "preprocess": "mobilenet_v2",
+    },
+    "mobilenet_v2_0.5_160": {
+        "builder": "MobileNetV2", "kwargs": {"alpha": 0.5, "input_shape": [160, 160, 3]},
+        "input_size": 160, "preprocess": "mobilenet_v2",
+    },
+    "efficientnet_b0": {
+        "builder": "EfficientNetB0", "kwargs": {},
+        "input_size": 224, "preprocess": "efficientnet",
+    },
+    "resnet50": {
+        "builder": "ResNet50", "kwargs": {},
+        "input_size": 224, "preprocess": "resnet50",
+    },
+}
+# Resident model weights above this budget cause the least recently used models to be evicted.
+MODEL_MEMORY_BUDGET_MB = 256
+# Models unused for this many seconds are evicted on the next lookup (0 disables).
+MODEL_IDLE_EVICT_SECONDS = 600
+
+# --- Sequence Classification ---
+# Frames whose mean greyscale difference (0-1) to the last analysed frame is below
+# this threshold reuse that frame's scores instead of running the model again.
+SEQUENCE_DIFF_THRESHOLD = 0.02
+SEQUENCE_BATCH_SIZE = 16
+SEQUENCE_MAX_FRAMES = 1000  # Frames past this are ignored, so one file cannot run unbounded
+# Weight of the newest frame in the moving average of scores (1.0 disables smoothing).
+SEQUENCE_SMOOTHING = 0.5
+
+# --- Multi-Crop Inference ---
+# 'off' classifies the whole image; 'five_crop' adds the center and four corners;
+# 'tiles' adds an overlapping grid so small animals in large photos are not lost.
+MULTI_CROP_MODE = "off"
+MULTI_CROP_GRID = 2            # Tiles along the shorter image side
+MULTI_CROP_OVERLAP = 0.25      # Fraction by which neighbouring tiles overlap
+MULTI_CROP_FRACTION = 0.6      # Crop side relative to the shorter side for 'five_crop'
+MULTI_CROP_POOLING = "max"     # 'max' or 'mean' over the crop scores
+MULTI_CROP_INCLUDE_FULL = True # Also score the whole image alongside the crops
+
+# --- Watch-Folder Daemon ---
+WATCH_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+WATCH_MANIFEST_NAME = ".faunalens-manifest.jsonl"  # Created inside the watched directory by default
+WATCH_POLL_INTERVAL = 2.0   # Seconds between directory scans when inotify is unavailable
+WATCH_QUEUE_SIZE = 2048     # Detected files waiting for classification before the watcher blocks
+WATCH_BATCH_SIZE = 32       # Images per forward pass and per manifest checkpoint
+
+# --- Prediction History ---
+HISTORY_DB_PATH = os.environ.get("FAUNALENS_HISTORY_DB", os.path.join(BASE_DIR, "history.sqlite3"))
+HISTORY_PAGE_SIZE = 50  # Rows fetched and rendered per history page
+
+# --- Similar-Image Search ---
+EMBEDDING_INDEX_DIR = os.environ.get("FAUNALENS_EMBEDDING_DIR", os.path.join(BASE_DIR, "embeddings"))
+EMBEDDINGS_ENABLED = True   # Index the embedding of every classified image
+EMBEDDING_IVF_NPROBE = 8    # Clusters scanned per query once an IVF partitioning is built
+
+# --- Near-Duplicate Reuse ---
+# Images whose 64-bit difference hashes differ in at most this many bits reuse
+# the predictions of the earlier image instead of running the model (0 disables).
+DEDUP_HAMMING_THRESHOLD = 4
+# Only the most recent 2 x DEDUP_WINDOW hashes are remembered, so long-running
+# daemons and batch jobs do not grow without bound.
+DEDUP_WINDOW = 50000
+
+# --- Offline Wikipedia ---
+# Per-language summary stores built with wiki_store.py; consulted before the network.
+WIKI_STORE_DIR = os.environ.get("FAUNALENS_WIKI_STORE", os.path.join(BASE_DIR, "wiki"))
+WIKI_NETWORK_FALLBACK = True  # Query Wikipedia online when the local store has no entry
+
+# --- Translations ---
+TRANSLATIONS_PATH = os.path.join(BASE_DIR, "languages.json")
+DEFAULT_LANGUAGE = "en"  # Complete language that fills the gaps of the others
+
+# --- Background Runtime ---
+RUNTIME_POLL_MS = 30        # How often the Tk thread collects finished background results
+RUNTIME_MAX_WORKERS = 6     # Threads for blocking work (model calls, file and network I/O)
+# Maximum number of concurrently running tasks per category.
+RUNTIME_CONCURRENCY = {
+    "model": 1,
+    "wiki": 2,
+    "thumbnail": 3,
+    "default": 4,
+}
+
+# --- Gallery ---
+GALLERY_THUMBNAIL_SIZE = 96     # Pixels; the longer side of a gallery tile's image
+GALLERY_THUMBNAIL_CHUNK = 8     # Thumbnails decoded per background task
+GALLERY_BATCH_SIZE = 16         # Images per forward pass while classifying a selection
+GALLERY_DECODE_SIZE = 448       # Longest side images are decoded at for classification
+GALLERY_MAX_FILES = 5000        # Larger selections are cut off
+GALLERY_SPARE_PHOTOS = 64       # Tk images kept for tiles scrolled out of view
+
+# --- Batch Jobs ---
+BATCH_JOB_BATCH_SIZE = 32           # Images per forward pass when no profile sets one
+BATCH_JOB_CHECKPOINT_EVERY = 512    # Results written between two atomic shard checkpoints
+
+# --- Image Loading ---
+IMAGE_MAX_FILE_MB = 200         # Larger files are rejected before they are opened
+IMAGE_MAX_PIXELS = 50_000_000   # Images whose header reports more pixels are rejected undecoded
+IMAGE_WORKING_SIZE = 1024       # Longest side of the decoded copy kept for classification
+IMAGE_MEMORY_BUDGET_MB = 512    # Decoded image memory allowed across the whole process
+
+# --- CPU Performance Profiles ---
+# 'auto' uses the profile saved by `python perf_profiles.py autotune` when there is one,
+# otherwise 'latency' for the desktop app and 'throughput' for the watch-folder daemon.
+PERF_PROFILE = os.environ.get("FAUNALENS_PERF_PROFILE", "auto")
+PERF_TUNED_PROFILE_PATH = os.path.join(BASE_DIR, "perf_profile.json")
+# Thread counts of None mean every CPU available to the process.
+PERF_PROFILES = {
+    "latency": {"intra_op_threads": None, "inter_op_threads": 1, "batch_size": 1, "onednn": True},
+    "throughput": {"intra_op_threads": 2, "inter_op_threads": 2, "batch_size": 32, "onednn": True},
+    "low_footprint": {"intra_op_threads": 1, "inter_op_threads": 1, "batch_size": 4, "onednn": False},
+}
+
+# --- Profiling ---
+# Off unless started with --profile or FAUNALENS_PROFILE=1; see profiling.py.
+PROFILING_ENABLED = os.environ.get("FAUNALENS_PROFILE", "") == "1"
+PROFILE_DIR = os.environ.get("FAUNALENS_PROFILE_DIR", os.path.join(BASE_DIR, "profiles"))
+PROFILE_SAMPLE_EVERY = 1        # Profile every Nth call of each section
+PROFILE_SAMPLE_INTERVAL = 0.0   # Minimum seconds between sampled calls of a section
+PROFILE_TOP_N = 25              # Functions and allocation sites listed in summary.txt
+PROFILE_TRACE_FRAMES = 10       # tracemalloc stack depth (0 disables memory tracing)
+
+# --- UI Stall Watchdog ---
+WATCHDOG_ENABLED = True
+WATCHDOG_INTERVAL_MS = 50   # Heartbeat period of the Tk event loop
+WATCHDOG_STALL_MS = 200     # Heartbeats later than this are recorded as stalls
+WATCHDOG_HISTORY = 10000    # Latencies and stalls kept for percentiles
+# Responsiveness budget checked by StallWatchdog.check_budget (latencies in ms).
+WATCHDOG_BUDGET = {"p95_ms": 50, "p99_ms": 200, "max_ms": 2000}
+
+# --- Embeddable Classifier API ---
+# Defaults of classifier.Classifier; constructor arguments override them.
+CLASSIFIER_MODEL = os.environ.get("FAUNALENS_MODEL", DEFAULT_MODEL_NAME)
+CLASSIFIER_TOP_K = int(os.environ.get("FAUNALENS_TOP_K", "3"))
+CLASSIFIER_CROP_MODE = os.environ.get("FAUNALENS_CROP_MODE", "off")
+CLASSIFIER_WORKERS = int(os.environ.get("FAUNALENS_CLASSIFIER_WORKERS", "4"))
+
+# --- Model Cascade ---
+# When enabled, the cheap first-stage model answers confident images on its own and
+# only the rest are classified by the active model. Thresholds saved by
+# `python cascade.py tune` take precedence over the defaults below.
+CASCADE_ENABLED = os.environ.get("FAUNALENS_CASCADE", "") == "1"
+CASCADE_FIRST_STAGE = "mobilenet_v2_0.35_128"
+CASCADE_CONFIDENCE = 0.6    # Escalate when the first stage's top-1 probability is lower
+CASCADE_MARGIN = 0.2        # ...or when its lead over the second guess is smaller
+CASCADE_TUNED_PATH = os.path.join(BASE_DIR, "cascade.json")
@@ -8,112 +8,263 @@ This module is responsible for the main "business logic":
 - Interacting with external services (Wikipedia).
 """
 
+import os
+import time
+
 import numpy as np
-import wikipediaapi
-import tensorflow as tf # Import moved to top; lazy loading is now handled by the ModelManager's state.
+
+import multicrop
+from cascade import Cascade
+from config import (CASCADE_ENABLED, DEFAULT_MODEL_NAME, MULTI_CROP_GRID, MULTI_CROP_OVERLAP, MULTI_CROP_FRACTION,
+                    MULTI_CROP_POOLING, MULTI_CROP_INCLUDE_FULL, WIKI_STORE_DIR, WIKI_NETWORK_FALLBACK)
+from model_registry import ModelRegistry
+from profiling import profiled
+from wiki_store import SummaryStore, STORE_EXTENSION
 
 class ModelManager:
     """
-    Manages the loading and execution of the TensorFlow MobileNetV2 model.
-    This class encapsulates all machine learning logic.
+    Manages the loading and execution of the classification models.
+    This class encapsulates all machine learning logic; the individual
+    networks are owned by a ModelRegistry and loaded on first use.
     """
-    def __init__(self):
-        """Initializes the ModelManager."""
-        self.model = None
+    def __init__(self, registry=None):
+        """
+        Initializes the ModelManager.
+
+        Args:
+            registry (ModelRegistry, optional): Model registry. Defaults to one built from the config.
+        """
+        self.registry = registry or ModelRegistry()
+        self.active_model_name = DEFAULT_MODEL_NAME
         self.labels = []
+        self.cascade = Cascade() if CASCADE_ENABLED else None
+
+    @property
+    def model(self):
+        """The active Keras model if it is resident, otherwise None."""
+        if not self.registry.is_loaded(self.active_model_name):
+            return None
+        return self.registry.get(self.active_model_name).model
+
+    def available_models(self):
+        """Returns the names of all models that can be selected."""
+        return self.registry.names()
 
     def load_model(self):
         """
-        Loads the Keras MobileNetV2 model and its labels.
-        Uses a "warm-up" prediction to make the first real prediction faster.
+        Loads the active model and its labels.
+        The registry tries the local artifact store first and warms the model up
+        to make the first real prediction faster.
         """
-        if self.model:
-            print("Model is already loaded.")
-            return True
-        
         try:
             print("Loading classification model...")
-            # Load the pre-trained MobileNetV2 model
-            self.model = tf.keras.applications.MobileNetV2(weights="imagenet")
-            
-            # Perform a "warm-up" prediction to reduce latency on the first user call.
-            dummy_input = np.zeros((1, 224, 224, 3))
-            self.model.predict(dummy_input, verbose=0)
-            
-            # Load all 1000 ImageNet class names for the search feature
-            self._load_imagenet_labels()
-            
+            entry = self.registry.get(self.active_model_name)
+            # Load all class names for the search feature
+            self._load_labels(entry)
             print("Classification model and labels loaded successfully.")
             return True
         except Exception as e:
             print(f"FATAL: Error loading classification model: {e}")
-            self.model = None
             return False
 
-    def _load_imagenet_labels(self):
+    def set_active_model(self, name):
         """
-        Retrieves all 1000 ImageNet class names by decoding a dummy tensor.
-        This is a clever way to get the labels without an external file.
+        Switches the default model used for predictions. The model is loaded
+        immediately so the switch fails early if it is unavailable.
+
+        Returns:
+            bool: True if the model is ready to use.
         """
+        previous = self.active_model_name
+        self.active_model_name = name
+        if self.load_model():
+            return True
+        self.active_model_name = previous
+        return False
+
+    def _load_labels(self, entry):
+        """Retrieves all class names of a loaded model."""
         try:
-            dummy_preds = tf.zeros((1, 1000))
-            decoded = tf.keras.applications.mobilenet_v2.decode_predictions(dummy_preds.numpy(), top=1000)[0]
-            # Format them nicely for display and searching
-            self.labels = sorted([label.replace('_', ' ').capitalize() for (_, label, _) in decoded])
+            self.labels = entry.labels
         except Exception as e:
-            print(f"Could not retrieve ImageNet labels: {e}")
+            print(f"Could not retrieve model labels: {e}")
             self.labels = []
             
     def get_labels(self):
-        """Returns the list of loaded ImageNet labels."""
+        """Returns the list of labels of the active model."""
         return self.labels
 
-    def preprocess_image(self, pil_image):
+    def preprocess_image(self, pil_image, model_name=None):
         """
-        Preprocesses a PIL Image object for MobileNetV2.
-        - Resizes to 224x224
+        Preprocesses a PIL Image object for the given (or active) model.
+        - Resizes to the model's input size
         - Converts to numpy array
-        - Handles RGBA transparency
+        - Handles RGBA transparency and palette images
         - Applies model-specific preprocessing
         """
-        img_resized = pil_image.resize((224, 224))
-        img_array = np.array(img_resized)
-        
-        # Drop the alpha channel if the image is RGBA
-        if img_array.shape[2] == 4:
-            img_array = img_array[:, :, :3]
-            
-        img_array_expanded = np.expand_dims(img_array, axis=0)
-        return tf.keras.applications.mobilenet_v2.preprocess_input(img_array_expanded)
+        return self.preprocess_batch([pil_image], model_name)
+
+    def preprocess_batch(self, pil_images, model_name=None):
+        """
+        Preprocesses several PIL Images into a single (N, size, size, 3) batch.
+        """
+        entry = self.registry.get(model_name or self.active_model_name)
+        size = entry.input_size
+        batch = np.empty((len(pil_images), size, size, 3), dtype=np.float32)
+        for i, pil_image in enumerate(pil_images):
+            # Palette (GIF) and greyscale frames have no channel axis; RGBA loses its alpha here
+            if pil_image.mode != 'RGB':
+                pil_image = pil_image.convert('RGB')
+            batch[i] = np.asarray(pil_image.resize((size, size)))
+        return entry.preprocess_input(batch)
+
+    def predict_scores(self, processed_batch, model_name=None):
+        """
+        Runs a preprocessed batch through the given (or active) model.
+
+        Returns:
+            A (N, num_classes) numpy array of class probabilities.
+        """
+        entry = self.registry.get(model_name or self.active_model_name)
+        with entry.lock:
+            return np.asarray(entry.model.predict(processed_batch, verbose=0))
+
+    def decode_scores(self, scores, top=3, model_name=None):
+        """Decodes a (N, num_classes) score array into one top-k list per row."""
+        entry = self.registry.get(model_name or self.active_model_name)
+        return entry.decode(np.atleast_2d(scores), top=top)
+
+    def predict_with_embeddings(self, processed_batch, model_name=None):
+        """
+        Runs one forward pass that returns both class scores and embeddings.
 
-    def predict(self, processed_image):
+        Returns:
+            A tuple of ((N, num_classes) scores, (N, dim) penultimate-layer embeddings).
+        """
+        entry = self.registry.get(model_name or self.active_model_name)
+        with entry.lock:
+            embeddings, scores = entry.embedding_model.predict(processed_batch, verbose=0)
+        return np.asarray(scores), np.asarray(embeddings).reshape(len(embeddings), -1)
+
+    def extract_embeddings(self, processed_batch, model_name=None):
+        """Returns the (N, dim) penultimate-layer embeddings of a preprocessed batch."""
+        return self.predict_with_embeddings(processed_batch, model_name)[1]
+
+    def set_cascade(self, enabled, **options):
         """
-        Uses the loaded model to make a prediction on a preprocessed image.
+        Turns the confidence-gated cascade on or off for classify_images.
+        Keyword arguments (first_stage, confidence, margin) are passed to Cascade.
+        """
+        self.cascade = Cascade(**options) if enabled else None
+
+    def classify_images(self, pil_images, top=3, model_name=None):
+        """
+        Classifies a list of PIL Images, through the cascade when it is enabled.
+
+        Returns:
+            A list with the top predictions of every image, in input order.
+        """
+        model_name = model_name or self.active_model_name
+        cascade = self.cascade
+        if cascade is None or cascade.first_stage == model_name:
+            scores = self.predict_scores(self.preprocess_batch(pil_images, model_name), model_name)
+            return self.decode_scores(scores, top=top, model_name=model_name)
+
+        started = time.perf_counter()
+        scores = self.predict_scores(self.preprocess_batch(pil_images, cascade.first_stage), cascade.first_stage)
+        first_seconds = time.perf_counter() - started
+        escalate = np.flatnonzero(cascade.route(scores))
+        full_seconds = 0.0
+        if len(escalate):
+            started = time.perf_counter()
+            batch = self.preprocess_batch([pil_images[i] for i in escalate], model_name)
+            full_scores = self.predict_scores(batch, model_name)
+            if full_scores.shape[1] != scores.shape[1]:
+                raise ValueError(f"Cascade stage '{cascade.first_stage}' and '{model_name}' predict different classes.")
+            scores[escalate] = full_scores
+            full_seconds = time.perf_counter() - started
+        cascade.record(len(pil_images), len(escalate), first_seconds, full_seconds)
+        # Both stages share the label space, so the active model decodes every row
+        return self.decode_scores(scores, top=top, model_name=model_name)
+
+    def predict(self, processed_image, model_name=None):
+        """
+        Uses the given (or active) model to make a prediction on a preprocessed image.
         
         Returns:
             A list of top 3 predictions or None if an error occurs.
         """
-        if not self.model:
-            print("Error: Prediction called before model was loaded.")
-            return None
-            
         try:
-            predictions = self.model.predict(processed_image, verbose=0)
+            predictions = self.predict_scores(processed_image, model_name)
             # Decode the predictions into human-readable labels
-            return tf.keras.applications.mobilenet_v2.decode_predictions(predictions, top=3)[0]
+            return self.decode_scores(predictions, top=3, model_name=model_name)[0]
         except Exception as e:
             print(f"Error during prediction: {e}")
             return None
 
+    def predict_multicrop(self, pil_image, mode='tiles', pooling=MULTI_CROP_POOLING, model_name=None, top=3):
+        """
+        Classifies several crops of one image in a single batched forward pass
+        and pools their scores, so small subjects in large photos are not lost.
+
+        Args:
+            pil_image (PIL.Image): The image to classify.
+            mode (str): 'tiles', 'five_crop' or 'off' (see multicrop.crop_batch).
+            pooling (str): 'max' or 'mean' aggregation over the crops.
+            model_name (str, optional): Registry model to use. Defaults to the active one.
+            top (int): Number of predictions returned.
+
+        Returns:
+            A list of the top predictions or None if an error occurs.
+        """
+        try:
+            entry = self.registry.get(model_name or self.active_model_name)
+            batch = multicrop.crop_batch(pil_image, entry.input_size, mode, grid=MULTI_CROP_GRID,
+                                         overlap=MULTI_CROP_OVERLAP, crop_fraction=MULTI_CROP_FRACTION,
+                                         include_full=MULTI_CROP_INCLUDE_FULL)
+            batch = entry.preprocess_input(batch)
+            with entry.lock:
+                scores = np.asarray(entry.model.predict(batch, batch_size=len(batch), verbose=0))
+            return entry.decode(multicrop.pool_scores(scores, pooling)[None], top=top)[0]
+        except Exception as e:
+            print(f"Error during multi-crop prediction: {e}")
+            return None
+
 class WikipediaService:
-    """Handles all interactions with the Wikipedia API."""
-    def __init__(self):
-        """Initializes the Wikipedia service with a custom user agent."""
-        self.wiki_api = wikipediaapi.Wikipedia(
-            user_agent='FaunaLens/1.3 (https://github.com/your-repo)', # Good practice to set a user agent
-            extract_format=wikipediaapi.ExtractFormat.WIKI
-        )
+    """
+    Handles all interactions with Wikipedia. Summaries are served from the
+    local offline store when one exists for the language, and fetched from
+    the Wikipedia API only when needed.
+    """
+    def __init__(self, store_dir=WIKI_STORE_DIR):
+        """Initializes the Wikipedia service; the API client is created on first network use."""
+        self._wiki_api = None
+        self.store_dir = store_dir
+        self._stores = {}  # lang_code -> SummaryStore, or None if no store exists
+
+    @property
+    def wiki_api(self):
+        """The Wikipedia API client with a custom user agent, imported only when needed."""
+        if self._wiki_api is None:
+            import wikipediaapi
+            self._wiki_api = wikipediaapi.Wikipedia(
+                user_agent='FaunaLens/1.3 (https://github.com/your-repo)', # Good practice to set a user agent
+                extract_format=wikipediaapi.ExtractFormat.WIKI
+            )
+        return self._wiki_api
 
+    def _offline_store(self, lang_code):
+        """Opens the offline store of a language on first use."""
+        if lang_code not in self._stores:
+            path = os.path.join(self.store_dir, f"{lang_code}{STORE_EXTENSION}")
+            try:
+                self._stores[lang_code] = SummaryStore(path) if os.path.exists(path) else None
+            except (OSError, ValueError) as e:
+                print(f"Could not open offline Wikipedia store '{path}': {e}")
+                self._stores[lang_code] = None
+        return self._stores[lang_code]
+
+    @profiled('wikipedia')
     def fetch_summary(self, query, lang_code='en'):
         """
         Fetches a page summary from Wikipedia for a given query and language.
@@ -121,6 +272,14 @@ class WikipediaService:
         Returns:
             A tuple of (page_title, page_summary). Returns (query, None) on failure.
         """
+        store = self._offline_store(lang_code)
+        if store is not None:
+            result = store.lookup(query)
+            if result is not None:
+                return result
+        if not WIKI_NETWORK_FALLBACK:
+            return query, None
+
         try:
             self.wiki_api.language = lang_code
             page = self.wiki_api.page(query)
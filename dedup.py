@@ -0,0 +1,265 @@
+# dedup.py
+# -*- coding: utf-8 -*-
+"""
+Perceptual-hash near-duplicate detection for the FaunaLens application.
+
+Camera traps fire in bursts, producing many frames that are visually almost
+identical. Each image gets a 64-bit difference hash (dHash); hashes are kept
+in a BK-tree so that any earlier image within a small Hamming distance can be
+found without comparing against every stored hash. When such a neighbour
+exists its predictions are reused and the model is not run at all.
+
+Bursts are close together in time, so only recent hashes are kept: a BK-tree
+cannot delete entries, so a full tree is retired whole and a fresh one started.
+"""
+
+import argparse
+import os
+import time
+
+from PIL import Image
+
+import image_loader
+from config import DEDUP_HAMMING_THRESHOLD, DEDUP_WINDOW, WATCH_IMAGE_EXTENSIONS
+
+
+def dhash(pil_image, hash_size=8):
+    """
+    Computes the difference hash of an image as an integer of hash_size**2 bits.
+    Each bit says whether a pixel is brighter than its right-hand neighbour in
+    a (hash_size + 1) x hash_size greyscale thumbnail.
+    """
+    small = pil_image.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """A Burkhard-Keller tree over integer hashes with Hamming distance."""
+    def __init__(self):
+        self._root = None  # [hash, value, {distance: child}]
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, key, value):
+        """Inserts a hash with an associated value."""
+        self._size += 1
+        if self._root is None:
+            self._root = [key, value, {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(key, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [key, value, {}]
+                return
+            node = child
+
+    def nearest(self, key, threshold):
+        """
+        Returns (distance, value) of the closest stored hash within `threshold`,
+        or None. The triangle inequality prunes every subtree that cannot match.
+        """
+        best = None
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(key, node[0])
+            if distance <= threshold and (best is None or distance < best[0]):
+                best = (distance, node[1])
+                if distance == 0:
+                    break
+            low, high = distance - threshold, distance + threshold
+            stack.extend(child for d, child in node[2].items() if low <= d <= high)
+        return best
+
+
+class HashWindow:
+    """
+    The most recently added hashes, in two BK-trees of at most `size` entries.
+    When the newer tree fills up the older one is dropped, so between `size`
+    and 2 x `size` of the latest hashes are searchable at any time.
+    """
+    def __init__(self, size=DEDUP_WINDOW):
+        self.size = size
+        self._current = BKTree()
+        self._previous = BKTree()
+
+    def __len__(self):
+        return len(self._current) + len(self._previous)
+
+    def add(self, key, value):
+        if len(self._current) >= self.size:
+            self._previous, self._current = self._current, BKTree()
+        self._current.add(key, value)
+
+    def nearest(self, key, threshold):
+        """Returns (distance, value) of the closest remembered hash within `threshold`, or None."""
+        best = self._current.nearest(key, threshold)
+        if best is not None and best[0] == 0:
+            return best
+        older = self._previous.nearest(key, threshold)
+        if older is not None and (best is None or older[0] < best[0]):
+            return older
+        return best
+
+
+class _Slot:
+    """Predictions that may still be pending inference when a duplicate is found."""
+    __slots__ = ('predictions',)
+
+    def __init__(self, predictions=None):
+        self.predictions = predictions
+
+
+class DedupClassifier:
+    """
+    Runs ModelManager predictions behind a perceptual-hash cache and reports
+    how much inference the cache saved.
+    """
+    def __init__(self, model_manager, threshold=DEDUP_HAMMING_THRESHOLD, window=DEDUP_WINDOW):
+        """
+        Args:
+            model_manager (ModelManager): A manager whose model is already loaded.
+            threshold (int): Maximum Hamming distance (out of 64 bits) for two
+                             images to count as near-duplicates.
+            window (int): Hashes per generation; see HashWindow.
+        """
+        self.model_manager = model_manager
+        self.threshold = threshold
+        self.window = window
+        self._trees = {}  # One window per model, since predictions differ between models
+        self.images = 0
+        self.reused = 0
+        self.inference_seconds = 0.0
+
+    def _tree(self):
+        model_name = self.model_manager.active_model_name
+        tree = self._trees.get(model_name)
+        if tree is None:
+            tree = self._trees[model_name] = HashWindow(self.window)
+        return tree
+
+    def lookup(self, pil_image):
+        """
+        Returns (hash, cached_predictions). The predictions are None when no
+        near-duplicate has been classified yet.
+        """
+        key = dhash(pil_image)
+        match = self._tree().nearest(key, self.threshold)
+        if match is not None:
+            return key, match[1].predictions
+        return key, None
+
+    def remember(self, key, predictions):
+        """Stores the predictions of a freshly classified image under its hash."""
+        if predictions:
+            self._tree().add(key, _Slot(predictions))
+
+    def classify_batch(self, pil_images):
+        """
+        Classifies a list of images, running the model only on images with no
+        near-duplicate among earlier images or earlier members of this batch.
+
+        Returns:
+            A list with the top 3 predictions of every image, in input order.
+        """
+        tree = self._tree()
+        # Near-duplicates inside this batch share one inference; they join the
+        # shared tree only after their predictions exist.
+        batch_tree = BKTree()
+        slots, to_infer = [], []
+        for image in pil_images:
+            key = dhash(image)
+            match = tree.nearest(key, self.threshold) or batch_tree.nearest(key, self.threshold)
+            if match is not None:
+                slots.append(match[1])
+                self.reused += 1
+            else:
+                slot = _Slot()
+                batch_tree.add(key, slot)
+                slots.append(slot)
+                to_infer.append((key, image, slot))
+        self.images += len(pil_images)
+
+        if to_infer:
+            started = time.perf_counter()
+            decoded = self.model_manager.classify_images([image for _, image, _ in to_infer], top=3)
+            for (key, _, slot), top3 in zip(to_infer, decoded):
+                slot.predictions = top3
+                tree.add(key, slot)
+            self.inference_seconds += time.perf_counter() - started
+        return [slot.predictions for slot in slots]
+
+    def record(self, reused, seconds=0.0):
+        """Counts one image handled outside classify_batch (e.g. by lookup/remember)."""
+        self.images += 1
+        if reused:
+            self.reused += 1
+        self.inference_seconds += seconds
+
+    def report(self):
+        """Returns a dict describing how much inference the cache avoided."""
+        inferred = self.images - self.reused
+        per_image = self.inference_seconds / inferred if inferred else 0.0
+        return {
+            'images': self.images,
+            'inferred': inferred,
+            'reused': self.reused,
+            'saved_fraction': self.reused / self.images if self.images else 0.0,
+            'estimated_seconds_saved': self.reused * per_image,
+        }
+
+    def summary(self):
+        """Returns the report as a one-line, human-readable string."""
+        r = self.report()
+        return (f"{r['images']} images, {r['inferred']} inferred, {r['reused']} reused from near-duplicates "
+                f"({r['saved_fraction']:.1%} of inference saved, ~{r['estimated_seconds_saved']:.1f}s)")
+
+
+def main(argv=None):
+    """Command-line entry point: classifies a directory and reports the inference saved."""
+    from core import ModelManager
+
+    parser = argparse.ArgumentParser(description="Classify a batch of images with near-duplicate reuse.")
+    parser.add_argument('directory')
+    parser.add_argument('--threshold', type=int, default=DEDUP_HAMMING_THRESHOLD)
+    parser.add_argument('--batch-size', type=int, default=32)
+    args = parser.parse_args(argv)
+
+    manager = ModelManager()
+    if not manager.load_model():
+        return 1
+    classifier = DedupClassifier(manager, threshold=args.threshold)
+    paths = sorted(os.path.join(args.directory, n) for n in os.listdir(args.directory)
+                   if n.lower().endswith(WATCH_IMAGE_EXTENSIONS))
+    for i in range(0, len(paths), args.batch_size):
+        chunk, images = [], []
+        for path in paths[i:i + args.batch_size]:
+            try:
+                images.append(image_loader.load_image(path))
+                chunk.append(path)
+            except (OSError, ValueError) as e:
+                print(f"{os.path.basename(path)}\tskipped: {e}")
+        if not images:
+            continue
+        for path, predictions in zip(chunk, classifier.classify_batch(images)):
+            print(f"{os.path.basename(path)}\t{predictions[0][1]}\t{predictions[0][2]:.3f}")
+    print(classifier.summary())
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
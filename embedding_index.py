@@ -0,0 +1,362 @@
+# embedding_index.py
+# -*- coding: utf-8 -*-
+"""
+Image embedding index for similar-image search in the FaunaLens application.
+
+Penultimate-layer embeddings from the classifier are L2-normalized and
+appended to a memory-mapped float16 matrix, with a JSON-lines id map that
+records which image each row belongs to. Queries compute cosine similarity
+as one matrix-vector product per chunk and keep a running top-k, so a
+brute-force search over a million 1280-d vectors only touches memory once.
+
+For large collections an optional IVF (inverted file) partitioning can be
+built: rows are clustered with k-means and a query only scans the clusters
+whose centroids are closest to it.
+
+Files in an index directory:
+    meta.json      - dimension and model name
+    vectors.f16    - row-major float16 matrix, grown by doubling
+    ids.jsonl      - one key per row; its line count is the number of valid rows
+    ivf.npz        - optional centroids and per-cluster row lists
+
+A crash can leave a partial last line in ids.jsonl. Opening an index cuts it
+back to its last complete line, so the next key starts on a line of its own;
+`python embedding_index.py check-recovery` exercises that case.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from config import EMBEDDING_INDEX_DIR, EMBEDDING_IVF_NPROBE
+
+_VECTORS_FILE = "vectors.f16"
+_IDS_FILE = "ids.jsonl"
+_META_FILE = "meta.json"
+_IVF_FILE = "ivf.npz"
+_INITIAL_CAPACITY = 1024
+_SEARCH_CHUNK = 65536
+
+
+def _normalize(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _nearest(vectors, centroids, chunk=8192):
+    """Returns the index of the most similar centroid for each row, in bounded-memory chunks."""
+    assign = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk):
+        block = np.asarray(vectors[start:start + chunk], dtype=np.float32)
+        assign[start:start + chunk] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+
+def _top_k(scores, ids, k):
+    """Returns the (ids, scores) of the k best scores, best first."""
+    if len(scores) > k:
+        best = np.argpartition(scores, -k)[-k:]
+        scores, ids = scores[best], ids[best]
+    order = np.argsort(scores)[::-1]
+    return ids[order], scores[order]
+
+
+class EmbeddingIndex:
+    """An append-only, memory-mapped store of normalized embeddings."""
+    def __init__(self, directory, dim=None, model_name=None):
+        """
+        Opens an index, creating it if `dim` is given and none exists yet.
+
+        Args:
+            directory (str): The index directory.
+            dim (int, optional): Embedding size; required to create a new index.
+            model_name (str, optional): Recorded so vectors from different models are never mixed.
+        """
+        self.directory = directory
+        meta_path = os.path.join(directory, _META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                self.meta = json.load(f)
+            if dim is not None and dim != self.meta['dim']:
+                raise ValueError(f"Index at {directory} has dimension {self.meta['dim']}, not {dim}.")
+        elif dim is None:
+            raise FileNotFoundError(f"No embedding index at {directory}.")
+        else:
+            os.makedirs(directory, exist_ok=True)
+            self.meta = {'dim': int(dim), 'model': model_name}
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump(self.meta, f)
+        self.dim = self.meta['dim']
+
+        self._vectors_path = os.path.join(directory, _VECTORS_FILE)
+        if not os.path.exists(self._vectors_path):
+            self._resize(_INITIAL_CAPACITY)
+        self._map()
+
+        ids_path = os.path.join(directory, _IDS_FILE)
+        self.keys = self._recover_ids(ids_path, len(self._vectors)) if os.path.exists(ids_path) else []
+        self._ids_file = open(ids_path, 'a', encoding='utf-8')
+        self._ivf = self._load_ivf()
+
+    def __len__(self):
+        return len(self.keys)
+
+    # --- Storage ---
+
+    @staticmethod
+    def _recover_ids(path, capacity):
+        """
+        Reads the id map, truncating it to the rows that were completely written.
+
+        Args:
+            path (str): The ids.jsonl file.
+            capacity (int): Rows the vector file can hold; ids beyond it have no vector.
+
+        Returns:
+            list: The keys of the valid rows.
+        """
+        with open(path, 'rb+') as f:
+            data = f.read()
+            # Only newline-terminated lines were completely written
+            end = data.rfind(b"\n") + 1
+            lines = data[:end].splitlines(keepends=True)
+            if len(lines) > capacity:
+                lines = lines[:capacity]
+                end = sum(len(line) for line in lines)
+            if end < len(data):
+                print(f"Embedding index {path}: discarding {len(data) - end} bytes of an interrupted write.")
+                f.truncate(end)
+        return [json.loads(line) for line in lines]
+
+    def _map(self):
+        capacity = os.path.getsize(self._vectors_path) // (self.dim * 2)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float16, mode='r+', shape=(capacity, self.dim))
+
+    def _resize(self, capacity):
+        with open(self._vectors_path, 'ab') as f:
+            f.truncate(capacity * self.dim * 2)
+
+    def add(self, keys, vectors):
+        """
+        Appends embeddings. Vectors are written before their ids, so after a crash
+        any vector without an id line is simply overwritten by the next add.
+
+        Args:
+            keys (list): One JSON-serializable key (e.g. an image path) per vector.
+            vectors (array-like): (N, dim) embeddings; they are normalized here.
+        """
+        vectors = _normalize(vectors)
+        if vectors.shape != (len(keys), self.dim):
+            raise ValueError(f"Expected {len(keys)} vectors of size {self.dim}, got {vectors.shape}.")
+        start, end = len(self.keys), len(self.keys) + len(keys)
+        if end > len(self._vectors):
+            self._vectors.flush()
+            del self._vectors
+            self._resize(max(end, 2 * (start or _INITIAL_CAPACITY)))
+            self._map()
+        self._vectors[start:end] = vectors
+        self._vectors.flush()
+        for key in keys:
+            self._ids_file.write(json.dumps(key, ensure_ascii=False) + "\n")
+        self._ids_file.flush()
+        self.keys.extend(keys)
+
+    def close(self):
+        self._vectors.flush()
+        self._ids_file.close()
+
+    # --- Search ---
+
+    def search(self, vector, k=10, nprobe=EMBEDDING_IVF_NPROBE):
+        """
+        Finds the k most similar stored vectors by cosine similarity.
+
+        Args:
+            vector (array-like): The query embedding.
+            k (int): Number of results.
+            nprobe (int): Clusters to scan when an IVF partitioning exists.
+                          Rows added after the IVF was built are always scanned.
+
+        Returns:
+            list of (key, similarity), most similar first.
+        """
+        count = len(self.keys)
+        if count == 0:
+            return []
+        query = _normalize(vector)[0]
+        k = min(k, count)
+        best_ids = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+
+        if self._ivf is not None and nprobe:
+            centroids, order, offsets, indexed = self._ivf
+            probes = np.argsort(centroids @ query)[::-1][:nprobe]
+            rows = np.sort(np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probes]))
+            for i in range(0, len(rows), _SEARCH_CHUNK):
+                chunk_rows = rows[i:i + _SEARCH_CHUNK]
+                scores = self._vectors[chunk_rows].astype(np.float32) @ query
+                best_ids, best_scores = _top_k(np.concatenate([best_scores, scores]),
+                                               np.concatenate([best_ids, chunk_rows]), k)
+            scan_from = indexed
+        else:
+            scan_from = 0
+
+        for start in range(scan_from, count, _SEARCH_CHUNK):
+            end = min(start + _SEARCH_CHUNK, count)
+            scores = self._vectors[start:end].astype(np.float32) @ query
+            best_ids, best_scores = _top_k(np.concatenate([best_scores, scores]),
+                                           np.concatenate([best_ids, np.arange(start, end)]), k)
+        return [(self.keys[i], float(s)) for i, s in zip(best_ids, best_scores)]
+
+    # --- IVF partitioning ---
+
+    def build_ivf(self, n_lists=None, sample_size=100000, iterations=10, seed=0):
+        """
+        Clusters the stored vectors with spherical k-means and saves the
+        inverted lists. Rebuild occasionally as the collection grows.
+
+        Args:
+            n_lists (int, optional): Number of clusters. Defaults to about sqrt(N).
+            sample_size (int): Vectors used to train the centroids.
+            iterations (int): k-means iterations.
+        """
+        count = len(self.keys)
+        if count == 0:
+            return
+        n_lists = n_lists or max(1, int(np.sqrt(count)))
+        rng = np.random.default_rng(seed)
+        sample = self._vectors[np.sort(rng.choice(count, min(count, sample_size), replace=False))].astype(np.float32)
+        centroids = sample[rng.choice(len(sample), min(n_lists, len(sample)), replace=False)]
+        for _ in range(iterations):
+            assign = _nearest(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            # Empty clusters keep their previous centroid
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = _normalize(sums)
+
+        assign = _nearest(self._vectors[:count], centroids)
+        order = np.argsort(assign, kind='stable').astype(np.int64)
+        offsets = np.searchsorted(assign[order], np.arange(len(centroids) + 1))
+        np.savez(os.path.join(self.directory, _IVF_FILE), centroids=centroids, order=order,
+                 offsets=offsets, indexed=np.array(count))
+        self._ivf = (centroids, order, offsets, count)
+
+    def _load_ivf(self):
+        path = os.path.join(self.directory, _IVF_FILE)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            ivf = data['centroids'], data['order'], data['offsets'], int(data['indexed'])
+        if ivf[3] > len(self.keys):
+            # Built over rows that were cut back after a crash: scan everything instead
+            print(f"Ignoring {path}: it indexes rows this index no longer has.")
+            return None
+        return ivf
+
+
+def open_index(model_name, dim=None):
+    """Opens (or, with `dim`, creates) the index for a model under EMBEDDING_INDEX_DIR."""
+    return EmbeddingIndex(os.path.join(EMBEDDING_INDEX_DIR, model_name), dim=dim, model_name=model_name)
+
+
+def check_recovery():
+    """
+    Simulates a crash in the middle of writing a key and checks that the index
+    still opens, keeps its complete rows and accepts new ones.
+
+    Returns:
+        list: Descriptions of the problems found; empty if recovery works.
+    """
+    directory = tempfile.mkdtemp(prefix='faunalens-index-')
+    problems = []
+    try:
+        rng = np.random.default_rng(0)
+        index = EmbeddingIndex(directory, dim=8, model_name='check')
+        index.add(['a', 'b'], rng.normal(size=(2, 8)))
+        index.close()
+        with open(os.path.join(directory, _IDS_FILE), 'a', encoding='utf-8') as f:
+            f.write('"c')  # The crash: a vector whose id line was cut short
+
+        index = EmbeddingIndex(directory)
+        if index.keys != ['a', 'b']:
+            problems.append(f"after the crash the index holds {index.keys}, not ['a', 'b']")
+        vector = rng.normal(size=(1, 8))
+        index.add(['d'], vector)
+        index.close()
+
+        index = EmbeddingIndex(directory)
+        if index.keys != ['a', 'b', 'd']:
+            problems.append(f"after adding 'd' the index holds {index.keys}, not ['a', 'b', 'd']")
+        elif index.search(vector[0], k=1)[0][0] != 'd':
+            problems.append("the row added after the crash is not found by a search")
+        index.close()
+    except (OSError, ValueError) as e:
+        problems.append(f"the index cannot be reopened: {e}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return problems
+
+
+def main(argv=None):
+    """Command-line interface: add images, build the IVF, query similar images, or check crash recovery."""
+    from PIL import Image
+
+    parser = argparse.ArgumentParser(description="Similar-image search over FaunaLens embeddings.")
+    parser.add_argument('--model', default=None)
+    sub = parser.add_subparsers(dest='command', required=True)
+    add = sub.add_parser('add', help="Embed and index image files.")
+    add.add_argument('paths', nargs='+')
+    ivf = sub.add_parser('build-ivf', help="Partition the index for faster queries.")
+    ivf.add_argument('--lists', type=int, default=None)
+    query = sub.add_parser('query', help="Find images similar to the given one.")
+    query.add_argument('path')
+    query.add_argument('-k', type=int, default=10)
+    sub.add_parser('check-recovery', help="Check that an index survives a write interrupted by a crash.")
+    args = parser.parse_args(argv)
+
+    if args.command == 'check-recovery':
+        problems = check_recovery()
+        for problem in problems:
+            print(f"FAIL: {problem}")
+        print("Crash recovery: " + ("FAILED" if problems else "OK"))
+        return 1 if problems else 0
+
+    from core import ModelManager
+    manager = ModelManager()
+    if args.model:
+        manager.active_model_name = args.model
+    model_name = manager.active_model_name
+
+    if args.command == 'build-ivf':
+        index = open_index(model_name)
+        index.build_ivf(n_lists=args.lists)
+        print(f"Built IVF over {len(index)} vectors.")
+        return 0
+
+    if not manager.load_model():
+        return 1
+    if args.command == 'add':
+        index = None
+        for i in range(0, len(args.paths), 32):
+            chunk = args.paths[i:i + 32]
+            images = [Image.open(p) for p in chunk]
+            embeddings = manager.extract_embeddings(manager.preprocess_batch(images))
+            index = index or open_index(model_name, dim=embeddings.shape[1])
+            index.add([os.path.abspath(p) for p in chunk], embeddings)
+        print(f"Index now holds {len(index)} vectors.")
+    else:
+        embedding = manager.extract_embeddings(manager.preprocess_image(Image.open(args.path)))
+        for key, similarity in open_index(model_name).search(embedding[0], k=args.k):
+            print(f"{similarity:.3f}\t{key}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
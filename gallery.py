@@ -0,0 +1,106 @@
+# gallery.py
+# -*- coding: utf-8 -*-
+"""
+Multi-image selections for the FaunaLens application.
+
+Selecting several files, or a whole folder, opens a gallery instead of the
+single-result view. The work is split into small tasks on the controller's
+background runtime, so the Tk thread only ever inserts finished results:
+
+    thumbnails  - decoded in chunks on the 'thumbnail' category, several at once
+    predictions - classified in batches on the 'model' category, one at a time,
+                  so results stream in as the inference queue drains
+
+The gallery widget (ui_components.GalleryGrid) only creates tiles for the
+visible rows, so a 500-photo field session needs no more widgets than a dozen.
+"""
+
+import os
+
+from PIL import Image
+
+import image_loader
+from config import GALLERY_THUMBNAIL_SIZE, GALLERY_DECODE_SIZE, GALLERY_MAX_FILES, WATCH_IMAGE_EXTENSIONS
+
+
+class GalleryItem:
+    """One image of a gallery and whatever is known about it so far."""
+    __slots__ = ('path', 'thumbnail', 'predictions', 'error')
+
+    def __init__(self, path):
+        self.path = path
+        self.thumbnail = None    # Small PIL image, once decoded
+        self.predictions = None  # Top predictions, once classified
+        self.error = None        # Why the image could not be read or classified
+
+
+def collect_images(paths, limit=GALLERY_MAX_FILES):
+    """
+    Expands folders into the image files they contain.
+
+    Args:
+        paths (list): Files and folders. Files are kept as chosen; folders are
+                      searched recursively for WATCH_IMAGE_EXTENSIONS.
+        limit (int): Maximum number of files returned.
+
+    Returns:
+        list: Image file paths in a stable order.
+    """
+    found = []
+    for path in paths:
+        if not os.path.isdir(path):
+            found.append(path)
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            found.extend(os.path.join(dirpath, name) for name in sorted(filenames)
+                         if name.lower().endswith(WATCH_IMAGE_EXTENSIONS))
+    if len(found) > limit:
+        print(f"Selection has {len(found)} images; only the first {limit} are shown.")
+        found = found[:limit]
+    return found
+
+
+def make_thumbnails(paths, size=GALLERY_THUMBNAIL_SIZE):
+    """
+    Decodes small thumbnails. Runs on a background worker.
+
+    Returns:
+        list: (thumbnail or None, error or None) for every path.
+    """
+    results = []
+    for path in paths:
+        try:
+            # JPEG draft mode decodes straight at a fraction of the full size
+            thumbnail = image_loader.load_image(path, max_side=size * 2, wait=30)
+            thumbnail.thumbnail((size, size), Image.Resampling.LANCZOS)
+            results.append((thumbnail, None))
+        except (OSError, ValueError) as e:
+            results.append((None, e))
+    return results
+
+
+def classify_paths(classify, paths, decode_size=GALLERY_DECODE_SIZE):
+    """
+    Decodes a batch of image files and classifies them in one call. Runs on a background worker.
+
+    Args:
+        classify (callable): Takes a list of PIL Images and returns their top predictions.
+        paths (list): Image file paths.
+        decode_size (int): Longest side the images are decoded at.
+
+    Returns:
+        list: (predictions or None, error or None) for every path.
+    """
+    results = [(None, None)] * len(paths)
+    images, positions = [], []
+    for i, path in enumerate(paths):
+        try:
+            images.append(image_loader.load_image(path, max_side=decode_size, wait=30))
+            positions.append(i)
+        except (OSError, ValueError) as e:
+            results[i] = (None, e)
+    if images:
+        for i, predictions in zip(positions, classify(images)):
+            results[i] = (predictions, None)
+    return results
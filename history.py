@@ -0,0 +1,204 @@
+# history.py
+# -*- coding: utf-8 -*-
+"""
+Persistent prediction history for the FaunaLens application.
+
+Every classification is stored in a local SQLite database, one row per
+ranked label. Writes are queued and committed in batches by a background
+thread, so the prediction path never waits on disk I/O. Reads use indexes on
+label, score and timestamp plus keyset pagination, so a query such as "all
+images classified as red fox above 0.8" stays fast across hundreds of
+thousands of rows.
+"""
+
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from config import HISTORY_DB_PATH, HISTORY_PAGE_SIZE
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY,
+    image_path TEXT NOT NULL,
+    created REAL NOT NULL,
+    model TEXT,
+    rank INTEGER NOT NULL,
+    label TEXT NOT NULL,
+    score REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_predictions_label_score ON predictions(label, score);
+CREATE INDEX IF NOT EXISTS idx_predictions_score ON predictions(score);
+CREATE INDEX IF NOT EXISTS idx_predictions_created ON predictions(created);
+"""
+# Upper bound on rows committed in one transaction by the writer thread.
+_WRITE_BATCH = 500
+
+
+def normalize_label(label):
+    """Returns the canonical stored form of a label, e.g. 'Red fox' -> 'red_fox'."""
+    return label.strip().lower().replace(' ', '_')
+
+
+class HistoryRecord:
+    """One stored (image, label, score) row."""
+    __slots__ = ('id', 'image_path', 'created', 'model', 'rank', 'label', 'score')
+
+    def __init__(self, row):
+        self.id, self.image_path, self.created, self.model, self.rank, self.label, self.score = row
+
+    @property
+    def display_label(self):
+        return self.label.replace('_', ' ').capitalize()
+
+
+class HistoryStore:
+    """SQLite-backed prediction history with an asynchronous writer."""
+    def __init__(self, path=HISTORY_DB_PATH):
+        """
+        Opens (or creates) the history database and starts the writer thread.
+
+        Args:
+            path (str): Database file. Throwaway stores need a temporary file too:
+                        every thread opens its own connection, and each ':memory:'
+                        connection would see a separate, empty database.
+
+        Raises:
+            ValueError: If `path` is ':memory:'.
+        """
+        if path == ':memory:':
+            raise ValueError("HistoryStore needs a database file; ':memory:' is private to one connection.")
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        # WAL lets the UI read while the writer thread commits
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self):
+        """Returns this thread's read connection (sqlite3 connections are per-thread)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # --- Writing ---
+
+    def record(self, image_path, predictions, model=None):
+        """
+        Queues a prediction for storage and returns immediately.
+
+        Args:
+            image_path (str): The classified file.
+            predictions (list): (wnid, label, score) tuples as returned by ModelManager.predict.
+            model (str, optional): Name of the model that produced them.
+        """
+        created = time.time()
+        rows = [(image_path, created, model, rank, normalize_label(label), float(score))
+                for rank, (_, label, score) in enumerate(predictions)]
+        self._queue.put(rows)
+
+    def flush(self):
+        """Blocks until every queued prediction has been committed."""
+        self._queue.join()
+
+    def close(self):
+        """Commits outstanding writes and stops the writer thread."""
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout=10)
+
+    def _write_loop(self):
+        conn = self._connect()
+        stopping = False
+        while not stopping:
+            items = [self._queue.get()]
+            # Coalesce whatever else is already queued into the same transaction
+            while len(items) < _WRITE_BATCH:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            rows = []
+            for item in items:
+                if item is None:
+                    stopping = True
+                else:
+                    rows.extend(item)
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO predictions (image_path, created, model, rank, label, score) "
+                        "VALUES (?, ?, ?, ?, ?, ?)", rows)
+            except sqlite3.Error as e:
+                print(f"Could not write prediction history: {e}")
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+        conn.close()
+
+    # --- Reading ---
+
+    def query(self, label=None, min_score=None, top_only=False, since=None, before_id=None,
+              limit=HISTORY_PAGE_SIZE):
+        """
+        Returns matching records, newest first.
+
+        Args:
+            label (str, optional): Exact label, in any case and with spaces or underscores.
+            min_score (float, optional): Only rows with at least this score.
+            top_only (bool): Only each image's top-1 label.
+            since (float, optional): Only rows created at or after this UNIX time.
+            before_id (int, optional): Keyset cursor; pass the last id of the previous page.
+            limit (int): Maximum number of rows.
+
+        Returns:
+            list[HistoryRecord]
+        """
+        clauses, params = [], []
+        if label:
+            clauses.append("label = ?")
+            params.append(normalize_label(label))
+        if min_score is not None:
+            clauses.append("score >= ?")
+            params.append(min_score)
+        if top_only:
+            clauses.append("rank = 0")
+        if since is not None:
+            clauses.append("created >= ?")
+            params.append(since)
+        if before_id is not None:
+            clauses.append("id < ?")
+            params.append(before_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = (f"SELECT id, image_path, created, model, rank, label, score FROM predictions "
+               f"{where} ORDER BY id DESC LIMIT ?")
+        params.append(limit)
+        return [HistoryRecord(row) for row in self._reader().execute(sql, params)]
+
+    def count(self, label=None, min_score=None):
+        """Returns the number of rows matching a label and/or score filter."""
+        clauses, params = [], []
+        if label:
+            clauses.append("label = ?")
+            params.append(normalize_label(label))
+        if min_score is not None:
+            clauses.append("score >= ?")
+            params.append(min_score)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._reader().execute(f"SELECT COUNT(*) FROM predictions {where}", params).fetchone()[0]
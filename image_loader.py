@@ -0,0 +1,197 @@
+# image_loader.py
+# -*- coding: utf-8 -*-
+"""
+Guarded image loading for the FaunaLens application.
+
+Images come from users and from watched folders, so a single 100-megapixel
+TIFF or a decompression bomb must not be able to pin gigabytes of memory.
+Every file goes through the same steps:
+
+1. The file size is checked against IMAGE_MAX_FILE_MB before it is opened.
+2. The image is opened lazily and the dimensions reported by its header are
+   checked against IMAGE_MAX_PIXELS, so oversized images are rejected before
+   a single pixel is decoded.
+3. JPEGs are decoded at a reduced scale with `draft`, other formats are
+   reduced right after decoding, and only a copy no larger than the working
+   size is kept, with its EXIF orientation applied.
+
+Decoded pixels are charged to a process-wide memory budget while they are
+alive; a load that would exceed it is refused instead of swapping the machine.
+"""
+
+import os
+import threading
+import time
+import warnings
+import weakref
+
+from PIL import Image
+
+from config import IMAGE_MAX_PIXELS, IMAGE_MAX_FILE_MB, IMAGE_WORKING_SIZE, IMAGE_MEMORY_BUDGET_MB
+
+# Pillow warns about images above its own limit, which is far above IMAGE_MAX_PIXELS;
+# open_checked rejects those images anyway. A process-wide filter is used because
+# warnings.catch_warnings is not thread-safe.
+warnings.filterwarnings('ignore', category=Image.DecompressionBombWarning)
+
+# Modes that resize directly; anything else is converted to RGB first.
+_RESIZABLE_MODES = ('L', 'LA', 'RGB', 'RGBA', 'CMYK')
+_EXIF_ORIENTATION = 0x0112
+_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+# Bytes per pixel of Pillow's in-memory storage; RGB is padded to four bytes.
+_BYTES_PER_PIXEL = {'1': 1, 'L': 1, 'P': 1, 'I;16': 2, 'LA': 4, 'RGB': 4, 'RGBA': 4, 'CMYK': 4, 'I': 4, 'F': 4}
+
+
+class ImageRejectedError(ValueError):
+    """Raised when an image exceeds the configured limits or the memory budget."""
+
+
+def estimate_bytes(size, mode):
+    """Returns the approximate memory a decoded image of this size and mode occupies."""
+    width, height = size
+    return width * height * _BYTES_PER_PIXEL.get(mode, 4)
+
+
+class ImageMemoryBudget:
+    """Tracks the memory held by decoded images across all threads of the process."""
+    def __init__(self, budget_mb=IMAGE_MEMORY_BUDGET_MB):
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.used_bytes = 0
+        self.peak_bytes = 0
+        self._cond = threading.Condition()
+
+    def reserve(self, nbytes, wait=0.0):
+        """
+        Claims `nbytes` of the budget.
+
+        Args:
+            nbytes (int): The amount of memory about to be allocated.
+            wait (float): Seconds to wait for other images to be released
+                          before giving up.
+
+        Raises:
+            ImageRejectedError: If the memory does not become available in time.
+        """
+        if nbytes > self.budget_bytes:
+            raise ImageRejectedError(f"Image needs {nbytes / 2**20:.0f} MB, more than the whole "
+                                     f"{self.budget_bytes / 2**20:.0f} MB image budget.")
+        deadline = time.monotonic() + wait
+        with self._cond:
+            while self.used_bytes + nbytes > self.budget_bytes:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ImageRejectedError(f"Image memory budget exhausted "
+                                             f"({self.used_bytes / 2**20:.0f} MB in use).")
+                self._cond.wait(remaining)
+            self.used_bytes += nbytes
+            self.peak_bytes = max(self.peak_bytes, self.used_bytes)
+
+    def release(self, nbytes):
+        with self._cond:
+            self.used_bytes -= nbytes
+            self._cond.notify_all()
+
+    def track(self, image):
+        """Charges a decoded image to the budget until it is garbage collected."""
+        nbytes = estimate_bytes(image.size, image.mode)
+        self.reserve(nbytes)
+        weakref.finalize(image, self.release, nbytes)
+        return image
+
+
+_budget = ImageMemoryBudget()
+
+
+def memory_budget():
+    """Returns the process-wide image memory budget."""
+    return _budget
+
+
+def open_checked(path, max_pixels=IMAGE_MAX_PIXELS, max_file_mb=IMAGE_MAX_FILE_MB):
+    """
+    Opens an image lazily after checking its file size and header dimensions.
+    No pixel data is decoded; the caller should close the returned image.
+
+    Args:
+        path: A file path, or a seekable binary file object such as io.BytesIO.
+
+    Raises:
+        ImageRejectedError: If the file or the image it describes is too large.
+        OSError: If the file cannot be read or is not an image.
+    """
+    if hasattr(path, 'read'):
+        file_size = path.seek(0, os.SEEK_END)
+        path.seek(0)
+    else:
+        file_size = os.path.getsize(path)
+    if file_size > max_file_mb * 1024 * 1024:
+        raise ImageRejectedError(f"File is {file_size / 2**20:.0f} MB; the limit is {max_file_mb} MB.")
+    try:
+        image = Image.open(path)
+    except Image.DecompressionBombError as e:
+        # Pillow refuses headers far above our limit before we can check them
+        raise ImageRejectedError(str(e)) from e
+    width, height = image.size
+    if width * height > max_pixels:
+        image.close()
+        raise ImageRejectedError(f"Image is {width}x{height} ({width * height / 1e6:.0f} MP); "
+                                 f"the limit is {max_pixels / 1e6:.0f} MP.")
+    return image
+
+
+def decode(image, max_side=IMAGE_WORKING_SIZE, wait=0.0, budget=None):
+    """
+    Decodes the current frame of an opened image at a reduced size.
+
+    Args:
+        image (PIL.Image.Image): An image returned by `open_checked`, not yet loaded.
+        max_side (int): The longest side of the returned image.
+        wait (float): Seconds to wait for budget held by other images.
+        budget (ImageMemoryBudget, optional): Defaults to the process-wide budget.
+
+    Returns:
+        PIL.Image.Image: An upright RGB image no larger than max_side x max_side.
+    """
+    budget = budget or _budget
+    # For JPEGs this makes the decoder itself scale down by up to 8x
+    image.draft('RGB', (max_side, max_side))
+    transient = estimate_bytes(image.size, image.mode)
+    budget.reserve(transient, wait=wait)
+    try:
+        image.load()
+        source = image if image.mode in _RESIZABLE_MODES else image.convert('RGB')
+        width, height = source.size
+        scale = max_side / max(width, height)
+        if scale < 1:
+            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            working = source.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+        else:
+            working = source.copy()
+        if working.mode != 'RGB':
+            working = working.convert('RGB')
+        # Orientation is applied to the small image; the EXIF data comes from the source
+        orientation = image.getexif().get(_EXIF_ORIENTATION)
+        if orientation in _TRANSPOSE:
+            working = working.transpose(_TRANSPOSE[orientation])
+    finally:
+        budget.release(transient)
+    return budget.track(working)
+
+
+def load_image(path, max_side=IMAGE_WORKING_SIZE, wait=0.0):
+    """
+    Opens, checks and decodes an image file in one step.
+
+    Returns:
+        PIL.Image.Image: An upright RGB image no larger than max_side x max_side.
+    """
+    with open_checked(path) as image:
+        return decode(image, max_side=max_side, wait=wait)
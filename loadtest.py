@@ -0,0 +1,593 @@
+# loadtest.py
+# -*- coding: utf-8 -*-
+"""
+Trace-replay load testing for the FaunaLens controller.
+
+A workload trace is a JSON-lines file of timed user actions:
+
+    {"t": 0.0,  "action": "upload", "arg": "photos/fox.jpg"}
+    {"t": 1.25, "action": "search_labels", "arg": "fo"}
+    {"t": 2.5,  "action": "wiki", "arg": "Red fox"}
+    {"t": 4.0,  "action": "theme"}
+
+Traces are recorded from the real application (`python main.py --record-trace
+PATH`) or synthesized here. The replayer drives an AppController on a
+headless main loop with a stubbed view, a stand-in model and a local
+Wikipedia stub, so the controller's own scheduling, background runtime,
+history writer and image loading are exercised without a display, model
+weights or network. Several virtual users can replay the trace at once, at
+the recorded pace, faster, or at a fixed rate.
+
+The report gives throughput, per-action latency percentiles (measured from
+the moment an action was due, so main-loop queueing counts), the stall
+watchdog's UI latency, and CPU time, peak memory and thread count.
+"""
+
+import argparse
+import heapq
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from perf_profiles import peak_rss_mb
+
+ACTIONS = ('upload', 'search_labels', 'wiki', 'theme')
+DEFAULT_MIX = {'upload': 0.3, 'search_labels': 0.4, 'wiki': 0.2, 'theme': 0.1}
+
+_ADJECTIVES = ("red", "grey", "arctic", "spotted", "striped", "common", "giant", "lesser", "golden", "black",
+               "white", "sea", "desert", "mountain", "snow", "water", "tree", "rock", "marsh", "pygmy",
+               "crested", "great", "little", "long-tailed", "short-eared", "ring-tailed", "horned", "wild",
+               "northern", "southern")
+_ANIMALS = ("fox", "wolf", "bear", "otter", "owl", "eagle", "hawk", "heron", "lynx", "deer", "boar", "hare",
+            "squirrel", "marten", "badger", "seal", "lion", "tiger", "leopard", "monkey", "lemur", "gecko",
+            "iguana", "frog", "toad", "newt", "salmon", "trout", "shark", "ray", "crab", "lobster", "beetle",
+            "moth")
+
+
+def stand_in_labels():
+    """Returns about a thousand synthetic class names, like an ImageNet label set."""
+    return sorted(f"{a} {b}".capitalize() for a in _ADJECTIVES for b in _ANIMALS)
+
+
+# --- Traces ---
+
+def load_trace(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_trace(events, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        for event in events:
+            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+
+def synthesize_trace(duration, images, actions_per_second=2.0, mix=None, seed=0):
+    """
+    Generates a trace with Poisson-distributed actions.
+
+    Label searches are typed one keystroke at a time, so each becomes a burst
+    of `search_labels` events with growing prefixes about 120 ms apart.
+
+    Args:
+        duration (float): Length of the trace in seconds.
+        images (list): Image paths used by upload actions.
+        actions_per_second (float): Mean rate of user actions.
+        mix (dict, optional): action -> relative frequency. Defaults to DEFAULT_MIX.
+    """
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    names, weights = zip(*mix.items())
+    labels = stand_in_labels()
+    events, t = [], 0.0
+    while True:
+        t += rng.expovariate(actions_per_second)
+        if t >= duration:
+            break
+        action = rng.choices(names, weights)[0]
+        if action == 'upload':
+            events.append({'t': round(t, 3), 'action': 'upload', 'arg': rng.choice(images)})
+        elif action == 'search_labels':
+            word = rng.choice(labels).split()[-1]
+            for i in range(1, len(word) + 1):
+                events.append({'t': round(t + (i - 1) * 0.12, 3), 'action': 'search_labels', 'arg': word[:i]})
+        elif action == 'wiki':
+            events.append({'t': round(t, 3), 'action': 'wiki', 'arg': rng.choice(labels)})
+        else:
+            events.append({'t': round(t, 3), 'action': 'theme'})
+    events.sort(key=lambda e: e['t'])
+    return events
+
+
+def make_sample_images(directory, count=8, size=(1600, 1200), seed=0):
+    """Writes `count` noisy JPEGs to `directory` and returns their paths."""
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(count):
+        pixels = rng.integers(0, 256, (size[1] // 8, size[0] // 8, 3), dtype=np.uint8)
+        path = os.path.join(directory, f"sample_{i}.jpg")
+        Image.fromarray(pixels).resize(size, Image.Resampling.BILINEAR).save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+class TraceRecorder:
+    """Appends the actions a live AppController handles to a trace file."""
+    def __init__(self, path):
+        self._file = open(path, 'w', encoding='utf-8')
+        self._started = time.perf_counter()
+
+    def attach(self, controller):
+        """Wraps the controller's handlers; widgets built afterwards use the wrappers."""
+        for method, action in (('classify_file', 'upload'), ('search_labels', 'search_labels'),
+                               ('search_wikipedia', 'wiki'), ('toggle_theme', 'theme')):
+            setattr(controller, method, self._wrap(getattr(controller, method), action))
+        controller.view.refresh_ui()
+
+    def _wrap(self, handler, action):
+        def wrapper(*args):
+            event = {'t': round(time.perf_counter() - self._started, 3), 'action': action}
+            if args:
+                event['arg'] = args[0]
+            self._file.write(json.dumps(event, ensure_ascii=False) + "\n")
+            self._file.flush()
+            return handler(*args)
+        return wrapper
+
+    def close(self):
+        self._file.close()
+
+
+# --- Headless stand-ins ---
+
+class HeadlessRoot:
+    """A single-threaded stand-in for tk.Tk: a timer queue drained by run_until."""
+    def __init__(self):
+        self._timers = []
+        self._cancelled = set()
+        self._next_id = 0
+        self.destroyed = False
+
+    def after(self, ms, func=None, *args):
+        self._next_id += 1
+        heapq.heappush(self._timers, (time.perf_counter() + ms / 1000, self._next_id, func, args))
+        return self._next_id
+
+    def after_idle(self, func, *args):
+        return self.after(0, func, *args)
+
+    def after_cancel(self, timer_id):
+        self._cancelled.add(timer_id)
+
+    def run_until(self, done, timeout):
+        """Runs due callbacks until done() is true or timeout seconds pass. Returns done()."""
+        deadline = time.perf_counter() + timeout
+        while not done() and time.perf_counter() < deadline:
+            now = time.perf_counter()
+            if self._timers and self._timers[0][0] <= now:
+                _, timer_id, func, args = heapq.heappop(self._timers)
+                if timer_id in self._cancelled:
+                    self._cancelled.discard(timer_id)
+                elif func is not None:
+                    try:
+                        func(*args)
+                    except Exception as e:
+                        print(f"Error in scheduled callback: {e}")
+            else:
+                wait = self._timers[0][0] - now if self._timers else 0.005
+                time.sleep(min(max(wait, 0), 0.005))
+        return done()
+
+    def title(self, *args):
+        pass
+
+    def geometry(self, *args):
+        pass
+
+    def protocol(self, *args):
+        pass
+
+    def destroy(self):
+        self.destroyed = True
+
+
+class HeadlessVar:
+    """A stand-in for tk.StringVar."""
+    def __init__(self, value=''):
+        self._value = value
+        self._traces = []
+
+    def get(self):
+        return self._value
+
+    def set(self, value):
+        self._value = value
+        for callback in list(self._traces):
+            callback('', '', 'write')
+
+    def trace_add(self, mode, callback):
+        self._traces.append(callback)
+        return str(len(self._traces))
+
+
+def headless_theme_manager(theme_mode, text_size):
+    """Builds a ThemeManager whose fonts are plain tuples, since Tk fonts need a display."""
+    from theme_manager import ThemeManager
+    from config import TEXT_SIZE_MAP
+
+    class HeadlessThemeManager(ThemeManager):
+        def update_fonts(self):
+            sizes = TEXT_SIZE_MAP.get(self.text_size.get(), TEXT_SIZE_MAP['Medium'])
+            self.fonts = {key: ("Segoe UI", size) for key, size in sizes.items()}
+
+    return HeadlessThemeManager(theme_mode, text_size)
+
+
+class StubView:
+    """Records what the controller asks the view to do; optionally burns time per rebuild."""
+    render_seconds = 0.0
+    on_search_text = None  # Set by the harness to observe Wikipedia completions
+    on_popup = None
+    on_results = None      # ... and classification completions
+
+    def __init__(self, root, controller):
+        self.root = root
+        self.controller = controller
+        self.calls = {}
+        self.pages = {}
+        self._render_id = None
+
+    def _count(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def request_refresh(self, *page_names):
+        # Merged into one idle render, like MainView's scheduler
+        self._count('request_refresh')
+        if self._render_id is None:
+            self._render_id = self.root.after_idle(self.refresh_ui)
+
+    def refresh_ui(self):
+        self._render_id = None
+        self._count('refresh_ui')
+        if self.render_seconds:
+            time.sleep(self.render_seconds)
+
+    def render_summary(self):
+        return (f"UI renders: {self.calls.get('refresh_ui', 0)} performed for "
+                f"{self.calls.get('request_refresh', 0)} requests")
+
+    def show_frame(self, page_name):
+        self._count('show_frame')
+
+    def show_initial_view(self):
+        self._count('show_initial_view')
+
+    def show_loading_view(self):
+        self._count('show_loading_view')
+
+    def show_results_view(self, pil_image, predictions):
+        self._count('show_results_view')
+        if self.on_results:
+            self.on_results()
+
+    def show_gallery_view(self):
+        self._count('show_gallery_view')
+
+    def update_gallery(self):
+        self._count('update_gallery')
+
+    def show_label_matches(self, matches):
+        self._count('show_label_matches')
+
+    def show_popup(self, title, content):
+        self._count('show_popup')
+        if self.on_popup:
+            self.on_popup(title)
+
+    def set_search_result_text(self, text, color):
+        self._count('set_search_result_text')
+        if self.on_search_text:
+            self.on_search_text(text)
+
+
+class StandInModelManager:
+    """Mimics ModelManager with fixed-cost fake inference and synthetic labels."""
+    def __init__(self, inference_seconds=0.03, load_seconds=0.2, embedding_dim=64):
+        self.active_model_name = 'stand_in'
+        self.inference_seconds = inference_seconds
+        self.load_seconds = load_seconds
+        self.embedding_dim = embedding_dim
+        self.labels = []
+        self.cascade = None
+        self._all_labels = stand_in_labels()
+
+    def available_models(self):
+        return [self.active_model_name]
+
+    def load_model(self):
+        time.sleep(self.load_seconds)
+        self.labels = self._all_labels
+        return True
+
+    def set_active_model(self, name):
+        return self.load_model()
+
+    def get_labels(self):
+        return self.labels
+
+    def preprocess_image(self, pil_image, model_name=None):
+        return self.preprocess_batch([pil_image], model_name)
+
+    def preprocess_batch(self, pil_images, model_name=None):
+        # Same resize work as the real manager, so image handling costs stay realistic
+        return np.stack([np.asarray(img.convert('RGB').resize((224, 224)), dtype=np.float32) / 127.5 - 1
+                         for img in pil_images])
+
+    def predict_scores(self, processed_batch, model_name=None):
+        time.sleep(self.inference_seconds * max(1, len(processed_batch)) ** 0.5)
+        rng = np.random.default_rng(int(abs(processed_batch.sum())) % 2**32)
+        scores = rng.random((len(processed_batch), len(self._all_labels)), dtype=np.float32)
+        return scores / scores.sum(axis=1, keepdims=True)
+
+    def decode_scores(self, scores, top=3, model_name=None):
+        results = []
+        for row in scores:
+            best = np.argsort(row)[::-1][:top]
+            results.append([(str(i), self._all_labels[i].lower().replace(' ', '_'), float(row[i])) for i in best])
+        return results
+
+    def predict(self, processed_image):
+        return self.decode_scores(self.predict_scores(processed_image), top=3)[0]
+
+    def classify_images(self, pil_images, top=3, model_name=None):
+        return self.decode_scores(self.predict_scores(self.preprocess_batch(pil_images)), top=top)
+
+    def predict_with_embeddings(self, processed_batch, model_name=None):
+        scores = self.predict_scores(processed_batch)
+        return scores, self.extract_embeddings(processed_batch)
+
+    def extract_embeddings(self, processed_batch, model_name=None):
+        pooled = processed_batch.reshape(len(processed_batch), -1, 3).mean(axis=1)
+        return np.tile(pooled, (1, self.embedding_dim // 3 + 1))[:, :self.embedding_dim]
+
+    def predict_multicrop(self, pil_image, mode=None, pooling=None, model_name=None):
+        return self.predict(self.preprocess_image(pil_image))
+
+
+class StubWikiService:
+    """Answers every label of the stand-in model after a configurable delay."""
+    def __init__(self, latency_seconds=0.15, jitter=0.5, seed=0):
+        self.latency_seconds = latency_seconds
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self._known = {label.casefold() for label in stand_in_labels()}
+        self._lock = threading.Lock()
+
+    def fetch_summary(self, query, lang_code='en'):
+        with self._lock:
+            factor = 1 + self._rng.uniform(-self.jitter, self.jitter)
+        time.sleep(self.latency_seconds * factor)
+        if query.casefold() in self._known:
+            return query, f"{query} is an animal of the stand-in model ({lang_code})."
+        return query, None
+
+
+# --- Replay ---
+
+def _percentiles(values):
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+    return {'count': len(ordered), 'p50_ms': pick(50), 'p95_ms': pick(95), 'p99_ms': pick(99),
+            'max_ms': ordered[-1]}
+
+
+def replay(trace, users=1, speed=1.0, rate=None, inference_ms=30.0, wiki_ms=150.0, render_ms=0.0,
+           workdir=None, seed=0, budget=None):
+    """
+    Replays a trace against a headless AppController and returns a report dict.
+
+    Args:
+        trace (list): Events as produced by synthesize_trace or load_trace.
+        users (int): Virtual users replaying the trace concurrently, with staggered starts.
+        speed (float): Time compression of the trace (2.0 replays twice as fast).
+        rate (float, optional): If given, ignore recorded times and issue each
+                                user's events at this many per second.
+        inference_ms (float): Stand-in model latency per image.
+        wiki_ms (float): Mean Wikipedia stub latency.
+        render_ms (float): Simulated cost of one full UI rebuild.
+        workdir (str, optional): Where history and embeddings are written.
+        budget (dict, optional): Responsiveness budget for the stall watchdog.
+    """
+    from app import AppController
+    from embedding_index import EmbeddingIndex
+    from history import HistoryStore
+    import stall_watchdog
+
+    workdir = workdir or tempfile.mkdtemp(prefix='faunalens-load-')
+    root = HeadlessRoot()
+    StubView.render_seconds = render_ms / 1000
+    manager = StandInModelManager(inference_ms / 1000)
+    controller = AppController(root, view_factory=StubView, model_manager=manager,
+                               wiki_service=StubWikiService(wiki_ms / 1000, seed=seed),
+                               history=HistoryStore(os.path.join(workdir, 'history.sqlite3')),
+                               variable_factory=HeadlessVar, theme_manager_factory=headless_theme_manager)
+    # Keep the similar-image index inside the work directory
+    controller.embedding_index = EmbeddingIndex(os.path.join(workdir, 'embeddings'),
+                                                dim=manager.embedding_dim, model_name=manager.active_model_name)
+    if not root.run_until(lambda: controller.model_loaded, timeout=30):
+        raise RuntimeError("The stand-in model did not load.")
+
+    latencies = {action: [] for action in ACTIONS}
+    pending = {'upload': [], 'wiki': []}  # Due times of background actions without a shown result yet
+    superseded = {'upload': 0, 'wiki': 0}
+
+    def finished(action):
+        due_times = pending[action]
+        if due_times:
+            # Only the newest request is shown; the runtime drops older ones
+            latencies[action].append((time.perf_counter() - due_times[-1]) * 1000)
+            superseded[action] += len(due_times) - 1
+            due_times.clear()
+
+    # An upload ends with the results or an error popup; a lookup with a
+    # summary popup or a "page not found" message
+    controller.view.on_results = lambda: finished('upload')
+    controller.view.on_popup = lambda title: finished('upload' if title == "Error" else 'wiki')
+    not_found = controller.get_translation("page_not_found")
+    controller.view.on_search_text = lambda text: text == not_found and finished('wiki')
+
+    def dispatch(event, due):
+        action, arg = event['action'], event.get('arg')
+        if action == 'wiki':
+            controller.search_wikipedia(arg)
+            pending['wiki'].append(due)
+            return
+        if action == 'upload':
+            controller.classify_file(arg)
+            pending['upload'].append(due)
+            return
+        if action == 'search_labels':
+            controller.search_labels(arg)
+        elif action == 'theme':
+            controller.toggle_theme()
+        latencies[action].append((time.perf_counter() - due) * 1000)
+
+    rng = random.Random(seed)
+    span = max((e['t'] for e in trace), default=0.0) / speed
+    start = time.perf_counter() + 0.05
+    total = 0
+    for user in range(users):
+        offset = rng.uniform(0, min(span, 1.0)) if users > 1 else 0.0
+        for i, event in enumerate(trace):
+            if event['action'] not in ACTIONS:
+                continue
+            at = start + offset + (i / rate if rate else event['t'] / speed)
+            root.after(max(0.0, (at - time.perf_counter()) * 1000), dispatch, event, at)
+            total += 1
+
+    peak_threads = [threading.active_count()]
+
+    def sample_threads():
+        peak_threads[0] = max(peak_threads[0], threading.active_count())
+        root.after(100, sample_threads)
+
+    sample_threads()
+    cpu_before = time.process_time()
+    completed = lambda: (sum(len(v) for v in latencies.values()) + sum(superseded.values()) >= total
+                         and not any(pending.values()))
+    root.run_until(completed, timeout=span + 60)
+    wall = time.perf_counter() - start
+    cpu_after = time.process_time()
+
+    controller.history.flush()
+    watchdog = controller.watchdog or stall_watchdog.active()
+    done = sum(len(v) for v in latencies.values())
+    report = {
+        'events': total,
+        'completed': done,
+        'superseded_uploads': superseded['upload'],
+        'superseded_wiki': superseded['wiki'],
+        'unfinished': total - done - sum(superseded.values()),
+        'wall_seconds': wall,
+        'throughput_per_second': done / wall if wall > 0 else 0.0,
+        'latency': {action: _percentiles(values) for action, values in latencies.items()},
+        'ui': watchdog.report() if watchdog else None,
+        'budget_violations': watchdog.check_budget(budget) if watchdog else [],
+        'stale_results_dropped': controller.runtime.stale_dropped,
+        'cpu_seconds': cpu_after - cpu_before,
+        'peak_rss_mb': peak_rss_mb(),
+        'peak_threads': peak_threads[0],
+        'view_calls': dict(controller.view.calls),
+    }
+    controller.on_close()
+    return report
+
+
+def format_report(report):
+    """Renders a replay report as text."""
+    lines = [f"{report['completed']}/{report['events']} actions in {report['wall_seconds']:.1f}s "
+             f"({report['throughput_per_second']:.1f}/s); {report['superseded_uploads']} uploads and "
+             f"{report['superseded_wiki']} Wikipedia lookups superseded, {report['unfinished']} unfinished",
+             f"{'action':<15}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+    for action, stats in report['latency'].items():
+        if stats['count']:
+            lines.append(f"{action:<15}{stats['count']:>7}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}"
+                         f"{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}")
+    ui = report['ui']
+    if ui:
+        lines.append(f"UI loop latency p50 {ui['p50_ms']:.0f} ms, p95 {ui['p95_ms']:.0f} ms, "
+                     f"p99 {ui['p99_ms']:.0f} ms, max {ui['max_ms']:.0f} ms, {ui['stalls']} stalls")
+    rss = report['peak_rss_mb']
+    lines.append(f"CPU {report['cpu_seconds']:.1f}s, peak RSS {f'{rss:.0f} MB' if rss is not None else 'n/a'}, "
+                 f"peak threads {report['peak_threads']}, stale results dropped {report['stale_results_dropped']}")
+    if report['budget_violations']:
+        lines.append("Budget exceeded: " + "; ".join(report['budget_violations']))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """Command-line interface: synthesize a trace, or replay one and print the report."""
+    parser = argparse.ArgumentParser(description="Replay workload traces against a headless FaunaLens controller.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    synth = sub.add_parser('synthesize', help="Write a synthetic trace.")
+    synth.add_argument('output')
+    synth.add_argument('--duration', type=float, default=60.0)
+    synth.add_argument('--actions-per-second', type=float, default=2.0)
+    synth.add_argument('--images', nargs='*', help="Images for uploads (default: generated samples).")
+    synth.add_argument('--image-dir', default='loadtest_images', help="Where generated samples are written.")
+    synth.add_argument('--seed', type=int, default=0)
+
+    run = sub.add_parser('run', help="Replay a trace (or a synthetic one if none is given).")
+    run.add_argument('trace', nargs='?')
+    run.add_argument('--users', type=int, default=1)
+    run.add_argument('--speed', type=float, default=1.0)
+    run.add_argument('--rate', type=float, default=None, help="Events per second per user, ignoring trace times.")
+    run.add_argument('--duration', type=float, default=30.0, help="Length of the synthetic trace.")
+    run.add_argument('--inference-ms', type=float, default=30.0)
+    run.add_argument('--wiki-ms', type=float, default=150.0)
+    run.add_argument('--render-ms', type=float, default=0.0)
+    run.add_argument('--json', metavar='PATH', help="Also write the report as JSON.")
+    run.add_argument('--enforce-budget', action='store_true',
+                     help="Exit with status 1 if the UI responsiveness budget is exceeded.")
+    run.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.command == 'synthesize':
+        images = args.images
+        if not images:
+            os.makedirs(args.image_dir, exist_ok=True)
+            images = make_sample_images(args.image_dir, seed=args.seed)
+        trace = synthesize_trace(args.duration, images, args.actions_per_second, seed=args.seed)
+        save_trace(trace, args.output)
+        print(f"Wrote {len(trace)} events to {args.output}")
+        return 0
+
+    workdir = tempfile.mkdtemp(prefix='faunalens-load-')
+    try:
+        if args.trace:
+            trace = load_trace(args.trace)
+        else:
+            trace = synthesize_trace(args.duration, make_sample_images(workdir, seed=args.seed), seed=args.seed)
+        report = replay(trace, users=args.users, speed=args.speed, rate=args.rate, inference_ms=args.inference_ms,
+                        wiki_ms=args.wiki_ms, render_ms=args.render_ms, workdir=workdir, seed=args.seed)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(format_report(report))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 1 if args.enforce_budget and report['budget_violations'] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -6,16 +6,65 @@ Main entry point for the FaunaLens application.
 This script's sole responsibility is to initialize the Tkinter root window,
 create an instance of the main application controller (AppController),
 and start the main event loop.
+
+With --watch DIR it instead runs headless as a watch-folder daemon that
+classifies new images arriving in DIR.
+
+The CPU performance profile is applied first, before TensorFlow is imported,
+because its threading and oneDNN settings cannot be changed afterwards.
 """
-import tkinter as tk
-from app import AppController
+import argparse
+
+from config import PERF_PROFILE, PROFILING_ENABLED, PROFILE_SAMPLE_EVERY
+
+
+def parse_args(argv=None):
+    """Parses the command-line options."""
+    parser = argparse.ArgumentParser(description="FaunaLens animal identifier.")
+    parser.add_argument('--watch', metavar='DIR',
+                        help="Run headless and classify new images arriving in DIR.")
+    parser.add_argument('--manifest', metavar='PATH',
+                        help="Results manifest for --watch (default: inside DIR).")
+    parser.add_argument('--poll', action='store_true',
+                        help="Use directory polling instead of inotify for --watch.")
+    parser.add_argument('--perf-profile', metavar='NAME', default=PERF_PROFILE,
+                        help="CPU profile: latency, throughput, low_footprint, tuned or auto "
+                             "(default: %(default)s).")
+    parser.add_argument('--profile', action='store_true', default=PROFILING_ENABLED,
+                        help="Profile CPU time and memory of the hot paths and write a report on exit.")
+    parser.add_argument('--profile-every', metavar='N', type=int, default=PROFILE_SAMPLE_EVERY,
+                        help="With --profile, sample every Nth call of each profiled section.")
+    parser.add_argument('--record-trace', metavar='PATH',
+                        help="Record the user actions of this session as a load-test trace.")
+    return parser.parse_args(argv)
+
 
 if __name__ == "__main__":
+    args = parse_args()
+
+    if args.profile:
+        import profiling
+        profiling.enable(every=args.profile_every)
+
+    import perf_profiles
+    # The desktop app classifies one image at a time; the daemon works in batches
+    perf_profiles.apply_profile(args.perf_profile, fallback='throughput' if args.watch else 'latency')
+
+    if args.watch:
+        from watcher import run_daemon
+        raise SystemExit(run_daemon(args.watch, args.manifest, use_inotify=not args.poll))
+
+    import tkinter as tk
+    from app import AppController
+
     # Create the main Tkinter window
     root = tk.Tk()
-    
+
     # Create and start the application by instantiating the controller
     app = AppController(root)
-    
+    if args.record_trace:
+        from loadtest import TraceRecorder
+        TraceRecorder(args.record_trace).attach(app)
+
     # Enter the Tkinter main event loop to run the application
     root.mainloop()
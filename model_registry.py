@@ -0,0 +1,187 @@
+# model_registry.py
+# -*- coding: utf-8 -*-
+"""
+Registry of the classifiers available to the FaunaLens application.
+
+Every model described in `config.MODEL_SPECS` can be requested by name. A
+model is built the first time it is used and then kept resident until the
+configured RAM budget is exceeded or it sits idle for too long, at which point
+the least recently used models are evicted. Each loaded model carries its own
+input size, preprocessing function and labels, so callers can switch models
+per request without knowing anything about how a given network was trained.
+
+TensorFlow is imported when the first model is built, not when this module
+is imported, so tools that never run a model start quickly.
+"""
+
+import gc
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from config import (MODEL_SPECS, DEFAULT_MODEL_VERSION, MODEL_STORE_ALLOW_DOWNLOAD,
+                    MODEL_MEMORY_BUDGET_MB, MODEL_IDLE_EVICT_SECONDS)
+from model_store import ModelStore, ModelStoreError
+import perf_profiles
+
+
+class LoadedModel:
+    """A resident model together with everything needed to feed and decode it."""
+    def __init__(self, name, spec, model, class_index):
+        self.name = name
+        self.spec = spec
+        self.model = model
+        # (wnid, label) pairs in output order, or None to use Keras' ImageNet decoder.
+        self.class_index = class_index
+        self.input_size = spec.get('input_size', 224)
+        import tensorflow as tf
+        self.preprocess_input = getattr(tf.keras.applications, spec.get('preprocess', 'mobilenet_v2')).preprocess_input
+        self.size_bytes = sum(w.nbytes for w in model.get_weights())
+        self.last_used = time.monotonic()
+        self._labels = None
+        self._embedding_model = None
+        # Keras models are not safe to run from several threads at once; every
+        # forward pass through this model or its embedding view holds this lock
+        self.lock = threading.Lock()
+
+    def decode(self, predictions, top):
+        """Decodes a batch of raw scores into lists of (wnid, label, score) tuples."""
+        if self.class_index is None:
+            import tensorflow as tf
+            return tf.keras.applications.imagenet_utils.decode_predictions(predictions, top=top)
+        results = []
+        for row in predictions:
+            top_indices = np.argsort(row)[::-1][:top]
+            results.append([(*self.class_index[i], float(row[i])) for i in top_indices])
+        return results
+
+    @property
+    def embedding_model(self):
+        """
+        A model sharing this model's weights that outputs both the penultimate-layer
+        embedding and the class scores, so one forward pass yields both.
+        """
+        if self._embedding_model is None:
+            import tensorflow as tf
+            penultimate = self.model.layers[-2].output
+            self._embedding_model = tf.keras.Model(self.model.inputs, [penultimate, self.model.output])
+        return self._embedding_model
+
+    @property
+    def labels(self):
+        """All class names of this model, formatted for display and searching."""
+        if self._labels is None:
+            num_classes = self.model.output_shape[-1]
+            decoded = self.decode(np.zeros((1, num_classes), dtype=np.float32), top=num_classes)[0]
+            self._labels = sorted(label.replace('_', ' ').capitalize() for (_, label, _) in decoded)
+        return self._labels
+
+
+class ModelRegistry:
+    """
+    Loads models lazily by name and evicts idle ones under a memory budget.
+    All methods are thread-safe; loading happens under the registry lock.
+    """
+    def __init__(self, specs=None, store=None, budget_mb=MODEL_MEMORY_BUDGET_MB,
+                 idle_seconds=MODEL_IDLE_EVICT_SECONDS):
+        """
+        Initializes the registry.
+
+        Args:
+            specs (dict, optional): Model specifications. Defaults to config.MODEL_SPECS.
+            store (ModelStore, optional): Local artifact store. Defaults to the configured one.
+            budget_mb (float): RAM budget for resident model weights, in megabytes.
+            idle_seconds (float): Models unused for this long are evicted. 0 disables.
+        """
+        self.specs = specs if specs is not None else MODEL_SPECS
+        self.store = store or ModelStore()
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.idle_seconds = idle_seconds
+        self._resident = OrderedDict()  # name -> LoadedModel, least recently used first
+        self._lock = threading.RLock()
+
+    def names(self):
+        """Returns the names of all registered models."""
+        return list(self.specs.keys())
+
+    def is_loaded(self, name):
+        with self._lock:
+            return name in self._resident
+
+    def resident(self):
+        """Returns a snapshot of (name, size_bytes) for every resident model."""
+        with self._lock:
+            return [(entry.name, entry.size_bytes) for entry in self._resident.values()]
+
+    def get(self, name):
+        """
+        Returns the LoadedModel for `name`, building it on first use.
+
+        Raises:
+            KeyError: If no model with that name is registered.
+        """
+        if name not in self.specs:
+            raise KeyError(f"Unknown model '{name}'. Available: {', '.join(self.names())}")
+        with self._lock:
+            entry = self._resident.get(name)
+            if entry is None:
+                entry = self._load(name)
+                self._resident[name] = entry
+            else:
+                self._resident.move_to_end(name)
+            entry.last_used = time.monotonic()
+            self._enforce_limits(keep=name)
+            return entry
+
+    def evict(self, name):
+        """Drops a resident model so its memory can be reclaimed."""
+        with self._lock:
+            if self._resident.pop(name, None) is not None:
+                print(f"Evicted model '{name}'.")
+                gc.collect()
+
+    def _enforce_limits(self, keep):
+        """Evicts idle models, then least recently used ones until within budget."""
+        now = time.monotonic()
+        for name, entry in list(self._resident.items()):
+            if name != keep and self.idle_seconds and now - entry.last_used > self.idle_seconds:
+                self.evict(name)
+        while len(self._resident) > 1 and sum(e.size_bytes for e in self._resident.values()) > self.budget_bytes:
+            oldest = next(iter(self._resident))
+            if oldest == keep:
+                break
+            self.evict(oldest)
+
+    def _load(self, name):
+        """Builds a model from the local store, a model file, or a Keras download."""
+        spec = self.specs[name]
+        # Thread pools must be sized before the first model runs
+        perf_profiles.active_profile()
+        import tensorflow as tf
+        print(f"Loading model '{name}'...")
+        class_index = None
+
+        artifact = self.store.find(name, spec.get('version', DEFAULT_MODEL_VERSION))
+        if artifact is not None:
+            print(f"Using '{artifact.name}' v{artifact.version} from local store.")
+            builder, kwargs = artifact.architecture
+            model = getattr(tf.keras.applications, builder)(weights=None, **kwargs)
+            model.set_weights(artifact.load_weights())
+            class_index = artifact.load_class_index()
+        elif 'path' in spec:
+            # A custom model saved with model.save(); labels come from a text file, one per line.
+            model = tf.keras.models.load_model(spec['path'], compile=False)
+            if 'labels' in spec:
+                with open(spec['labels'], 'r', encoding='utf-8') as f:
+                    class_index = [(str(i), line.strip()) for i, line in enumerate(f) if line.strip()]
+        elif MODEL_STORE_ALLOW_DOWNLOAD:
+            model = getattr(tf.keras.applications, spec['builder'])(weights='imagenet', **spec.get('kwargs', {}))
+        else:
+            raise ModelStoreError(f"No local artifact for '{name}' in {self.store.root}")
+
+        entry = LoadedModel(name, spec, model, class_index)
+        # Perform a "warm-up" prediction to reduce latency on the first user call.
+        model.predict(np.zeros((1, entry.input_size, entry.input_size, 3)), verbose=0)
+        return entry
@@ -0,0 +1,289 @@
+# model_store.py
+# -*- coding: utf-8 -*-
+"""
+Local, versioned model artifact store for the FaunaLens application.
+
+Production machines are often air-gapped, so the classifier must be loadable
+without Keras reaching out to the network for weights or label files. This
+module keeps each model as a small directory of files:
+
+    <store>/<name>/<version>/manifest.json     - architecture, tensors, checksums
+    <store>/<name>/<version>/weights.bin       - raw, 64-byte aligned tensors
+    <store>/<name>/<version>/class_index.json  - ImageNet-style class index
+
+The weights blob is memory-mapped on load, so several FaunaLens processes on
+the same host share the same page-cache pages instead of each parsing an H5.
+
+Run `python model_store.py export` once on a machine with network access to
+create an artifact, then copy the store directory to the production machines.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from config import MODEL_STORE_DIR, DEFAULT_MODEL_NAME, MODEL_STORE_VERIFY_CHECKSUMS, MODEL_SPECS
+
+MANIFEST_FILE = "manifest.json"
+WEIGHTS_FILE = "weights.bin"
+CLASS_INDEX_FILE = "class_index.json"
+FORMAT_VERSION = 1
+_ALIGNMENT = 64
+
+
+class ModelStoreError(Exception):
+    """Raised when an artifact is missing, malformed, or fails verification."""
+
+
+def _sha256_of(path, chunk_size=1 << 20):
+    """Returns the hex SHA-256 digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelArtifact:
+    """A single versioned model on disk, described by its manifest."""
+    def __init__(self, path):
+        """
+        Reads the manifest of an artifact directory.
+
+        Args:
+            path (str): Directory containing manifest.json and its files.
+        """
+        self.path = path
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ModelStoreError(f"Cannot read manifest '{manifest_path}': {e}")
+
+        if self.manifest.get('format') != FORMAT_VERSION:
+            raise ModelStoreError(f"Unsupported artifact format in '{manifest_path}'.")
+        self._verified = False
+
+    @property
+    def name(self):
+        return self.manifest['name']
+
+    @property
+    def version(self):
+        return self.manifest['version']
+
+    @property
+    def architecture(self):
+        """Returns (builder_name, builder_kwargs) used to rebuild the network."""
+        arch = self.manifest['architecture']
+        return arch['builder'], dict(arch.get('kwargs', {}))
+
+    def verify(self):
+        """
+        Checks every file listed in the manifest against its SHA-256 checksum.
+        The result is cached, so repeated loads in one process hash only once.
+        """
+        if self._verified:
+            return
+        for filename, expected in self.manifest['files'].items():
+            file_path = os.path.join(self.path, filename)
+            if not os.path.exists(file_path):
+                raise ModelStoreError(f"Artifact file missing: {file_path}")
+            actual = _sha256_of(file_path)
+            if actual != expected:
+                raise ModelStoreError(f"Checksum mismatch for {file_path}: expected {expected}, got {actual}")
+        self._verified = True
+
+    def load_weights(self):
+        """
+        Returns the model weights as a list of read-only arrays.
+
+        The arrays are views into a single memory-mapped file, so no copy is
+        made here; the pages are shared with every other process mapping it.
+        """
+        if MODEL_STORE_VERIFY_CHECKSUMS:
+            self.verify()
+        blob = np.memmap(os.path.join(self.path, WEIGHTS_FILE), dtype=np.uint8, mode='r')
+        weights = []
+        for tensor in self.manifest['tensors']:
+            dtype = np.dtype(tensor['dtype'])
+            count = int(np.prod(tensor['shape'], dtype=np.int64))
+            start = tensor['offset']
+            end = start + count * dtype.itemsize
+            weights.append(blob[start:end].view(dtype).reshape(tensor['shape']))
+        return weights
+
+    def load_class_index(self):
+        """
+        Returns the class index as a list of (wnid, label) pairs ordered by
+        output position, or None if the artifact has no class index.
+        """
+        if CLASS_INDEX_FILE not in self.manifest['files']:
+            return None
+        with open(os.path.join(self.path, CLASS_INDEX_FILE), 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+        return [tuple(raw[str(i)]) for i in range(len(raw))]
+
+
+class ModelStore:
+    """Looks up and writes model artifacts under a single root directory."""
+    def __init__(self, root=MODEL_STORE_DIR):
+        """
+        Initializes the store.
+
+        Args:
+            root (str): Store directory. Defaults to the configured MODEL_STORE_DIR.
+        """
+        self.root = root
+
+    def versions(self, name):
+        """Returns the available versions of a model, oldest first."""
+        model_dir = os.path.join(self.root, name)
+        if not os.path.isdir(model_dir):
+            return []
+        found = [v for v in os.listdir(model_dir)
+                 if os.path.isfile(os.path.join(model_dir, v, MANIFEST_FILE))]
+        # Numeric versions sort numerically; anything else sorts after them by name.
+        return sorted(found, key=lambda v: (0, int(v), '') if v.isdigit() else (1, 0, v))
+
+    def find(self, name=DEFAULT_MODEL_NAME, version=None):
+        """
+        Returns the ModelArtifact for `name`, or None if it is not in the store.
+
+        Args:
+            name (str): Model name, e.g. 'mobilenet_v2'.
+            version (str, optional): A specific version. Defaults to the latest.
+        """
+        available = self.versions(name)
+        if not available:
+            return None
+        if version is None:
+            version = available[-1]
+        elif str(version) not in available:
+            return None
+        return ModelArtifact(os.path.join(self.root, name, str(version)))
+
+    def write(self, name, version, builder, builder_kwargs, weights, class_index=None):
+        """
+        Writes a new artifact. Files are written to a temporary directory and
+        renamed into place, so readers never observe a half-written version.
+
+        Args:
+            name (str): Model name.
+            version (str): Version identifier; must not already exist.
+            builder (str): Name of the tf.keras.applications constructor.
+            builder_kwargs (dict): Keyword arguments for the constructor.
+            weights (list): The arrays returned by `model.get_weights()`.
+            class_index (list, optional): (wnid, label) pairs in output order.
+
+        Returns:
+            ModelArtifact: The newly written artifact.
+        """
+        final_dir = os.path.join(self.root, name, str(version))
+        if os.path.exists(final_dir):
+            raise ModelStoreError(f"Artifact already exists: {final_dir}")
+        tmp_dir = f"{final_dir}.tmp-{os.getpid()}"
+        os.makedirs(tmp_dir)
+
+        tensors = []
+        offset = 0
+        with open(os.path.join(tmp_dir, WEIGHTS_FILE), 'wb') as f:
+            for array in weights:
+                array = np.ascontiguousarray(array)
+                padding = (-offset) % _ALIGNMENT
+                f.write(b'\0' * padding)
+                offset += padding
+                tensors.append({'shape': list(array.shape), 'dtype': array.dtype.str, 'offset': offset})
+                f.write(array.tobytes())
+                offset += array.nbytes
+
+        files = {WEIGHTS_FILE: None}
+        if class_index is not None:
+            with open(os.path.join(tmp_dir, CLASS_INDEX_FILE), 'w', encoding='utf-8') as f:
+                json.dump({str(i): list(entry) for i, entry in enumerate(class_index)}, f)
+            files[CLASS_INDEX_FILE] = None
+        for filename in files:
+            files[filename] = _sha256_of(os.path.join(tmp_dir, filename))
+
+        manifest = {
+            'format': FORMAT_VERSION,
+            'name': name,
+            'version': str(version),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'architecture': {'builder': builder, 'kwargs': builder_kwargs},
+            'tensors': tensors,
+            'files': files,
+        }
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+
+        os.replace(tmp_dir, final_dir)
+        return ModelArtifact(final_dir)
+
+
+def export_keras_application(store, name, version, builder, builder_kwargs):
+    """
+    Downloads a pre-trained Keras application and writes it into the store.
+    This is the only function in this module that needs network access.
+    """
+    import tensorflow as tf
+
+    model = getattr(tf.keras.applications, builder)(weights='imagenet', **builder_kwargs)
+    num_classes = model.output_shape[-1]
+    class_index = None
+    if num_classes == 1000:
+        # Decoding an identity matrix yields the (wnid, label) of every output in order.
+        decoded = tf.keras.applications.imagenet_utils.decode_predictions(np.eye(1000, dtype=np.float32), top=1)
+        class_index = [(row[0][0], row[0][1]) for row in decoded]
+    return store.write(name, version, builder, builder_kwargs, model.get_weights(), class_index)
+
+
+def main(argv=None):
+    """Command-line interface for managing the local model store."""
+    parser = argparse.ArgumentParser(description="Manage the FaunaLens local model store.")
+    parser.add_argument('--store', default=MODEL_STORE_DIR, help="Store directory.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    export = sub.add_parser('export', help="Download a Keras application into the store.")
+    export.add_argument('--name', default=DEFAULT_MODEL_NAME)
+    export.add_argument('--version', default='1')
+    export.add_argument('--builder', default=None, help="Keras application name. Defaults to the registry spec.")
+    export.add_argument('--kwargs', default=None, help="JSON keyword arguments for the builder.")
+
+    sub.add_parser('list', help="List the artifacts in the store.")
+
+    verify = sub.add_parser('verify', help="Verify artifact checksums.")
+    verify.add_argument('--name', default=DEFAULT_MODEL_NAME)
+    verify.add_argument('--version', default=None)
+
+    args = parser.parse_args(argv)
+    store = ModelStore(args.store)
+
+    if args.command == 'export':
+        spec = MODEL_SPECS.get(args.name, {})
+        builder = args.builder or spec.get('builder', 'MobileNetV2')
+        kwargs = json.loads(args.kwargs) if args.kwargs else spec.get('kwargs', {})
+        artifact = export_keras_application(store, args.name, args.version, builder, kwargs)
+        print(f"Exported {artifact.name} v{artifact.version} to {artifact.path}")
+    elif args.command == 'list':
+        names = sorted(os.listdir(store.root)) if os.path.isdir(store.root) else []
+        for name in names:
+            for version in store.versions(name):
+                print(f"{name}\t{version}")
+    elif args.command == 'verify':
+        artifact = store.find(args.name, args.version)
+        if artifact is None:
+            print(f"No artifact found for {args.name}.")
+            return 1
+        artifact.verify()
+        print(f"{artifact.name} v{artifact.version}: OK")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,115 @@
+# multicrop.py
+# -*- coding: utf-8 -*-
+"""
+Multi-crop and tiled inference helpers for the FaunaLens application.
+
+Squashing a large wildlife photo to the model's input size loses small
+animals. These helpers cut the image into several model-sized crops so that
+they can be classified in one batched forward pass and pooled afterwards.
+
+The full image is resampled exactly once, to the scale at which one crop
+equals the model input; every crop is then a slice of that single array, so
+the cost grows with the number of crops rather than with repeated resizing.
+"""
+
+import numpy as np
+from PIL import Image
+
+MODES = ('off', 'five_crop', 'tiles')
+POOLINGS = ('max', 'mean')
+
+
+def _positions(length, window, count):
+    """Returns `count` evenly spread start offsets covering [0, length) with `window`-wide crops."""
+    if count <= 1 or length <= window:
+        return np.array([max(0, (length - window) // 2)])
+    return np.round(np.linspace(0, length - window, count)).astype(np.intp)
+
+
+def _resize_once(pil_image, scale):
+    """Resamples the whole image a single time and returns it as an RGB uint8 array."""
+    if pil_image.mode != 'RGB':
+        pil_image = pil_image.convert('RGB')
+    width, height = pil_image.size
+    new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    # reducing_gap lets Pillow shrink by integer factors first, which is much faster for big photos
+    return np.asarray(pil_image.resize(new_size, Image.Resampling.BILINEAR, reducing_gap=3.0))
+
+
+def crop_batch(pil_image, input_size, mode='tiles', grid=2, overlap=0.25, crop_fraction=0.6, include_full=True):
+    """
+    Builds a (N, input_size, input_size, 3) float32 batch of crops from one image.
+
+    Args:
+        pil_image (PIL.Image): The source image.
+        input_size (int): The model's square input size.
+        mode (str): 'tiles' for an overlapping grid, 'five_crop' for the center and
+                    four corners, or 'off' for the whole image only.
+        grid (int): Tiles along the shorter image side in 'tiles' mode.
+        overlap (float): Fraction (0-0.9) by which neighbouring tiles overlap.
+        crop_fraction (float): Crop side relative to the shorter side in 'five_crop' mode.
+        include_full (bool): Also add the whole image squashed to the input size.
+
+    Returns:
+        numpy.ndarray: The batch, not yet passed through model preprocessing.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown crop mode '{mode}'. Expected one of {MODES}.")
+    width, height = pil_image.size
+    crops = []
+
+    if mode != 'off':
+        short_side = min(width, height)
+        if mode == 'tiles':
+            overlap = min(max(overlap, 0.0), 0.9)
+            crop_side = short_side / (grid - (grid - 1) * overlap)
+        else:
+            crop_side = short_side * crop_fraction
+        scaled = _resize_once(pil_image, input_size / crop_side)
+        scaled_h, scaled_w = scaled.shape[:2]
+        size = min(input_size, scaled_h, scaled_w)
+
+        if mode == 'tiles':
+            step = size * (1.0 - overlap)
+            ys = _positions(scaled_h, size, int(np.ceil((scaled_h - size) / step)) + 1)
+            xs = _positions(scaled_w, size, int(np.ceil((scaled_w - size) / step)) + 1)
+        else:
+            ys = np.array([0, 0, scaled_h - size, scaled_h - size, (scaled_h - size) // 2])
+            xs = np.array([0, scaled_w - size, 0, scaled_w - size, (scaled_w - size) // 2])
+
+        # Every possible window is a view; fancy indexing then copies just the chosen ones once.
+        windows = np.lib.stride_tricks.sliding_window_view(scaled, (size, size), axis=(0, 1))
+        if mode == 'tiles':
+            chosen = windows[ys[:, None], xs[None, :]].reshape(-1, 3, size, size)
+        else:
+            chosen = windows[ys, xs]
+        chosen = chosen.transpose(0, 2, 3, 1)
+        if size != input_size:
+            # Only images smaller than one crop get here; pad them up instead of resampling again
+            padded = np.zeros((len(chosen), input_size, input_size, 3), dtype=chosen.dtype)
+            padded[:, :size, :size] = chosen
+            chosen = padded
+        crops.append(chosen)
+
+    if include_full or mode == 'off':
+        full = pil_image.convert('RGB') if pil_image.mode != 'RGB' else pil_image
+        full = full.resize((input_size, input_size), Image.Resampling.BILINEAR, reducing_gap=3.0)
+        crops.append(np.asarray(full)[None])
+
+    return np.concatenate(crops).astype(np.float32)
+
+
+def pool_scores(scores, pooling='max'):
+    """
+    Aggregates a (N, num_classes) score array over its crops.
+
+    'max' keeps the strongest evidence for each class from any crop, which suits
+    small animals that appear in only one tile; 'mean' favours whole-scene agreement.
+    """
+    if pooling == 'max':
+        pooled = scores.max(axis=0)
+        # Renormalize so the pooled scores can still be read as probabilities
+        return pooled / pooled.sum()
+    if pooling == 'mean':
+        return scores.mean(axis=0)
+    raise ValueError(f"Unknown pooling '{pooling}'. Expected one of {POOLINGS}.")
@@ -0,0 +1,287 @@
+# perf_profiles.py
+# -*- coding: utf-8 -*-
+"""
+CPU performance profiles for the FaunaLens application.
+
+TensorFlow sizes its thread pools to every core of the machine by default,
+so several FaunaLens processes on a shared host fight over the same cores.
+A profile fixes the intra-op and inter-op thread counts, the batch size used
+for bulk work and whether oneDNN is enabled:
+
+    latency        - single images as fast as possible (the desktop app)
+    throughput     - large batches with few threads each (the watch-folder daemon)
+    low_footprint  - one thread and small batches for constrained hosts
+
+`python perf_profiles.py autotune` benchmarks candidate configurations on the
+local CPU, each in a fresh subprocess because TensorFlow's thread pools cannot
+be resized once created, and saves the best one as the "tuned" profile.
+
+Thread counts and oneDNN must be fixed before TensorFlow executes anything,
+so `apply_profile` is called at startup, before any model is loaded.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from config import PERF_PROFILES, PERF_PROFILE, PERF_TUNED_PROFILE_PATH, MODEL_SPECS, DEFAULT_MODEL_NAME
+
+_active = None
+
+
+def available_cpus():
+    """Returns the number of CPUs this process may run on (respecting affinity masks)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def peak_rss_mb():
+    """Returns the peak resident memory of this process in MB, or None where it cannot be read."""
+    try:
+        import resource  # POSIX only
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def load_tuned_profile(path=PERF_TUNED_PROFILE_PATH, objective=None):
+    """
+    Returns the profile saved by autotune, or None if there is none.
+
+    Args:
+        path (str): The file autotune wrote.
+        objective (str, optional): Only return the profile if it was tuned for this objective.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        if objective is not None and saved.get('objective') != objective:
+            return None
+        return saved['profile']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def resolve_profile(name=PERF_PROFILE, fallback='latency'):
+    """
+    Turns a profile name into concrete settings.
+
+    Args:
+        name (str): A name from config.PERF_PROFILES, 'tuned' for the autotune
+                    result, or 'auto' for the tuned profile if it was tuned for
+                    the `fallback` objective.
+        fallback (str): The kind of work the caller does; 'auto' uses this profile
+                        when nothing has been tuned for it.
+
+    Returns:
+        dict: 'name', 'intra_op_threads', 'inter_op_threads', 'batch_size' and 'onednn'.
+    """
+    if name in ('auto', 'tuned'):
+        # A profile tuned for batch throughput would make the desktop app sluggish, and vice versa
+        tuned = load_tuned_profile(objective=fallback if name == 'auto' else None)
+        if tuned is not None:
+            return dict(tuned, name='tuned')
+        if name == 'tuned':
+            print("No tuned profile found; run 'python perf_profiles.py autotune'.")
+        name = fallback
+    if name not in PERF_PROFILES:
+        raise KeyError(f"Unknown performance profile '{name}'. Available: {', '.join(PERF_PROFILES)}")
+    profile = dict(PERF_PROFILES[name], name=name)
+    # None means "every available core"
+    cpus = available_cpus()
+    for key in ('intra_op_threads', 'inter_op_threads'):
+        if profile[key] is None:
+            profile[key] = cpus
+        profile[key] = max(1, min(profile[key], cpus))
+    return profile
+
+
+def apply_profile(name=PERF_PROFILE, fallback='latency'):
+    """
+    Configures TensorFlow for a profile. Must run before TensorFlow executes
+    any operation; the environment settings only take effect if TensorFlow has
+    not been imported yet.
+
+    Returns:
+        dict: The applied profile.
+    """
+    global _active
+    profile = resolve_profile(name, fallback) if isinstance(name, str) else dict(name)
+    threads = str(profile['intra_op_threads'])
+    os.environ['TF_ENABLE_ONEDNN_OPTS'] = '1' if profile['onednn'] else '0'
+    os.environ.setdefault('OMP_NUM_THREADS', threads)
+    os.environ['TF_NUM_INTRAOP_THREADS'] = threads
+    os.environ['TF_NUM_INTEROP_THREADS'] = str(profile['inter_op_threads'])
+
+    import tensorflow as tf
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(profile['intra_op_threads'])
+        tf.config.threading.set_inter_op_parallelism_threads(profile['inter_op_threads'])
+    except RuntimeError as e:
+        # TensorFlow was already initialized; the existing pools stay in place
+        print(f"Could not apply performance profile '{profile.get('name', 'custom')}': {e}")
+    _active = profile
+    print(f"Performance profile '{profile.get('name', 'custom')}': {profile['intra_op_threads']} intra-op / "
+          f"{profile['inter_op_threads']} inter-op threads, batch {profile['batch_size']}, "
+          f"oneDNN {'on' if profile['onednn'] else 'off'}.")
+    return profile
+
+
+def active_profile(fallback='latency'):
+    """Returns the applied profile, applying the configured one on first use."""
+    if _active is None:
+        return apply_profile(PERF_PROFILE, fallback)
+    return _active
+
+
+# --- Benchmarking ---
+
+def benchmark(profile, model_name=DEFAULT_MODEL_NAME, stand_in=False, seconds=5.0):
+    """
+    Measures one configuration in the current process. Called in a subprocess
+    by `autotune`, since the thread pools are fixed for the process lifetime.
+
+    Args:
+        profile (dict): Concrete settings as returned by resolve_profile.
+        model_name (str): The model to benchmark.
+        stand_in (bool): Use the model's architecture with random weights instead
+                         of loading it, so tuning needs no artifacts or downloads.
+        seconds (float): Measurement time after warm-up.
+
+    Returns:
+        dict: images_per_second, batch_latency_ms (median) and peak_rss_mb.
+    """
+    apply_profile(profile)
+    import numpy as np
+
+    if stand_in:
+        import tensorflow as tf
+        spec = MODEL_SPECS[model_name]
+        model = getattr(tf.keras.applications, spec['builder'])(weights=None, **spec.get('kwargs', {}))
+        size = spec.get('input_size', 224)
+    else:
+        from model_registry import ModelRegistry
+        entry = ModelRegistry().get(model_name)
+        model, size = entry.model, entry.input_size
+
+    batch_size = profile['batch_size']
+    batch = np.random.default_rng(0).uniform(-1, 1, (batch_size, size, size, 3)).astype(np.float32)
+    model.predict(batch, batch_size=batch_size, verbose=0)  # Warm-up
+
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline or len(latencies) < 3:
+        started = time.perf_counter()
+        model.predict(batch, batch_size=batch_size, verbose=0)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return {
+        'images_per_second': batch_size * len(latencies) / sum(latencies),
+        'batch_latency_ms': latencies[len(latencies) // 2] * 1000,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def candidate_profiles(objective):
+    """Returns the configurations autotune tries for an objective."""
+    cpus = available_cpus()
+    threads = sorted({1, 2, 4, max(1, cpus // 2), cpus} & set(range(1, cpus + 1)))
+    batch_sizes = [1] if objective == 'latency' else [8, 16, 32]
+    candidates = []
+    for intra in threads:
+        for inter in (1, 2):
+            for batch_size in batch_sizes:
+                for onednn in (True, False):
+                    candidates.append({'intra_op_threads': intra, 'inter_op_threads': inter,
+                                       'batch_size': batch_size, 'onednn': onednn})
+    return candidates
+
+
+def _score(objective, result):
+    if objective == 'latency':
+        return -result['batch_latency_ms']
+    if objective == 'low_footprint' and result['peak_rss_mb']:
+        # Images per second per megabyte of resident memory
+        return result['images_per_second'] / result['peak_rss_mb']
+    return result['images_per_second']
+
+
+def autotune(objective='throughput', model_name=DEFAULT_MODEL_NAME, stand_in=False, seconds=5.0,
+             output=PERF_TUNED_PROFILE_PATH):
+    """
+    Benchmarks every candidate in its own subprocess and saves the best one.
+
+    Returns:
+        dict: The winning profile, or None if no candidate ran successfully.
+    """
+    best = None
+    for candidate in candidate_profiles(objective):
+        command = [sys.executable, os.path.abspath(__file__), 'bench', json.dumps(candidate),
+                   '--model', model_name, '--seconds', str(seconds)]
+        if stand_in:
+            command.append('--stand-in')
+        proc = subprocess.run(command, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"Candidate {candidate} failed:\n{proc.stderr.strip()[-500:]}")
+            continue
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        rss = result['peak_rss_mb']
+        print(f"{candidate} -> {result['images_per_second']:.1f} img/s, "
+              f"{result['batch_latency_ms']:.1f} ms/batch, " + (f"{rss:.0f} MB" if rss is not None else "RSS n/a"))
+        if best is None or _score(objective, result) > _score(objective, best[1]):
+            best = (candidate, result)
+
+    if best is None:
+        return None
+    candidate, result = best
+    with open(f"{output}.tmp", 'w', encoding='utf-8') as f:
+        json.dump({'objective': objective, 'model': model_name, 'stand_in': stand_in,
+                   'cpus': available_cpus(), 'profile': candidate, 'result': result}, f, indent=2)
+    os.replace(f"{output}.tmp", output)
+    print(f"Best for {objective}: {candidate} -> saved to {output}")
+    return candidate
+
+
+def main(argv=None):
+    """Command-line interface: show profiles, benchmark one, or autotune."""
+    parser = argparse.ArgumentParser(description="FaunaLens CPU performance profiles.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('show', help="Print every profile as resolved on this machine.")
+
+    tune = sub.add_parser('autotune', help="Benchmark candidates and save the best as the tuned profile.")
+    tune.add_argument('--objective', choices=('latency', 'throughput', 'low_footprint'), default='throughput')
+    tune.add_argument('--output', default=PERF_TUNED_PROFILE_PATH)
+
+    bench = sub.add_parser('bench', help="Benchmark one profile (a name or a JSON object) in this process.")
+    bench.add_argument('profile')
+
+    for command in (tune, bench):
+        command.add_argument('--model', default=DEFAULT_MODEL_NAME)
+        command.add_argument('--stand-in', action='store_true',
+                             help="Use random weights instead of loading the model.")
+        command.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    if args.command == 'show':
+        for name in list(PERF_PROFILES) + ['tuned']:
+            if name == 'tuned' and load_tuned_profile() is None:
+                continue
+            print(f"{name}: {resolve_profile(name)}")
+    elif args.command == 'autotune':
+        if autotune(args.objective, args.model, args.stand_in, args.seconds, args.output) is None:
+            return 1
+    else:
+        profile = json.loads(args.profile) if args.profile.startswith('{') else resolve_profile(args.profile)
+        print(json.dumps(benchmark(profile, args.model, args.stand_in, args.seconds)))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
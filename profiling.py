@@ -0,0 +1,202 @@
+# profiling.py
+# -*- coding: utf-8 -*-
+"""
+Opt-in CPU and memory profiling for the FaunaLens application.
+
+When a user reports that the app is slow, run it with `--profile` (or set
+FAUNALENS_PROFILE=1) and send back the session directory it prints on exit.
+The hot paths (prediction, UI rebuilds, Wikipedia lookups) are marked as named
+sections; while profiling is on, sampled calls of each section run under
+cProfile and tracemalloc, and on exit the session directory receives:
+
+    <section>.prof   - cProfile statistics, readable with pstats or snakeviz
+    summary.txt      - per-section call counts, time and peak memory, the top-N
+                       functions of each section and the top-N allocation sites
+
+When profiling is off, a section costs one global lookup and a return.
+"""
+
+import atexit
+import contextlib
+import cProfile
+import functools
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+from config import PROFILE_DIR, PROFILE_SAMPLE_EVERY, PROFILE_SAMPLE_INTERVAL, PROFILE_TOP_N, PROFILE_TRACE_FRAMES
+
+_profiler = None
+_NULL_SECTION = contextlib.nullcontext()
+
+
+class _SectionStats:
+    """Accumulated measurements of one named section."""
+    def __init__(self):
+        self.calls = 0
+        self.sampled = 0
+        self.seconds = 0.0
+        self.peak_bytes = 0
+        self.last_sample = float('-inf')
+        self.stats = None  # pstats.Stats merged over all sampled calls
+
+
+class Profiler:
+    """Collects sampled cProfile and tracemalloc data for one session."""
+    def __init__(self, directory=PROFILE_DIR, every=PROFILE_SAMPLE_EVERY, interval=PROFILE_SAMPLE_INTERVAL,
+                 top_n=PROFILE_TOP_N, trace_frames=PROFILE_TRACE_FRAMES):
+        """
+        Args:
+            directory (str): Parent directory of the per-session output directories.
+            every (int): Profile every Nth call of a section.
+            interval (float): Minimum seconds between two sampled calls of a section.
+            top_n (int): Functions and allocation sites listed in the summary.
+            trace_frames (int): Stack depth recorded by tracemalloc (0 disables memory tracing).
+        """
+        session = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self.directory = os.path.join(directory, session)
+        self.every = max(1, every)
+        self.interval = interval
+        self.top_n = top_n
+        self.trace_frames = trace_frames
+        self.sections = {}
+        self.skipped_busy = 0
+        # Only one cProfile instance may be active at a time, so sampled sections
+        # never overlap; a call arriving while another is profiled runs unprofiled.
+        self._active = threading.Lock()
+        self._lock = threading.Lock()
+        self._closed = False
+        if trace_frames and not tracemalloc.is_tracing():
+            tracemalloc.start(trace_frames)
+
+    def _should_sample(self, name):
+        with self._lock:
+            section = self.sections.setdefault(name, _SectionStats())
+            section.calls += 1
+            now = time.monotonic()
+            if self._closed or (section.calls - 1) % self.every or now - section.last_sample < self.interval:
+                return None
+            section.last_sample = now
+            return section
+
+    @contextlib.contextmanager
+    def section(self, name):
+        """Profiles the enclosed block if this call of `name` is sampled."""
+        section = self._should_sample(name)
+        if section is None:
+            yield
+            return
+        if not self._active.acquire(blocking=False):
+            self.skipped_busy += 1
+            yield
+            return
+        profile = cProfile.Profile()
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            elapsed = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1] - baseline if tracing else 0
+            self._active.release()
+            with self._lock:
+                section.sampled += 1
+                section.seconds += elapsed
+                section.peak_bytes = max(section.peak_bytes, peak)
+                if section.stats is None:
+                    section.stats = pstats.Stats(profile)
+                else:
+                    section.stats.add(profile)
+
+    def write(self):
+        """Writes the .prof files and summary.txt; returns the session directory."""
+        os.makedirs(self.directory, exist_ok=True)
+        out = io.StringIO()
+        out.write(f"FaunaLens profiling session {os.path.basename(self.directory)}\n")
+        out.write(f"Sampling: every {self.every} call(s), at most one per {self.interval:g}s per section; "
+                  f"{self.skipped_busy} call(s) skipped while another section was profiled.\n\n")
+        with self._lock:
+            sections = sorted(self.sections.items())
+        for name, section in sections:
+            mean_ms = section.seconds / section.sampled * 1000 if section.sampled else 0.0
+            out.write(f"[{name}] {section.calls} calls, {section.sampled} sampled, "
+                      f"mean {mean_ms:.1f} ms, peak +{section.peak_bytes / 2**20:.1f} MB\n")
+            if section.stats is None:
+                continue
+            section.stats.dump_stats(os.path.join(self.directory, f"{name}.prof"))
+            section.stats.stream = out
+            section.stats.sort_stats('cumulative').print_stats(self.top_n)
+
+        if tracemalloc.is_tracing():
+            out.write(f"\nTop {self.top_n} allocation sites still alive:\n")
+            for stat in tracemalloc.take_snapshot().statistics('lineno')[:self.top_n]:
+                out.write(f"  {stat}\n")
+
+        with open(os.path.join(self.directory, 'summary.txt'), 'w', encoding='utf-8') as f:
+            f.write(out.getvalue())
+        return self.directory
+
+    def close(self):
+        """Writes the session files once and stops memory tracing."""
+        if self._closed:
+            return self.directory
+        self._closed = True
+        directory = self.write()
+        if self.trace_frames:
+            tracemalloc.stop()
+        print(f"Profiling session written to {directory}")
+        return directory
+
+
+def enable(**options):
+    """
+    Starts a profiling session; its files are written at interpreter exit.
+    Keyword arguments are passed to Profiler.
+    """
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler(**options)
+        atexit.register(_profiler.close)
+        print(f"Profiling enabled; results will be written to {_profiler.directory}")
+    return _profiler
+
+
+def disable():
+    """Ends the current session, writing its files. Returns the session directory or None."""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler.close() if profiler is not None else None
+
+
+def is_enabled():
+    return _profiler is not None
+
+
+def section(name):
+    """Returns a context manager that profiles the enclosed block as section `name`."""
+    profiler = _profiler
+    if profiler is None:
+        return _NULL_SECTION
+    return profiler.section(name)
+
+
+def profiled(name):
+    """Decorator that runs every call of the function as section `name`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = _profiler
+            if profiler is None:
+                return func(*args, **kwargs)
+            with profiler.section(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,160 @@
+# runtime.py
+# -*- coding: utf-8 -*-
+"""
+Background asyncio runtime for the FaunaLens application.
+
+All of the controller's background work runs on one long-lived asyncio event
+loop in a daemon thread, instead of a new thread per click. Results are
+handed back to Tk through a queue that the main thread drains with
+`root.after`, because Tk widgets may only be touched from the main thread.
+
+Every task is submitted under a key (e.g. "wiki_search"). Submitting a new task
+under the same key bumps that key's generation and cancels the previous
+task, and any result that still arrives from an older generation is dropped,
+so a slow, stale Wikipedia lookup can never overwrite a newer one.
+Per-category semaphores bound how many tasks of each kind run at once; a
+cancelled task keeps its slot until its worker thread has actually returned.
+"""
+
+import asyncio
+import functools
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import RUNTIME_POLL_MS, RUNTIME_CONCURRENCY, RUNTIME_MAX_WORKERS
+
+
+class BackgroundRuntime:
+    """One asyncio loop on a background thread, bridged to the Tk main loop."""
+    def __init__(self, root, poll_ms=RUNTIME_POLL_MS, limits=None, max_workers=RUNTIME_MAX_WORKERS):
+        """
+        Starts the event loop thread and the Tk polling callback.
+
+        Args:
+            root: The Tk root (anything with `after`) that callbacks are delivered on.
+            poll_ms (int): How often the main thread checks for finished tasks.
+            limits (dict, optional): category -> maximum concurrent tasks.
+            max_workers (int): Threads available for blocking (non-async) functions.
+        """
+        self.root = root
+        self.poll_ms = poll_ms
+        self.limits = dict(limits if limits is not None else RUNTIME_CONCURRENCY)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='faunalens-worker')
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name='faunalens-runtime', daemon=True)
+        self._thread.start()
+
+        self._results = queue.SimpleQueue()
+        self._generations = {}  # key -> latest generation id (main thread only)
+        self._futures = {}      # key -> concurrent.futures.Future of the latest task
+        self._semaphores = {}   # category -> asyncio.Semaphore (loop thread only)
+        self.stale_dropped = 0
+        self._closed = False
+        self._poll_id = self.root.after(self.poll_ms, self._poll)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    # --- Submitting work (main thread) ---
+
+    def submit(self, key, func, *args, on_done=None, on_error=None, category='default'):
+        """
+        Runs `func(*args)` in the background and delivers its result on the Tk thread.
+
+        Args:
+            key (str): Identifies the logical operation; a newer submission under
+                       the same key supersedes and cancels the older one.
+            func: A coroutine function, or a blocking function run in the worker pool.
+            on_done (callable, optional): Called with the result on the Tk thread.
+            on_error (callable, optional): Called with the exception on the Tk thread.
+            category (str): Concurrency-limit category (see RUNTIME_CONCURRENCY).
+
+        Returns:
+            int: The generation id of this submission.
+        """
+        generation = self._generations.get(key, 0) + 1
+        self._generations[key] = generation
+        previous = self._futures.get(key)
+        if previous is not None:
+            # Blocking functions already running in the pool cannot be interrupted;
+            # their result is discarded by the generation check instead.
+            previous.cancel()
+        coro = self._run(key, generation, category, func, args, on_done, on_error)
+        self._futures[key] = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        return generation
+
+    def cancel(self, key):
+        """Cancels the latest task under `key` and ignores any result it still produces."""
+        self._generations[key] = self._generations.get(key, 0) + 1
+        future = self._futures.pop(key, None)
+        if future is not None:
+            future.cancel()
+
+    def is_current(self, key, generation):
+        return self._generations.get(key) == generation
+
+    # --- Loop thread ---
+
+    def _semaphore(self, category):
+        semaphore = self._semaphores.get(category)
+        if semaphore is None:
+            limit = self.limits.get(category, self.limits.get('default', 4))
+            semaphore = self._semaphores[category] = asyncio.Semaphore(limit)
+        return semaphore
+
+    async def _run(self, key, generation, category, func, args, on_done, on_error):
+        try:
+            async with self._semaphore(category):
+                if asyncio.iscoroutinefunction(func):
+                    result = await func(*args)
+                else:
+                    future = self.loop.run_in_executor(self.executor, functools.partial(func, *args))
+                    try:
+                        result = await asyncio.shield(future)
+                    except asyncio.CancelledError:
+                        # The executor thread cannot be interrupted: keep the category's
+                        # slot until it really finishes, so a resubmitted task never
+                        # runs alongside the one it replaced.
+                        await asyncio.wait([future])
+                        raise
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            self._results.put((key, generation, on_error, e, True))
+        else:
+            self._results.put((key, generation, on_done, result, False))
+
+    # --- Delivering results (main thread) ---
+
+    def _poll(self):
+        """Delivers finished results to their callbacks, dropping stale generations."""
+        while True:
+            try:
+                key, generation, callback, value, failed = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if not self.is_current(key, generation):
+                self.stale_dropped += 1
+                continue
+            # The latest task under this key has finished; forget its future
+            self._futures.pop(key, None)
+            if failed and callback is None:
+                print(f"Background task '{key}' failed: {value}")
+            elif callback is not None:
+                try:
+                    callback(value)
+                except Exception as e:
+                    print(f"Error in callback for '{key}': {e}")
+        if not self._closed:
+            self._poll_id = self.root.after(self.poll_ms, self._poll)
+
+    def shutdown(self):
+        """Cancels outstanding tasks and stops the loop thread."""
+        self._closed = True
+        for future in self._futures.values():
+            future.cancel()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=2)
+        self.executor.shutdown(wait=False, cancel_futures=True)
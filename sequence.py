@@ -0,0 +1,223 @@
+# sequence.py
+# -*- coding: utf-8 -*-
+"""
+Frame-sequence classification for the FaunaLens application.
+
+Camera traps deliver bursts of frames as animated GIF/APNG/WebP files,
+multi-page TIFFs or directories of numbered stills. This module streams the
+frames of such a sequence one at a time, skips frames that are nearly
+identical to the last analysed one, runs the remaining frames through the
+ModelManager in batches and smooths the per-frame scores over time into
+labels for the whole sequence.
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+import image_loader
+from config import (SEQUENCE_DIFF_THRESHOLD, SEQUENCE_BATCH_SIZE, SEQUENCE_SMOOTHING, SEQUENCE_MAX_FRAMES,
+                    IMAGE_MAX_PIXELS, IMAGE_WORKING_SIZE)
+
+FRAME_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+# Side length of the greyscale thumbnail used to compare consecutive frames.
+_SIGNATURE_SIZE = 32
+
+
+def is_sequence(pil_image):
+    """Returns True if an opened image holds more than one frame."""
+    return getattr(pil_image, 'n_frames', 1) > 1
+
+
+def iter_frames(source, max_side=IMAGE_WORKING_SIZE, max_frames=SEQUENCE_MAX_FRAMES):
+    """
+    Lazily yields the frames of a sequence as RGB PIL Images.
+
+    Every frame goes through image_loader: its size is checked, and it is
+    decoded at a reduced size against the process-wide memory budget.
+
+    Args:
+        source: A directory of still images (read in sorted filename order),
+                a path to a multi-frame image, or an already opened PIL Image.
+        max_side (int): The longest side of the yielded frames.
+        max_frames (int): Frames after this many are ignored.
+    """
+    if isinstance(source, str) and os.path.isdir(source):
+        names = sorted(n for n in os.listdir(source) if n.lower().endswith(FRAME_EXTENSIONS))
+        if len(names) > max_frames:
+            print(f"Sequence has {len(names)} frames; only the first {max_frames} are classified.")
+        for name in names[:max_frames]:
+            yield image_loader.load_image(os.path.join(source, name), max_side=max_side)
+        return
+
+    img = image_loader.open_checked(source) if isinstance(source, str) else source
+    try:
+        for index, frame in enumerate(ImageSequence.Iterator(img)):
+            if index >= max_frames:
+                print(f"Sequence has more than {max_frames} frames; the rest are ignored.")
+                break
+            # Pages of a multi-page TIFF can each have their own size
+            width, height = frame.size
+            if width * height > IMAGE_MAX_PIXELS:
+                raise image_loader.ImageRejectedError(f"Frame {index} is {width}x{height}; "
+                                                      f"the limit is {IMAGE_MAX_PIXELS / 1e6:.0f} MP.")
+            # ImageSequence reuses one object; decode returns a fresh, reduced copy
+            yield image_loader.decode(frame, max_side=max_side)
+    finally:
+        if isinstance(source, str):
+            img.close()
+        else:
+            img.seek(0)
+
+
+def frame_signature(frame):
+    """Returns a small normalized greyscale array used as a cheap frame fingerprint."""
+    thumb = frame.convert('L').resize((_SIGNATURE_SIZE, _SIGNATURE_SIZE), Image.Resampling.BILINEAR)
+    return np.asarray(thumb, dtype=np.float32) / 255.0
+
+
+class SequenceResult:
+    """The outcome of classifying one frame sequence."""
+    def __init__(self, predictions, segments, frame_labels, total_frames, analysed_frames, elapsed):
+        # Top-3 (wnid, label, score) for the whole sequence, same shape as ModelManager.predict
+        self.predictions = predictions
+        # (first_frame, last_frame, label, mean_score) runs of a stable smoothed top-1 label
+        self.segments = segments
+        # Smoothed top-1 label of every frame, including skipped ones
+        self.frame_labels = frame_labels
+        self.total_frames = total_frames
+        self.analysed_frames = analysed_frames
+        self.elapsed = elapsed
+
+    @property
+    def frames_per_second(self):
+        return self.total_frames / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def skipped_frames(self):
+        return self.total_frames - self.analysed_frames
+
+    def summary(self):
+        """Returns a short human-readable report of the run."""
+        lines = [f"{self.total_frames} frames, {self.analysed_frames} analysed, "
+                 f"{self.skipped_frames} skipped, {self.frames_per_second:.1f} frames/sec"]
+        for start, end, label, score in self.segments:
+            lines.append(f"  frames {start}-{end}: {label} ({score:.1%})")
+        return "\n".join(lines)
+
+
+class SequenceClassifier:
+    """Classifies frame sequences through a ModelManager with frame skipping."""
+    def __init__(self, model_manager, diff_threshold=SEQUENCE_DIFF_THRESHOLD,
+                 batch_size=SEQUENCE_BATCH_SIZE, smoothing=SEQUENCE_SMOOTHING, model_name=None):
+        """
+        Initializes the classifier.
+
+        Args:
+            model_manager (ModelManager): A manager whose model is already loaded.
+            diff_threshold (float): Mean absolute greyscale difference (0-1) below
+                                    which a frame is treated as a repeat of the last analysed one.
+            batch_size (int): Number of analysed frames per forward pass.
+            smoothing (float): Weight of the newest frame in the exponential moving
+                               average of scores (1.0 disables smoothing).
+            model_name (str, optional): Registry model to use. Defaults to the active one.
+        """
+        self.model_manager = model_manager
+        self.diff_threshold = diff_threshold
+        self.batch_size = max(1, batch_size)
+        self.smoothing = smoothing
+        self.model_name = model_name
+
+    def classify(self, source):
+        """
+        Classifies every frame of `source` (see iter_frames) and aggregates them.
+
+        Returns:
+            SequenceResult, or None if the sequence has no frames.
+        """
+        start_time = time.perf_counter()
+        kept_scores = []     # score rows of analysed frames, in order
+        frame_to_kept = []   # for every frame, the index of the analysed frame it maps to
+        pending = []
+        last_signature = None
+
+        for frame in iter_frames(source):
+            signature = frame_signature(frame)
+            if last_signature is not None and np.abs(signature - last_signature).mean() < self.diff_threshold:
+                frame_to_kept.append(len(kept_scores) + len(pending) - 1)
+                continue
+            last_signature = signature
+            frame_to_kept.append(len(kept_scores) + len(pending))
+            pending.append(frame)
+            if len(pending) >= self.batch_size:
+                kept_scores.extend(self._score(pending))
+                pending = []
+        if pending:
+            kept_scores.extend(self._score(pending))
+
+        if not frame_to_kept:
+            return None
+        frame_scores = self._smooth(np.asarray(kept_scores)[frame_to_kept])
+        elapsed = time.perf_counter() - start_time
+
+        top1 = self.model_manager.decode_scores(frame_scores, top=1, model_name=self.model_name)
+        frame_labels = [row[0][1] for row in top1]
+        predictions = self.model_manager.decode_scores(frame_scores.mean(axis=0), top=3, model_name=self.model_name)[0]
+        segments = self._segments(frame_labels, [row[0][2] for row in top1])
+        return SequenceResult(predictions, segments, frame_labels, len(frame_to_kept), len(kept_scores), elapsed)
+
+    def _score(self, frames):
+        batch = self.model_manager.preprocess_batch(frames, self.model_name)
+        return self.model_manager.predict_scores(batch, self.model_name)
+
+    def _smooth(self, scores):
+        """Applies an exponential moving average along the time axis."""
+        if self.smoothing >= 1.0:
+            return scores
+        smoothed = np.empty_like(scores)
+        smoothed[0] = scores[0]
+        for t in range(1, len(scores)):
+            smoothed[t] = self.smoothing * scores[t] + (1.0 - self.smoothing) * smoothed[t - 1]
+        return smoothed
+
+    @staticmethod
+    def _segments(labels, scores):
+        """Groups consecutive frames with the same label into (start, end, label, mean_score)."""
+        segments = []
+        start = 0
+        for i in range(1, len(labels) + 1):
+            if i == len(labels) or labels[i] != labels[start]:
+                segments.append((start, i - 1, labels[start], float(np.mean(scores[start:i]))))
+                start = i
+        return segments
+
+
+def main(argv=None):
+    """Command-line entry point: classifies each given sequence and prints a report."""
+    from core import ModelManager
+
+    parser = argparse.ArgumentParser(description="Classify animated images or frame directories.")
+    parser.add_argument('sources', nargs='+', help="Multi-frame image files or directories of frames.")
+    parser.add_argument('--threshold', type=float, default=SEQUENCE_DIFF_THRESHOLD)
+    parser.add_argument('--batch-size', type=int, default=SEQUENCE_BATCH_SIZE)
+    parser.add_argument('--model', default=None)
+    args = parser.parse_args(argv)
+
+    manager = ModelManager()
+    if args.model:
+        manager.active_model_name = args.model
+    if not manager.load_model():
+        return 1
+    classifier = SequenceClassifier(manager, diff_threshold=args.threshold, batch_size=args.batch_size)
+    for source in args.sources:
+        result = classifier.classify(source)
+        print(f"{source}:")
+        print(result.summary() if result else "  no frames")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,218 @@
+# stall_watchdog.py
+# -*- coding: utf-8 -*-
+"""
+UI event-loop stall watchdog for the FaunaLens application.
+
+Tk runs every callback on the main thread, so a slow handler (synchronous
+inference, a full UI rebuild) freezes the whole window. The watchdog
+schedules a heartbeat with `root.after` and measures how late each one runs.
+That delay is the time the event loop could not respond to the user.
+
+Heartbeats later than WATCHDOG_STALL_MS are recorded as stalls, together
+with the action that was running. Actions are labelled by wrapping handlers
+in `tracked(name)`; a monitor thread also captures the main thread's stack
+while a stall is still in progress, so unlabelled code is caught too. The
+collected delays give percentiles that can be checked against a
+responsiveness budget.
+"""
+
+import collections
+import contextlib
+import functools
+import sys
+import threading
+import time
+import traceback
+
+from config import WATCHDOG_INTERVAL_MS, WATCHDOG_STALL_MS, WATCHDOG_HISTORY, WATCHDOG_BUDGET
+
+_active = None
+
+
+class ResponsivenessBudgetExceeded(AssertionError):
+    """Raised by assert_within_budget when the UI was less responsive than allowed."""
+
+
+class Stall:
+    """One heartbeat that ran later than the stall threshold."""
+    __slots__ = ('time', 'latency_ms', 'action', 'stack')
+
+    def __init__(self, time, latency_ms, action, stack):
+        self.time = time
+        self.latency_ms = latency_ms
+        self.action = action
+        self.stack = stack
+
+    def __repr__(self):
+        return f"Stall({self.latency_ms:.0f} ms during '{self.action}')"
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class StallWatchdog:
+    """Measures Tk main-loop scheduling latency and records stalls."""
+    def __init__(self, root, interval_ms=WATCHDOG_INTERVAL_MS, stall_ms=WATCHDOG_STALL_MS,
+                 history=WATCHDOG_HISTORY, capture_stacks=True):
+        """
+        Args:
+            root: The Tk root (anything with `after`).
+            interval_ms (int): Heartbeat period.
+            stall_ms (float): Heartbeats later than this are recorded as stalls.
+            history (int): Number of latencies and stalls kept for statistics.
+            capture_stacks (bool): Sample the main thread's stack during long stalls.
+        """
+        self.root = root
+        self.interval_ms = interval_ms
+        self.stall_ms = stall_ms
+        self.latencies = collections.deque(maxlen=history)
+        self.stalls = collections.deque(maxlen=history)
+        self.beats = 0
+        self.capture_stacks = capture_stacks
+        self._actions = []          # Labels of the actions currently running, innermost last
+        self._finished = []         # (duration, label) of actions that ended since the last beat
+        self._expected = None       # perf_counter time at which the next beat is due
+        self._pending_stack = None  # Stack captured by the monitor during the current stall
+        self._after_id = None
+        self._running = False
+        self._main_thread = threading.main_thread().ident
+
+    def start(self):
+        """Starts the heartbeat (and the stack monitor) and makes this the active watchdog."""
+        global _active
+        if self._running:
+            return self
+        self._running = True
+        _active = self
+        self._schedule()
+        if self.capture_stacks:
+            threading.Thread(target=self._monitor, name='faunalens-watchdog', daemon=True).start()
+        return self
+
+    def stop(self):
+        global _active
+        self._running = False
+        if _active is self:
+            _active = None
+        if self._after_id is not None:
+            try:
+                self.root.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
+
+    def _schedule(self):
+        self._expected = time.perf_counter() + self.interval_ms / 1000
+        self._after_id = self.root.after(self.interval_ms, self._beat)
+
+    def _beat(self):
+        latency_ms = max(0.0, (time.perf_counter() - self._expected) * 1000)
+        self.beats += 1
+        self.latencies.append(latency_ms)
+        if latency_ms > self.stall_ms:
+            if self._finished:
+                action = max(self._finished)[1]
+            elif self._actions:
+                action = self._actions[-1]
+            else:
+                action = 'unknown'
+            stall = Stall(time.time(), latency_ms, action, self._pending_stack)
+            self.stalls.append(stall)
+            print(f"UI stall: event loop blocked for {latency_ms:.0f} ms during '{action}'.")
+        self._finished = []
+        self._pending_stack = None
+        if self._running:
+            self._schedule()
+
+    def _monitor(self):
+        """Captures where the main thread is while a heartbeat is overdue."""
+        while self._running:
+            time.sleep(self.stall_ms / 2000)
+            expected = self._expected
+            if (expected is not None and self._pending_stack is None
+                    and (time.perf_counter() - expected) * 1000 > self.stall_ms):
+                frame = sys._current_frames().get(self._main_thread)
+                if frame is not None:
+                    self._pending_stack = ''.join(traceback.format_stack(frame, limit=12))
+
+    # --- Action labels ---
+
+    @contextlib.contextmanager
+    def action(self, name):
+        """Labels the enclosed block so stalls it causes are attributed to it."""
+        self._actions.append(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._actions.pop()
+            self._finished.append((time.perf_counter() - started, name))
+
+    # --- Statistics ---
+
+    def percentiles(self, qs=(50, 95, 99)):
+        """Returns {q: latency_ms} over the recorded heartbeats."""
+        ordered = sorted(self.latencies)
+        return {q: _percentile(ordered, q) for q in qs}
+
+    def report(self):
+        """Returns a dict summarizing responsiveness since start."""
+        p = self.percentiles((50, 95, 99))
+        by_action = collections.Counter(stall.action for stall in self.stalls)
+        return {
+            'beats': self.beats,
+            'stalls': len(self.stalls),
+            'p50_ms': p[50],
+            'p95_ms': p[95],
+            'p99_ms': p[99],
+            'max_ms': max(self.latencies, default=0.0),
+            'worst_actions': by_action.most_common(5),
+        }
+
+    def summary(self):
+        """Returns the report as a one-line, human-readable string."""
+        r = self.report()
+        worst = ', '.join(f"{name} x{count}" for name, count in r['worst_actions']) or 'none'
+        return (f"UI latency p50 {r['p50_ms']:.0f} ms, p95 {r['p95_ms']:.0f} ms, p99 {r['p99_ms']:.0f} ms, "
+                f"max {r['max_ms']:.0f} ms; {r['stalls']} stalls (worst: {worst})")
+
+    def check_budget(self, budget=None):
+        """
+        Compares the report with a budget such as {'p95_ms': 50, 'max_ms': 1000}.
+
+        Returns:
+            list of str: One message per exceeded limit; empty if within budget.
+        """
+        budget = WATCHDOG_BUDGET if budget is None else budget
+        report = self.report()
+        return [f"{key} is {report[key]:.0f}, budget {limit}"
+                for key, limit in budget.items() if report.get(key, 0) > limit]
+
+    def assert_within_budget(self, budget=None):
+        """Raises ResponsivenessBudgetExceeded if any limit of the budget is exceeded."""
+        violations = self.check_budget(budget)
+        if violations:
+            raise ResponsivenessBudgetExceeded("; ".join(violations) + f". {self.summary()}")
+
+
+def active():
+    """Returns the running watchdog, or None."""
+    return _active
+
+
+def tracked(name):
+    """Decorator labelling every call of a Tk handler as action `name` for the active watchdog."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            watchdog = _active
+            if watchdog is None:
+                return func(*args, **kwargs)
+            with watchdog.action(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
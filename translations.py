@@ -0,0 +1,138 @@
+# translations.py
+# -*- coding: utf-8 -*-
+"""
+Compiled translation bundles for the FaunaLens application.
+
+languages.json stays the file translators edit. It is read once, from the
+package directory rather than the working directory, and compiled into one
+flat, read-only table per language. Every table has exactly the keys the
+English one defines: keys a translation lacks are filled from English, and
+keys English does not know are dropped, both with a warning.
+
+The Translator holds a reference to the active language's table and swaps
+it in one assignment when the language variable changes, so a lookup is a
+single dict access with no Tcl round trip, and a reader never sees a mix
+of two languages.
+
+`python translations.py check` lists the problems of every translation.
+"""
+
+import argparse
+import json
+import types
+
+from config import TRANSLATIONS_PATH, DEFAULT_LANGUAGE
+
+_bundles = {}  # path -> compiled bundles, so the file is parsed once per process
+
+
+class TranslationError(ValueError):
+    """Raised when the translation source cannot be compiled at all."""
+
+
+def compile_bundles(raw, fallback=DEFAULT_LANGUAGE):
+    """
+    Compiles the raw languages.json tree.
+
+    Args:
+        raw (dict): language code -> {key: text}.
+        fallback (str): The complete language that fills the gaps of the others.
+
+    Returns:
+        tuple: ({language: read-only table}, [problem descriptions]).
+
+    Raises:
+        TranslationError: If the fallback language is missing or is not a table of strings.
+    """
+    base = raw.get(fallback)
+    if not isinstance(base, dict) or not all(isinstance(v, str) for v in base.values()):
+        raise TranslationError(f"The fallback language '{fallback}' is missing or malformed.")
+
+    bundles, problems = {}, []
+    for language, table in raw.items():
+        if not isinstance(table, dict):
+            problems.append(f"[{language}] is not a table; using '{fallback}'.")
+            table = {}
+        missing = sorted(base.keys() - table.keys())
+        unknown = sorted(table.keys() - base.keys())
+        invalid = sorted(key for key, value in table.items() if key in base and not isinstance(value, str))
+        if missing:
+            problems.append(f"[{language}] missing {len(missing)} key(s), using '{fallback}': {', '.join(missing)}")
+        if unknown:
+            problems.append(f"[{language}] ignoring unknown key(s): {', '.join(unknown)}")
+        if invalid:
+            problems.append(f"[{language}] non-text value(s), using '{fallback}': {', '.join(invalid)}")
+        compiled = dict(base)
+        compiled.update((key, value) for key, value in table.items() if key in base and isinstance(value, str))
+        bundles[language] = types.MappingProxyType(compiled)
+    return bundles, problems
+
+
+def load_bundles(path=TRANSLATIONS_PATH):
+    """
+    Returns the compiled bundles of a translation file, compiling it on first use.
+    A missing or unreadable file yields a minimal English bundle instead of failing.
+    """
+    bundles = _bundles.get(path)
+    if bundles is not None:
+        return bundles
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            bundles, problems = compile_bundles(json.load(f))
+        for problem in problems:
+            print(f"Translation warning: {problem}")
+    except (OSError, ValueError) as e:
+        # Fallback in case the JSON is missing or broken
+        print(f"Error: could not load translations from {path}: {e}")
+        bundles = {DEFAULT_LANGUAGE: types.MappingProxyType({"error_message": "Language file not found."})}
+    _bundles[path] = bundles
+    return bundles
+
+
+class Translator:
+    """The active language's table, swapped whenever the language changes."""
+    def __init__(self, bundles=None, language=DEFAULT_LANGUAGE):
+        """
+        Args:
+            bundles (dict, optional): Compiled bundles; defaults to those of languages.json.
+            language (str): The initially active language.
+        """
+        self.bundles = bundles if bundles is not None else load_bundles()
+        self.languages = sorted(self.bundles)
+        self.set_language(language)
+
+    def set_language(self, language):
+        """Makes `language` active; unknown languages fall back to English."""
+        if language not in self.bundles:
+            language = DEFAULT_LANGUAGE
+        # One reference assignment: lookups see either the old table or the new one
+        self.table = self.bundles[language]
+        self.language = language
+
+    def bind(self, variable):
+        """Follows a Tk string variable holding the language code."""
+        variable.trace_add('write', lambda *_: self.set_language(variable.get()))
+        self.set_language(variable.get())
+
+    def get(self, key, default=""):
+        return self.table.get(key, default)
+
+
+def main(argv=None):
+    """Command-line interface: report the problems of every translation."""
+    parser = argparse.ArgumentParser(description="FaunaLens translation bundles.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    check = sub.add_parser('check', help="List missing, unknown and invalid keys of every language.")
+    check.add_argument('--path', default=TRANSLATIONS_PATH)
+    args = parser.parse_args(argv)
+
+    with open(args.path, 'r', encoding='utf-8') as f:
+        bundles, problems = compile_bundles(json.load(f))
+    for problem in problems:
+        print(problem)
+    print(f"{len(bundles)} languages, {len(bundles[DEFAULT_LANGUAGE])} keys, {len(problems)} problem(s).")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,7 +1,11 @@
 # ui_components.py
 # -*- coding: utf-8 -*-
+import collections
+import os
+import time
 import tkinter as tk
 from tkinter import ttk
+from PIL import ImageTk
 
 class CustomButton(tk.Canvas):
     """A custom, theme-aware, rounded button with a border and shadow."""
@@ -172,6 +176,252 @@ class ResultRow(tk.Frame):
             if not isinstance(child, ttk.Progressbar):
                 child.config(bg=self.colors['secondarySystemBackground'])
 
+class HistoryRow(tk.Frame):
+    """A row that displays one stored prediction: time, file name, label and score."""
+    def __init__(self, parent, colors, font, record, search_callback):
+        super().__init__(parent, bg=colors['secondarySystemBackground'])
+        self.colors = colors
+        self.font = font
+
+        self.grid_columnconfigure(2, weight=1)
+
+        timestamp = time.strftime('%Y-%m-%d %H:%M', time.localtime(record.created))
+        self.time_label = tk.Label(self, text=timestamp, font=self.font, anchor='w', bg=self.colors['secondarySystemBackground'], fg=self.colors['secondaryLabel'])
+        self.time_label.grid(row=0, column=0, sticky='w', padx=(15, 5), pady=6)
+
+        self.file_label = tk.Label(self, text=os.path.basename(record.image_path), font=self.font, anchor='w', bg=self.colors['secondarySystemBackground'], fg=self.colors['secondaryLabel'])
+        self.file_label.grid(row=0, column=1, sticky='w', padx=5, pady=6)
+
+        self.name_label = tk.Label(self, text=record.display_label, font=self.font, anchor='w', bg=self.colors['secondarySystemBackground'], fg=self.colors['label'])
+        self.name_label.grid(row=0, column=2, sticky='w', padx=5, pady=6)
+
+        self.score_label = tk.Label(self, text=f"{record.score:.1%}", font=self.font, anchor='e', bg=self.colors['secondarySystemBackground'], fg=self.colors['secondaryLabel'])
+        self.score_label.grid(row=0, column=3, sticky='e', padx=(5, 15), pady=6)
+
+        for widget in (self, *self.winfo_children()):
+            widget.bind("<Button-1>", lambda e, l=record.display_label: search_callback(l))
+            widget.bind("<Enter>", lambda e: self._set_bg(self.colors['tertiarySystemBackground']))
+            widget.bind("<Leave>", lambda e: self._set_bg(self.colors['secondarySystemBackground']))
+
+    def _set_bg(self, color):
+        self.config(bg=color)
+        for child in self.winfo_children():
+            child.config(bg=color)
+
+class VirtualList(tk.Frame):
+    """
+    A scrollable list of text rows that only creates widgets for the rows
+    visible in the viewport. Rows are recycled while scrolling, so the widget
+    count stays constant no matter how many items the list holds.
+    """
+    def __init__(self, parent, colors, font, row_height=30, command=None, **kwargs):
+        """
+        Args:
+            parent: The parent widget.
+            colors (dict): Theme colors.
+            font: Font for the row text.
+            row_height (int): Fixed height of every row in pixels.
+            command (callable, optional): Called with the item when a row is clicked.
+        """
+        super().__init__(parent, bg=colors['secondarySystemBackground'], **kwargs)
+        self.colors = colors
+        self.font = font
+        self.row_height = row_height
+        self.command = command
+        self.items = []
+        self._offset = 0   # Scroll position in pixels
+        self._rows = []    # Recycled row labels; row.index is the item each one shows
+
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(0, weight=1)
+        self.body = tk.Frame(self, bg=colors['secondarySystemBackground'])
+        self.body.grid(row=0, column=0, sticky='nsew')
+        self.scrollbar = ttk.Scrollbar(self, orient='vertical', command=self._on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky='ns')
+
+        self.body.bind("<Configure>", lambda e: self._render())
+        self._bind_wheel(self.body)
+
+    def set_items(self, items):
+        """Replaces the list contents and scrolls back to the top."""
+        self.items = list(items)
+        self._offset = 0
+        self._render()
+
+    def _bind_wheel(self, widget):
+        widget.bind("<MouseWheel>", lambda e: self._scroll_by(-e.delta if abs(e.delta) < 120 else -e.delta // 120 * self.row_height))
+        widget.bind("<Button-4>", lambda e: self._scroll_by(-self.row_height))
+        widget.bind("<Button-5>", lambda e: self._scroll_by(self.row_height))
+
+    def _row_count(self):
+        return len(self.items)
+
+    def _max_offset(self):
+        return max(0, self._row_count() * self.row_height - self.body.winfo_height())
+
+    def _scroll_to(self, offset):
+        offset = int(min(max(offset, 0), self._max_offset()))
+        if offset != self._offset:
+            self._offset = offset
+            self._render()
+
+    def _scroll_by(self, pixels):
+        self._scroll_to(self._offset + pixels)
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == 'moveto':
+            self._scroll_to(float(amount) * self._row_count() * self.row_height)
+        elif unit == 'pages':
+            self._scroll_by(int(amount) * self.body.winfo_height())
+        else:
+            self._scroll_by(int(amount) * self.row_height)
+
+    def _ensure_pool(self, count):
+        """Grows or shrinks the pool of row widgets to fill the viewport."""
+        while len(self._rows) < count:
+            row = tk.Label(self.body, anchor='w', padx=15, font=self.font,
+                           bg=self.colors['secondarySystemBackground'], fg=self.colors['label'])
+            row.index = None
+            row.bind("<Button-1>", lambda e, r=row: self._on_click(r))
+            row.bind("<Enter>", lambda e, r=row: r.config(bg=self.colors['tertiarySystemBackground']))
+            row.bind("<Leave>", lambda e, r=row: r.config(bg=self.colors['secondarySystemBackground']))
+            self._bind_wheel(row)
+            self._rows.append(row)
+        while len(self._rows) > count:
+            self._rows.pop().destroy()
+
+    def _render(self):
+        """Positions the pooled rows for the current scroll offset."""
+        height = self.body.winfo_height()
+        if height <= 1:
+            return
+        self._offset = min(self._offset, self._max_offset())
+        # One extra row covers the partially visible row at the bottom edge
+        self._ensure_pool(height // self.row_height + 2)
+        first, shift = divmod(self._offset, self.row_height)
+        for i, row in enumerate(self._rows):
+            index = first + i
+            if index < len(self.items):
+                if row.index != index:
+                    row.index = index
+                    row.config(text=str(self.items[index]))
+                row.place(x=0, y=i * self.row_height - shift, relwidth=1, height=self.row_height)
+            else:
+                row.index = None
+                row.place_forget()
+        self._update_scrollbar(height)
+
+    def _update_scrollbar(self, height):
+        total = self._row_count() * self.row_height
+        if total <= height:
+            self.scrollbar.set(0, 1)
+        else:
+            self.scrollbar.set(self._offset / total, (self._offset + height) / total)
+
+    def _on_click(self, row):
+        if self.command and row.index is not None and row.index < len(self.items):
+            self.command(self.items[row.index])
+
+class GalleryGrid(VirtualList):
+    """
+    A scrollable grid of image tiles. Like VirtualList, it only creates tiles
+    for the rows visible in the viewport and recycles them while scrolling,
+    so a gallery of hundreds of photos needs no more widgets than a dozen.
+    Tk images are kept only for the visible tiles plus a few recently shown
+    ones, so their number stays bounded however large the gallery is.
+    """
+    def __init__(self, parent, colors, font, tile_size=96, caption=None, command=None, spare_photos=64, **kwargs):
+        """
+        Args:
+            parent: The parent widget.
+            colors (dict): Theme colors.
+            font: Font for the captions.
+            tile_size (int): Size of the square thumbnail area in pixels.
+            caption (callable, optional): Returns the caption text of an item.
+            command (callable, optional): Called with the item when a tile is clicked.
+            spare_photos (int): Tk images kept for tiles scrolled out of view.
+
+        Items need a `thumbnail` attribute (a PIL Image or None).
+        """
+        self.tile_size = tile_size
+        self.spare_photos = spare_photos
+        self._photos = collections.OrderedDict()  # item -> (thumbnail, PhotoImage), least recently shown first
+        self.tile_width = tile_size + 24
+        self.columns = 1
+        self.caption = caption or (lambda item: '')
+        super().__init__(parent, colors, font, row_height=tile_size + 48, command=command, **kwargs)
+
+    def set_items(self, items):
+        self._photos.clear()
+        super().set_items(items)
+
+    def refresh(self):
+        """Redraws the visible tiles whose items changed since they were drawn."""
+        self._render()
+
+    def _photo(self, item):
+        """Returns the Tk image of an item's thumbnail, making it if it is not cached."""
+        cached = self._photos.get(item)
+        if cached is not None and cached[0] is item.thumbnail:
+            self._photos.move_to_end(item)
+            return cached[1]
+        if item.thumbnail is None:
+            return None
+        photo = ImageTk.PhotoImage(item.thumbnail)
+        self._photos[item] = (item.thumbnail, photo)
+        return photo
+
+    def _row_count(self):
+        return -(-len(self.items) // self.columns)
+
+    def _ensure_pool(self, count):
+        while len(self._rows) < count:
+            tile = tk.Label(self.body, compound='top', font=self.font, justify='center',
+                            wraplength=self.tile_width - 8,
+                            bg=self.colors['secondarySystemBackground'], fg=self.colors['label'])
+            tile.index = None
+            tile.shown = None
+            tile.bind("<Button-1>", lambda e, t=tile: self._on_click(t))
+            tile.bind("<Enter>", lambda e, t=tile: t.config(bg=self.colors['tertiarySystemBackground']))
+            tile.bind("<Leave>", lambda e, t=tile: t.config(bg=self.colors['secondarySystemBackground']))
+            self._bind_wheel(tile)
+            self._rows.append(tile)
+        while len(self._rows) > count:
+            self._rows.pop().destroy()
+
+    def _render(self):
+        """Positions the pooled tiles for the current scroll offset and width."""
+        width, height = self.body.winfo_width(), self.body.winfo_height()
+        if width <= 1 or height <= 1:
+            return
+        self.columns = max(1, width // self.tile_width)
+        self._offset = min(self._offset, self._max_offset())
+        self._ensure_pool((height // self.row_height + 2) * self.columns)
+        first, shift = divmod(self._offset, self.row_height)
+        for i, tile in enumerate(self._rows):
+            index = first * self.columns + i
+            if index >= len(self.items):
+                if tile.shown is not None:
+                    tile.config(image='')
+                tile.index = tile.shown = None
+                tile.place_forget()
+                continue
+            item = self.items[index]
+            photo = self._photo(item)
+            caption = self.caption(item)
+            # Only touch the widget when what it shows has changed
+            if tile.shown != (index, photo, caption):
+                tile.index = index
+                tile.shown = (index, photo, caption)
+                tile.config(image=photo if photo is not None else '', text=caption)
+            row, column = divmod(i, self.columns)
+            tile.place(x=column * self.tile_width, y=row * self.row_height - shift,
+                       width=self.tile_width, height=self.row_height)
+        # The visible tiles' images were just moved to the end; release the oldest of the rest
+        while len(self._photos) > len(self._rows) + self.spare_photos:
+            self._photos.popitem(last=False)
+        self._update_scrollbar(height)
+
 def create_rounded_rectangle(self, x1, y1, x2, y2, radius=25, **kwargs):
     """Helper function to draw a rounded rectangle on a Canvas."""
     points = [x1+radius, y1, x2-radius, y1, x2, y1, x2, y1+radius, x2, y2-radius, x2, y2, x2-radius, y2, x1+radius, y2, x1, y2, x1, y2-radius, x1, y1+radius, x1, y1]
@@ -4,7 +4,7 @@
 Handles all UI rendering for the FaunaLens application.
 
 This module contains the MainView, which manages all pages, and the specific
-page classes (AIPage, SettingsPage). The View is responsible only for
+page classes (AIPage, HistoryPage, SettingsPage). The View is responsible only for
 displaying widgets and forwarding user actions to the AppController.
 It gets all its data and styling information from the controller.
 """
@@ -12,8 +12,12 @@ import tkinter as tk
 from tkinter import ttk
 from PIL import Image, ImageTk
 import utils
-from config import WINDOW_SIZE_MAP, TEXT_SIZE_MAP
-from ui_components import ResultRow, CustomButton, IconCustomButton
+from config import (WINDOW_SIZE_MAP, TEXT_SIZE_MAP, HISTORY_PAGE_SIZE, GALLERY_THUMBNAIL_SIZE, GALLERY_SPARE_PHOTOS,
+                    EMBEDDINGS_ENABLED)
+from ui_components import ResultRow, HistoryRow, CustomButton, IconCustomButton, VirtualList, GalleryGrid
+from multicrop import MODES as CROP_MODES
+from profiling import profiled
+from stall_watchdog import tracked
 
 class MainView(tk.Frame):
     """The main container for all application pages."""
@@ -32,25 +36,67 @@ class MainView(tk.Frame):
         container.grid_columnconfigure(0, weight=1)
 
         self.pages = {}
+        self.current_page = None
+        # Refresh scheduler: requests mark pages dirty and one idle callback renders them
+        self._dirty = set()
+        self._render_id = None
+        self.renders = 0
+        self.coalesced_renders = 0  # Requests merged into an already scheduled render
+        self.deferred_renders = 0   # Rebuilds of hidden pages postponed until they are shown
         # Create instances of all pages
-        for PageClass in (AIPage, SettingsPage):
+        for PageClass in (AIPage, HistoryPage, SettingsPage):
             page_name = PageClass.__name__
             page = PageClass(parent=container, controller=self.controller)
             self.pages[page_name] = page
             page.grid(row=0, column=0, sticky="nsew")
 
+        self._dirty.update(self.pages)
         self.show_frame("AIPage")
 
     def show_frame(self, page_name):
-        """Raises the specified page to the top."""
-        page = self.pages[page_name]
-        page.tkraise()
-        page.refresh_ui() # Refresh UI every time a page is shown
+        """Raises the specified page to the top and schedules its rebuild."""
+        self.current_page = page_name
+        self.pages[page_name].tkraise()
+        self.request_refresh(page_name) # Refresh UI every time a page is shown
+
+    def request_refresh(self, *page_names):
+        """
+        Marks pages (all of them by default) as out of date and schedules a
+        single render for the next idle moment. Requests arriving before that
+        render are merged into it, and hidden pages stay dirty until shown.
+        """
+        self._dirty.update(page_names or self.pages)
+        if self._render_id is None:
+            self._render_id = self.after_idle(self._render_dirty)
+        else:
+            self.coalesced_renders += 1
 
     def refresh_ui(self):
-        """Refreshes the UI of all pages."""
-        for page in self.pages.values():
-            page.refresh_ui()
+        """Marks every page out of date and rebuilds the visible one immediately."""
+        if self._render_id is not None:
+            self.after_cancel(self._render_id)
+        self._dirty.update(self.pages)
+        self._render_dirty()
+
+    # Not @profiled: the page's refresh_ui is, so each rebuild is timed exactly once
+    @tracked('refresh_ui')
+    def _render_dirty(self):
+        """Rebuilds the visible page if it is dirty; hidden dirty pages wait."""
+        self._render_id = None
+        self.deferred_renders += len(self._dirty - {self.current_page})
+        if self.current_page in self._dirty:
+            self._dirty.discard(self.current_page)
+            self.pages[self.current_page].refresh_ui()
+            self.renders += 1
+
+    @property
+    def skipped_renders(self):
+        return self.coalesced_renders + self.deferred_renders
+
+    def render_summary(self):
+        """Returns the scheduler's counters as a one-line, human-readable string."""
+        return (f"UI renders: {self.renders} performed, {self.skipped_renders} skipped "
+                f"({self.coalesced_renders} merged, {self.deferred_renders} hidden)")
 
     def show_initial_view(self):
         self.pages["AIPage"].show_initial_view()
@@ -61,12 +107,21 @@ class MainView(tk.Frame):
     def show_results_view(self, pil_image, predictions):
         self.pages["AIPage"].show_results_view(pil_image, predictions)
 
+    def show_gallery_view(self):
+        self.pages["AIPage"].show_gallery_view()
+
+    def update_gallery(self):
+        self.pages["AIPage"].update_gallery()
+
     def show_popup(self, title, content):
         self.pages["AIPage"].show_popup(title, content)
 
     def set_search_result_text(self, text, color):
         self.pages["AIPage"].set_search_result_text(text, color)
 
+    def show_label_matches(self, matches):
+        self.pages["AIPage"].show_label_matches(matches)
+
 class BasePage(tk.Frame):
     """Base class for all pages, containing common functionality."""
     def __init__(self, parent, controller):
@@ -76,6 +131,7 @@ class BasePage(tk.Frame):
         self.theme_manager = controller.theme_manager
         self.grid_columnconfigure(0, weight=1)
 
+    @profiled('refresh_ui')
     def refresh_ui(self):
         """Destroys all current widgets and rebuilds the UI."""
         for widget in self.winfo_children():
@@ -97,7 +153,9 @@ class AIPage(BasePage):
         # State flags for this page
         self.is_initial_view = True
         self.is_loading = False
+        self.is_gallery_view = False
         self._current_pil_image = None
+        self.gallery_grid = None
         
     def _load_theme_icons(self):
         """Loads the correct icons based on the current theme."""
@@ -139,6 +197,13 @@ class AIPage(BasePage):
                                            command=lambda: self.controller.show_frame("SettingsPage"))
         settings_button.pack(side=tk.RIGHT)
 
+        history_button = CustomButton(top_frame, text=self.controller.get_translation('history_button'),
+                                      width=110, height=36, radius=18, font=self.theme_manager.get_font('button'),
+                                      colors=self.theme_manager.get_button_colors('primary'),
+                                      parent_bg=colors['systemBackground'],
+                                      command=lambda: self.controller.show_frame("HistoryPage"))
+        history_button.pack(side=tk.RIGHT, padx=(0, 10))
+
     def _build_content_area(self, parent):
         colors = self.theme_manager.get_current_theme_colors()
         content_frame = tk.Frame(parent, bg=colors['systemBackground'])
@@ -146,8 +211,11 @@ class AIPage(BasePage):
         content_frame.grid_columnconfigure(0, weight=1)
         content_frame.grid_rowconfigure(0, weight=1)
         
+        self.gallery_grid = None
         if self.is_initial_view:
             self._build_initial_view(content_frame)
+        elif self.is_gallery_view:
+            self._build_gallery_view(content_frame)
         else:
             self._build_results_view(content_frame)
 
@@ -188,11 +256,60 @@ class AIPage(BasePage):
                                           font=self.theme_manager.get_font('result_title'),
                                           bg=colors['systemBackground'], fg=colors['label'])
         result_title_label.pack(side=tk.LEFT, anchor='w')
+
+        if self.controller.gallery:
+            back_button = CustomButton(results_header_frame, text=self.controller.get_translation('back_button'),
+                                       width=90, height=36, radius=18, font=self.theme_manager.get_font('button'),
+                                       colors=self.theme_manager.get_button_colors('secondary'),
+                                       parent_bg=colors['systemBackground'],
+                                       command=self.controller.show_gallery)
+            back_button.pack(side=tk.RIGHT)
+
+        if EMBEDDINGS_ENABLED and self.controller.last_file_path:
+            similar_button = CustomButton(results_header_frame, text=self.controller.get_translation('similar_button'),
+                                          width=90, height=36, radius=18, font=self.theme_manager.get_font('button'),
+                                          colors=self.theme_manager.get_button_colors('secondary'),
+                                          parent_bg=colors['systemBackground'],
+                                          command=self.controller.show_similar_images)
+            similar_button.pack(side=tk.RIGHT, padx=(0, 10))
         
         results_scroll_frame = tk.Frame(results_frame_container, bg=colors['secondarySystemBackground'])
         results_scroll_frame.pack(fill=tk.BOTH, expand=True)
         self.create_clickable_predictions(results_scroll_frame, self.controller.last_prediction)
 
+    def _build_gallery_view(self, parent):
+        colors = self.theme_manager.get_current_theme_colors()
+
+        gallery_container = tk.Frame(parent, bg=colors['systemBackground'])
+        gallery_container.grid(row=0, column=0, sticky='nsew')
+        gallery_container.grid_columnconfigure(0, weight=1)
+        gallery_container.grid_rowconfigure(1, weight=1)
+
+        header_frame = tk.Frame(gallery_container, bg=colors['systemBackground'])
+        header_frame.grid(row=0, column=0, sticky='ew', pady=(0, 10))
+        title_label = tk.Label(header_frame, text=self.controller.get_translation('gallery_title'),
+                               font=self.theme_manager.get_font('result_title'),
+                               bg=colors['systemBackground'], fg=colors['label'])
+        title_label.pack(side=tk.LEFT, anchor='w')
+        self.gallery_progress_label = tk.Label(header_frame, font=self.theme_manager.get_font(),
+                                               bg=colors['systemBackground'], fg=colors['secondaryLabel'])
+        self.gallery_progress_label.pack(side=tk.RIGHT, anchor='e')
+
+        self.gallery_grid = GalleryGrid(gallery_container, colors, self.theme_manager.get_font('result_row'),
+                                        tile_size=GALLERY_THUMBNAIL_SIZE, caption=self._gallery_caption,
+                                        command=self.controller.open_gallery_item, spare_photos=GALLERY_SPARE_PHOTOS)
+        self.gallery_grid.grid(row=1, column=0, sticky='nsew')
+        self.gallery_grid.set_items(self.controller.gallery or [])
+        self.update_gallery()
+
+    def _gallery_caption(self, item):
+        if item.predictions:
+            _, label, score = item.predictions[0]
+            return f"{label.replace('_', ' ').capitalize()}\n{score:.0%}"
+        if item.error:
+            return self.controller.get_translation('gallery_failed')
+        return self.controller.get_translation('gallery_pending')
+
     def _build_footer(self, parent):
         colors = self.theme_manager.get_current_theme_colors()
         footer_container = tk.Frame(parent, bg=colors['systemBackground'])
@@ -235,12 +352,20 @@ class AIPage(BasePage):
                                             font=self.theme_manager.get_font(), bg=colors['systemBackground'], fg=colors['label'])
         self.search_result_label.grid(row=1, column=0, sticky='w', padx=15, pady=(2,0))
 
+        # Live label matches; hidden until a search produces results
+        self.label_match_list = VirtualList(search_container, colors, self.theme_manager.get_font('result_row'),
+                                            command=self.controller.search_wikipedia, height=150)
+        self.label_match_list.grid_propagate(False)
+        self.label_match_list.grid(row=2, column=0, sticky='ew', pady=(5, 0))
+        self.label_match_list.grid_remove()
+
     def _build_action_buttons(self, parent):
         colors = self.theme_manager.get_current_theme_colors()
         button_container = tk.Frame(parent, bg=colors['systemBackground'])
         button_container.grid(row=1, column=0, sticky='ew', pady=(10, 0))
         button_container.grid_columnconfigure(0, weight=1)
         button_container.grid_columnconfigure(1, weight=1)
+        button_container.grid_columnconfigure(2, weight=1)
 
         self.clear_button = CustomButton(button_container, text=self.controller.get_translation('clear_button'),
                                          font=self.theme_manager.get_font('button'),
@@ -256,7 +381,15 @@ class AIPage(BasePage):
                                           parent_bg=colors['systemBackground'],
                                           state=button_state,
                                           command=self.controller.upload_and_predict)
-        self.upload_button.grid(row=0, column=1, sticky='ewns', padx=(5, 0))
+        self.upload_button.grid(row=0, column=1, sticky='ewns', padx=5)
+
+        self.folder_button = CustomButton(button_container, text=self.controller.get_translation('folder_button'),
+                                          font=self.theme_manager.get_font('button'),
+                                          colors=self.theme_manager.get_button_colors(button_type='primary'),
+                                          parent_bg=colors['systemBackground'],
+                                          state=button_state,
+                                          command=self.controller.upload_folder)
+        self.folder_button.grid(row=0, column=2, sticky='ewns', padx=(5, 0))
 
     def on_search_key_release(self, event):
         if event.keysym in ('Shift_L', 'Shift_R', 'Control_L', 'Control_R', 'Alt_L', 'Alt_R'):
@@ -267,23 +400,40 @@ class AIPage(BasePage):
     def show_initial_view(self):
         self.is_initial_view = True
         self.is_loading = False
+        self.is_gallery_view = False
         self.controller.last_prediction = None
 
     def show_loading_view(self):
         self.is_initial_view = True
         self.is_loading = True
-        self.refresh_ui()
+        self.is_gallery_view = False
+
+    def show_gallery_view(self):
+        self.is_initial_view = False
+        self.is_loading = False
+        self.is_gallery_view = True
+
+    def update_gallery(self):
+        """Shows newly finished thumbnails and predictions without rebuilding the page."""
+        if self.gallery_grid is None or not self.gallery_grid.winfo_exists():
+            return
+        self.gallery_grid.refresh()
+        total = len(self.controller.gallery or [])
+        self.gallery_progress_label.config(
+            text=f"{self.controller.gallery_classified}/{total} {self.controller.get_translation('gallery_progress')}")
 
     def show_results_view(self, pil_image, predictions):
         self.is_initial_view = False
         self.is_loading = False
-        self._current_pil_image = pil_image
+        self.is_gallery_view = False
+        # Keep only the small copy the results header shows, not the decoded photo
+        thumb_img = pil_image.copy()
+        thumb_img.thumbnail((60, 60), Image.Resampling.LANCZOS)
+        self._current_pil_image = thumb_img
         self.controller.last_prediction = predictions
 
     def display_thumbnail(self, canvas, pil_image):
-        thumb_img = pil_image.copy()
-        thumb_img.thumbnail((60, 60), Image.Resampling.LANCZOS)
-        self.thumbnail_photo = ImageTk.PhotoImage(utils.round_corners(thumb_img, 10))
+        self.thumbnail_photo = ImageTk.PhotoImage(utils.round_corners(pil_image, 10))
         canvas.delete("all")
         canvas.create_image(0, 0, image=self.thumbnail_photo, anchor='nw')
 
@@ -295,6 +445,7 @@ class AIPage(BasePage):
             row = ResultRow(container, colors, font, (label.replace('_', ' ').capitalize(), score), self.controller.search_wikipedia)
             row.pack(fill=tk.X, pady=2)
 
+    @tracked('show_popup')
     def show_popup(self, title, content):
         if not hasattr(self, 'popup') or not self.popup.winfo_exists():
             self.popup = tk.Toplevel(self.controller.root)
@@ -323,6 +474,152 @@ class AIPage(BasePage):
     def set_search_result_text(self, text, color):
         self.search_result_label.config(text=text, fg=color)
 
+    def show_label_matches(self, matches):
+        """Fills the label-match list, showing it only while there are matches."""
+        self.label_match_list.set_items(matches)
+        if matches:
+            self.label_match_list.grid()
+        else:
+            self.label_match_list.grid_remove()
+
+class HistoryPage(BasePage):
+    """
+    Lists stored predictions, newest first. Only one page of rows exists at a
+    time; pages are fetched from the history store with keyset pagination.
+    """
+    def __init__(self, parent, controller):
+        super().__init__(parent, controller)
+        self.label_filter = ''
+        self.min_score_filter = ''
+        # before_id cursors of the pages visited so far; the last one is the current page
+        self._cursors = [None]
+
+    def _build_ui(self):
+        """Builds all widgets for the History page."""
+        colors = self.theme_manager.get_current_theme_colors()
+        self.config(bg=colors['systemBackground'])
+
+        main_container = tk.Frame(self, bg=colors['systemBackground'])
+        main_container.pack(fill=tk.BOTH, expand=True, padx=30, pady=20)
+
+        self._build_header(main_container)
+        self._build_filter_bar(main_container)
+        self.list_frame = tk.Frame(main_container, bg=colors['secondarySystemBackground'])
+        self.list_frame.pack(fill=tk.BOTH, expand=True)
+        self._build_pager(main_container)
+        self._render_page()
+
+    def _build_header(self, parent):
+        colors = self.theme_manager.get_current_theme_colors()
+        header_frame = tk.Frame(parent, bg=colors['systemBackground'])
+        header_frame.pack(fill=tk.X, pady=(0, 15))
+        title_label = tk.Label(header_frame, text=self.controller.get_translation('history_title'),
+                               font=self.theme_manager.get_font('title'),
+                               bg=colors['systemBackground'], fg=colors['label'])
+        title_label.pack(side=tk.LEFT, anchor='w')
+        back_button = CustomButton(header_frame, text=self.controller.get_translation('back_button'),
+                                   width=120, font=self.theme_manager.get_font('button'),
+                                   colors=self.theme_manager.get_button_colors('primary'),
+                                   parent_bg=colors['systemBackground'],
+                                   command=lambda: self.controller.show_frame("AIPage"))
+        back_button.pack(side=tk.RIGHT)
+
+    def _build_filter_bar(self, parent):
+        colors = self.theme_manager.get_current_theme_colors()
+        filter_frame = tk.Frame(parent, bg=colors['systemBackground'])
+        filter_frame.pack(fill=tk.X, pady=(0, 10))
+
+        entry_options = dict(relief='flat', font=self.theme_manager.get_font(),
+                             bg=colors['tertiarySystemBackground'], fg=colors['label'],
+                             insertbackground=colors['label'])
+        tk.Label(filter_frame, text=self.controller.get_translation('history_label_filter'),
+                 font=self.theme_manager.get_font(), bg=colors['systemBackground'], fg=colors['label']).pack(side=tk.LEFT)
+        self.label_entry = tk.Entry(filter_frame, width=18, **entry_options)
+        self.label_entry.pack(side=tk.LEFT, padx=(5, 15), ipady=4)
+        self.label_entry.insert(0, self.label_filter)
+
+        tk.Label(filter_frame, text=self.controller.get_translation('history_min_score'),
+                 font=self.theme_manager.get_font(), bg=colors['systemBackground'], fg=colors['label']).pack(side=tk.LEFT)
+        self.score_entry = tk.Entry(filter_frame, width=6, **entry_options)
+        self.score_entry.pack(side=tk.LEFT, padx=(5, 15), ipady=4)
+        self.score_entry.insert(0, self.min_score_filter)
+
+        for entry in (self.label_entry, self.score_entry):
+            entry.bind('<Return>', lambda e: self.apply_filter())
+
+        search_button = CustomButton(filter_frame, text=self.controller.get_translation('history_search'),
+                                     width=100, height=36, radius=18, font=self.theme_manager.get_font('button'),
+                                     colors=self.theme_manager.get_button_colors('primary'),
+                                     parent_bg=colors['systemBackground'],
+                                     command=self.apply_filter)
+        search_button.pack(side=tk.RIGHT)
+
+    def _build_pager(self, parent):
+        colors = self.theme_manager.get_current_theme_colors()
+        pager_frame = tk.Frame(parent, bg=colors['systemBackground'])
+        pager_frame.pack(fill=tk.X, pady=(10, 0))
+        pager_frame.grid_columnconfigure(1, weight=1)
+
+        self.prev_button = CustomButton(pager_frame, text=self.controller.get_translation('history_prev'),
+                                        width=100, height=36, radius=18, font=self.theme_manager.get_font('button'),
+                                        colors=self.theme_manager.get_button_colors('primary'),
+                                        parent_bg=colors['systemBackground'], command=self.previous_page)
+        self.prev_button.grid(row=0, column=0)
+        self.page_label = tk.Label(pager_frame, text='', font=self.theme_manager.get_font(),
+                                   bg=colors['systemBackground'], fg=colors['secondaryLabel'])
+        self.page_label.grid(row=0, column=1)
+        self.next_button = CustomButton(pager_frame, text=self.controller.get_translation('history_next'),
+                                        width=100, height=36, radius=18, font=self.theme_manager.get_font('button'),
+                                        colors=self.theme_manager.get_button_colors('primary'),
+                                        parent_bg=colors['systemBackground'], command=self.next_page)
+        self.next_button.grid(row=0, column=2)
+
+    def _render_page(self):
+        """Fetches the current page and replaces the rows of the list frame."""
+        for widget in self.list_frame.winfo_children():
+            widget.destroy()
+        colors = self.theme_manager.get_current_theme_colors()
+        font = self.theme_manager.get_font('result_row')
+
+        try:
+            min_score = float(self.min_score_filter) if self.min_score_filter else None
+        except ValueError:
+            min_score = None
+        # Fetch one extra row to learn whether a next page exists
+        records = self.controller.history.query(label=self.label_filter or None, min_score=min_score,
+                                                before_id=self._cursors[-1], limit=HISTORY_PAGE_SIZE + 1)
+        self._has_next = len(records) > HISTORY_PAGE_SIZE
+        records = records[:HISTORY_PAGE_SIZE]
+        self._last_id = records[-1].id if records else None
+
+        if not records:
+            tk.Label(self.list_frame, text=self.controller.get_translation('history_empty'),
+                     font=self.theme_manager.get_font(), bg=colors['secondarySystemBackground'],
+                     fg=colors['secondaryLabel']).pack(pady=20)
+        for record in records:
+            row = HistoryRow(self.list_frame, colors, font, record, self.controller.search_wikipedia)
+            row.pack(fill=tk.X, pady=1)
+
+        self.page_label.config(text=str(len(self._cursors)))
+        self.prev_button.configure(state=tk.NORMAL if len(self._cursors) > 1 else tk.DISABLED)
+        self.next_button.configure(state=tk.NORMAL if self._has_next else tk.DISABLED)
+
+    def apply_filter(self):
+        self.label_filter = self.label_entry.get().strip()
+        self.min_score_filter = self.score_entry.get().strip()
+        self._cursors = [None]
+        self._render_page()
+
+    def next_page(self):
+        if self._has_next:
+            self._cursors.append(self._last_id)
+            self._render_page()
+
+    def previous_page(self):
+        if len(self._cursors) > 1:
+            self._cursors.pop()
+            self._render_page()
+
 class SettingsPage(BasePage):
     """The settings page of the application."""
     def _build_ui(self):
@@ -363,6 +660,8 @@ class SettingsPage(BasePage):
         self._create_setting_row(parent, self.controller.get_translation('theme_label'), self._build_theme_switch)
         self._create_setting_row(parent, self.controller.get_translation('text_size_label'), self._build_text_size_combo)
         self._create_setting_row(parent, self.controller.get_translation('window_size_label'), self._build_window_size_combo)
+        self._create_setting_row(parent, self.controller.get_translation('model_label'), self._build_model_combo)
+        self._create_setting_row(parent, self.controller.get_translation('crop_mode_label'), self._build_crop_mode_combo)
 
     def _style_ttk_widgets(self):
         colors = self.theme_manager.get_current_theme_colors()
@@ -385,7 +684,7 @@ class SettingsPage(BasePage):
         widget_builder(frame)
 
     def _build_lang_combo(self, parent):
-        lang_options = sorted(list(self.controller.translations.keys()))
+        lang_options = self.controller.translator.languages
         combo = ttk.Combobox(parent, textvariable=self.controller.current_lang, values=lang_options, state='readonly', width=15)
         combo.pack(side=tk.RIGHT)
         combo.bind("<<ComboboxSelected>>", self.controller.change_language)
@@ -408,3 +707,13 @@ class SettingsPage(BasePage):
         combo = ttk.Combobox(parent, textvariable=self.controller.window_size, values=options, state='readonly', width=15)
         combo.pack(side=tk.RIGHT)
         combo.bind("<<ComboboxSelected>>", self.controller.apply_window_size)
+
+    def _build_model_combo(self, parent):
+        options = self.controller.model_manager.available_models()
+        combo = ttk.Combobox(parent, textvariable=self.controller.active_model, values=options, state='readonly', width=20)
+        combo.pack(side=tk.RIGHT)
+        combo.bind("<<ComboboxSelected>>", self.controller.change_model)
+
+    def _build_crop_mode_combo(self, parent):
+        combo = ttk.Combobox(parent, textvariable=self.controller.crop_mode, values=list(CROP_MODES), state='readonly', width=15)
+        combo.pack(side=tk.RIGHT)
@@ -0,0 +1,348 @@
+# watcher.py
+# -*- coding: utf-8 -*-
+"""
+Watch-folder ingestion daemon for the FaunaLens application.
+
+Camera-trap uploads land in a shared directory. The daemon picks up every new
+image in that directory, classifies it through the ModelManager and appends
+the result to a JSON-lines manifest. On restart the manifest is read back, so
+files that were already classified are never processed twice.
+
+New files are detected with Linux inotify when available and by periodic
+directory scans otherwise. Detected paths go through a bounded queue; when a
+burst of thousands of files arrives the watcher blocks instead of growing
+without limit, and a full rescan afterwards picks up anything it missed.
+"""
+
+import ctypes
+import ctypes.util
+import json
+import os
+import queue
+import select
+import signal
+import struct
+import threading
+import time
+
+from config import (WATCH_IMAGE_EXTENSIONS, WATCH_POLL_INTERVAL, WATCH_QUEUE_SIZE,
+                    WATCH_BATCH_SIZE, WATCH_MANIFEST_NAME, DEDUP_HAMMING_THRESHOLD)
+from dedup import DedupClassifier
+import image_loader
+
+# inotify constants from <sys/inotify.h>
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_Q_OVERFLOW = 0x00004000
+_IN_ISDIR = 0x40000000
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class ProcessedManifest:
+    """
+    Append-only record of finished files, keyed by path, size and mtime.
+    A file that changes after it was classified is treated as new.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._done = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # A torn last line from a crash; that file is simply redone
+                    self._done[entry['path']] = (entry['size'], entry['mtime'])
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def __len__(self):
+        return len(self._done)
+
+    def is_done(self, path, stat):
+        return self._done.get(path) == (stat.st_size, stat.st_mtime)
+
+    def record(self, entries):
+        """Appends a batch of finished entries and flushes them to disk as one checkpoint."""
+        with self._lock:
+            for entry in entries:
+                self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                self._done[entry['path']] = (entry['size'], entry['mtime'])
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class _InotifySource:
+    """Minimal ctypes binding to Linux inotify for a single directory."""
+    def __init__(self, directory):
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            raise OSError("libc not found")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init failed")
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), _IN_CLOSE_WRITE | _IN_MOVED_TO)
+        if wd < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+
+    def read(self, timeout):
+        """
+        Waits up to `timeout` seconds and returns (names, overflowed).
+        Only names of regular files are returned.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return [], False
+        data = os.read(self.fd, 64 * 1024)
+        names, overflowed, offset = [], False, 0
+        while offset < len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & _IN_Q_OVERFLOW:
+                overflowed = True
+            elif name and not mask & _IN_ISDIR:
+                names.append(os.fsdecode(name))
+        return names, overflowed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class WatchFolderDaemon:
+    """Classifies new images in a directory incrementally and checkpoints the results."""
+    def __init__(self, model_manager, directory, manifest_path=None, batch_size=WATCH_BATCH_SIZE,
+                 queue_size=WATCH_QUEUE_SIZE, poll_interval=WATCH_POLL_INTERVAL, use_inotify=True):
+        """
+        Initializes the daemon.
+
+        Args:
+            model_manager (ModelManager): A manager whose model is already loaded.
+            directory (str): The directory to watch.
+            manifest_path (str, optional): Results manifest. Defaults to a file inside `directory`.
+            batch_size (int): Maximum number of images per forward pass and checkpoint.
+            queue_size (int): Capacity of the queue between the watcher and the classifier.
+            poll_interval (float): Seconds between scans when inotify is unavailable.
+            use_inotify (bool): Set to False to force the polling fallback.
+        """
+        self.model_manager = model_manager
+        self.directory = os.path.abspath(directory)
+        self.manifest = ProcessedManifest(manifest_path or os.path.join(self.directory, WATCH_MANIFEST_NAME))
+        self.batch_size = max(1, batch_size)
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.processed = 0
+        self.failed = 0
+        # Burst frames that are near-duplicates of earlier ones reuse their predictions
+        self.dedup = DedupClassifier(model_manager) if DEDUP_HAMMING_THRESHOLD > 0 else None
+        self._pending = set()  # Paths queued or being classified, to avoid duplicates
+        self._failed = {}      # path -> (size, mtime) of unreadable or unclassifiable files, retried only if they change
+        self._pending_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def stop(self):
+        """Asks both the watcher and the classifier loop to finish."""
+        self._stop.set()
+
+    def run(self):
+        """Runs until stop() is called. Classification happens on the calling thread."""
+        print(f"Watching '{self.directory}' ({len(self.manifest)} files already processed).")
+        watcher = threading.Thread(target=self._watch, daemon=True)
+        watcher.start()
+        try:
+            # Queued but unclassified files are not in the manifest, so a restart rescans them
+            while not self._stop.is_set():
+                batch = self._next_batch()
+                if batch:
+                    self._classify(batch)
+        finally:
+            self._stop.set()
+            watcher.join(timeout=self.poll_interval + 1)
+            self.manifest.close()
+            print(f"Stopped. {self.processed} files classified, {self.failed} failed.")
+            if self.dedup is not None:
+                print(self.dedup.summary())
+            if self.model_manager.cascade is not None:
+                print(self.model_manager.cascade.summary())
+
+    # --- Detection ---
+
+    def _enqueue(self, path):
+        """Queues a candidate file unless it is already done or pending. Blocks when the queue is full."""
+        if not path.lower().endswith(WATCH_IMAGE_EXTENSIONS):
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        with self._pending_lock:
+            if path in self._pending or self.manifest.is_done(path, stat):
+                return
+            if self._failed.get(path) == (stat.st_size, stat.st_mtime):
+                return
+            self._pending.add(path)
+        while not self._stop.is_set():
+            try:
+                self.queue.put(path, timeout=0.5)
+                return
+            except queue.Full:
+                continue  # Back-pressure: wait for the classifier to drain the queue
+
+    def _scan(self):
+        """Queues every unprocessed file currently in the directory, oldest first."""
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    try:
+                        if entry.is_file():
+                            entries.append((entry.stat().st_mtime, entry.path))
+                    except OSError:
+                        continue  # Removed or renamed since it was listed
+        except OSError as e:
+            print(f"Could not scan '{self.directory}': {e}")
+            return
+        for _, path in sorted(entries):
+            if self._stop.is_set():
+                return
+            self._enqueue(path)
+
+    def _watch(self):
+        """Producer thread: initial scan for the backlog, then inotify or polling."""
+        source = None
+        if self.use_inotify:
+            try:
+                source = _InotifySource(self.directory)
+            except (OSError, AttributeError) as e:
+                print(f"inotify unavailable ({e}); falling back to polling.")
+        # Scan after the watch is installed so files arriving in between are not lost
+        self._scan()
+        try:
+            while not self._stop.is_set():
+                if source is None:
+                    self._stop.wait(self.poll_interval)
+                    self._scan()
+                    continue
+                names, overflowed = source.read(timeout=0.5)
+                if overflowed:
+                    print("inotify queue overflowed; rescanning directory.")
+                    self._scan()
+                for name in names:
+                    self._enqueue(os.path.join(self.directory, name))
+        finally:
+            if source is not None:
+                source.close()
+
+    # --- Classification ---
+
+    def _next_batch(self):
+        """Collects up to batch_size queued paths, waiting briefly for the first one."""
+        try:
+            batch = [self.queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _classify(self, paths):
+        """
+        Classifies a batch of files in one forward pass, skipping near-duplicates,
+        and checkpoints the results.
+        """
+        images, entries, failed = [], [], []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                # Reduced decode, still above model size; waits briefly if the image budget is busy
+                images.append(image_loader.load_image(path, max_side=448, wait=30))
+                entries.append({'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime})
+            except (OSError, ValueError) as e:
+                print(f"Skipping '{path}': {e}")
+                failed.append(path)
+                try:
+                    stat = os.stat(path)
+                    self._mark_failed(path, stat.st_size, stat.st_mtime)
+                except OSError:
+                    pass
+
+        if images:
+            results = self._predict_isolated(images, entries)
+            done = []
+            for entry, top3 in zip(entries, results):
+                if top3 is None:
+                    failed.append(entry['path'])
+                    self._mark_failed(entry['path'], entry['size'], entry['mtime'])
+                    continue
+                entry['predictions'] = [[label, float(score)] for (_, label, score) in top3]
+                entry['time'] = time.time()
+                done.append(entry)
+            try:
+                self.manifest.record(done)
+                self.processed += len(done)
+            except OSError as e:
+                # Leave these unrecorded so they are retried after a restart
+                print(f"Error writing the manifest: {e}")
+                failed.extend(entry['path'] for entry in done)
+
+        self.failed += len(failed)
+        with self._pending_lock:
+            self._pending.difference_update(paths)
+
+    def _predict(self, images):
+        if self.dedup is not None:
+            return self.dedup.classify_batch(images)
+        return self.model_manager.classify_images(images, top=3)
+
+    def _predict_isolated(self, images, entries):
+        """
+        Returns the top predictions of every image, or None for the images the model
+        fails on. A failing batch is retried one image at a time, so one bad file
+        cannot take the rest of its batch down with it.
+        """
+        try:
+            return self._predict(images)
+        except Exception as e:
+            print(f"Error classifying batch of {len(images)}: {e}; retrying one file at a time.")
+        results = []
+        for image, entry in zip(images, entries):
+            try:
+                results.append(self._predict([image])[0])
+            except Exception as e:
+                print(f"Error classifying '{entry['path']}': {e}")
+                results.append(None)
+        return results
+
+    def _mark_failed(self, path, size, mtime):
+        """Remembers a file that could not be classified; scans skip it until it changes."""
+        with self._pending_lock:
+            self._failed[path] = (size, mtime)
+
+
+def run_daemon(directory, manifest_path=None, use_inotify=True):
+    """Loads the model and runs a WatchFolderDaemon until SIGINT or SIGTERM."""
+    from core import ModelManager
+
+    import perf_profiles
+
+    manager = ModelManager()
+    if not manager.load_model():
+        return 1
+    batch_size = perf_profiles.active_profile(fallback='throughput')['batch_size']
+    daemon = WatchFolderDaemon(manager, directory, manifest_path, batch_size=batch_size,
+                               use_inotify=use_inotify)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: daemon.stop())
+    daemon.run()
+    return 0
@@ -0,0 +1,312 @@
+# wiki_store.py
+# -*- coding: utf-8 -*-
+"""
+Offline Wikipedia summary store for the FaunaLens application.
+
+Production machines often have no internet, so summaries are served from a
+compact local file per language that is built once from a Wikipedia dump
+(pages-articles XML, optionally .bz2) or from an exported JSON file.
+
+Store layout (`<WIKI_STORE_DIR>/<lang>.fws`), all integers little-endian:
+
+    header   magic, version, entry count, offsets of the three sections
+    entries  fixed-size (key offset, key length, record offset, record length),
+             sorted by key so lookups are a binary search
+    keys     normalized titles and redirect sources, UTF-8
+    records  "title\\0summary" in UTF-8, shared by a title and its redirects
+
+The file is memory-mapped, so opening it costs nothing and only the pages a
+lookup touches are read from disk.
+"""
+
+import argparse
+import bz2
+import json
+import mmap
+import os
+import re
+import struct
+import xml.etree.ElementTree as ET
+
+from config import WIKI_STORE_DIR, BASE_DIR
+
+_MAGIC = b'FLWS'
+_VERSION = 1
+_HEADER = struct.Struct('<4sIIQQQ')
+_ENTRY = struct.Struct('<QIQI')
+STORE_EXTENSION = ".fws"
+
+
+def normalize_title(title):
+    """Returns the lookup key of a title: case-folded, underscores as spaces, trimmed."""
+    return ' '.join(title.replace('_', ' ').split()).casefold()
+
+
+class SummaryStore:
+    """Read-only, memory-mapped title -> (title, summary) lookup for one language."""
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, self._entries, self._keys, self._records = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self.close()
+            raise ValueError(f"'{path}' is not a FaunaLens summary store.")
+
+    def __len__(self):
+        return self.count
+
+    def _key_at(self, i):
+        key_offset, key_length, _, _ = _ENTRY.unpack_from(self._map, self._entries + i * _ENTRY.size)
+        start = self._keys + key_offset
+        return self._map[start:start + key_length]
+
+    def lookup(self, query):
+        """
+        Returns (title, summary) for a title or redirect, or None if absent.
+        """
+        key = normalize_title(query).encode('utf-8')
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            if self._key_at(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low == self.count or self._key_at(low) != key:
+            return None
+        _, _, record_offset, record_length = _ENTRY.unpack_from(self._map, self._entries + low * _ENTRY.size)
+        start = self._records + record_offset
+        title, _, summary = self._map[start:start + record_length].decode('utf-8').partition('\0')
+        return title, summary
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def write_store(path, articles, redirects):
+    """
+    Writes a summary store.
+
+    Args:
+        path (str): Output file; written to a temporary file and renamed into place.
+        articles (dict): canonical title -> summary.
+        redirects (dict): redirect source title -> canonical target title.
+
+    Returns:
+        int: The number of lookup keys written.
+    """
+    records = bytearray()
+    record_of = {}  # normalized canonical title -> (offset, length)
+    for title, summary in articles.items():
+        data = f"{title}\0{summary}".encode('utf-8')
+        record_of[normalize_title(title)] = (len(records), len(data))
+        records += data
+
+    keyed = dict(record_of)
+    for source, target in redirects.items():
+        record = record_of.get(normalize_title(target))
+        if record is not None:
+            keyed.setdefault(normalize_title(source), record)
+
+    keys = bytearray()
+    entries = bytearray()
+    for key in sorted(k.encode('utf-8') for k in keyed):
+        record_offset, record_length = keyed[key.decode('utf-8')]
+        entries += _ENTRY.pack(len(keys), len(key), record_offset, record_length)
+        keys += key
+
+    entries_offset = _HEADER.size
+    keys_offset = entries_offset + len(entries)
+    records_offset = keys_offset + len(keys)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, len(keyed), entries_offset, keys_offset, records_offset))
+        f.write(entries)
+        f.write(keys)
+        f.write(records)
+    os.replace(tmp_path, path)
+    return len(keyed)
+
+
+# --- Input readers ---
+
+def read_json_export(path):
+    """
+    Reads an exported JSON (a list) or JSON-lines file of objects with
+    'title', 'summary' (or 'extract') and optional 'redirects' lists.
+
+    Returns:
+        (articles, redirects) dicts as expected by write_store.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    stripped = text.lstrip()
+    items = json.loads(text) if stripped.startswith('[') else [json.loads(l) for l in text.splitlines() if l.strip()]
+    articles, redirects = {}, {}
+    for item in items:
+        summary = item.get('summary') or item.get('extract')
+        if summary:
+            articles[item['title']] = summary
+        for source in item.get('redirects', []):
+            redirects[source] = item['title']
+    return articles, redirects
+
+
+_TEMPLATE = re.compile(r'\{\{[^{}]*\}\}')
+_TABLE = re.compile(r'\{\|.*?\|\}', re.S)
+_REF = re.compile(r'<ref[^>/]*/>|<ref[^>]*>.*?</ref>', re.S)
+_COMMENT = re.compile(r'<!--.*?-->', re.S)
+_TAG = re.compile(r'<[^>]+>')
+_FILE_LINK = re.compile(r'\[\[(?:File|Image|Datei|Archivo|Fichier|ファイル|파일|文件|檔案):[^\[\]]*(?:\[\[[^\]]*\]\][^\[\]]*)*\]\]', re.I)
+_LINK = re.compile(r'\[\[(?:[^|\]]*\|)?([^\]]*)\]\]')
+_EXTERNAL = re.compile(r'\[https?://\S+\s*([^\]]*)\]')
+_EMPHASIS = re.compile(r"'{2,}")
+
+
+def wikitext_summary(text, max_chars=3000):
+    """Extracts a best-effort plain-text lead section from raw wikitext."""
+    lead = text.split('\n==', 1)[0]
+    lead = _COMMENT.sub('', lead)
+    lead = _REF.sub('', lead)
+    # Templates nest; strip innermost first until none are left
+    previous = None
+    while previous != lead:
+        previous, lead = lead, _TEMPLATE.sub('', lead)
+    lead = _TABLE.sub('', lead)
+    lead = _FILE_LINK.sub('', lead)
+    lead = _LINK.sub(r'\1', lead)
+    lead = _EXTERNAL.sub(r'\1', lead)
+    lead = _EMPHASIS.sub('', lead)
+    lead = _TAG.sub('', lead)
+    paragraphs = [' '.join(p.split()) for p in lead.split('\n\n')]
+    return '\n\n'.join(p for p in paragraphs if p)[:max_chars].strip()
+
+
+def _iter_dump_pages(path):
+    """Yields (title, redirect_target, wikitext) for every main-namespace page of an XML dump."""
+    opener = bz2.open if path.endswith('.bz2') else open
+    with opener(path, 'rb') as f:
+        title = redirect = text = None
+        namespace = '0'
+        root = None
+        for event, elem in ET.iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                continue
+            tag = elem.tag.rsplit('}', 1)[-1]
+            if tag == 'title':
+                title = elem.text
+            elif tag == 'ns':
+                namespace = elem.text
+            elif tag == 'redirect':
+                redirect = elem.get('title')
+            elif tag == 'text':
+                text = elem.text or ''
+            elif tag == 'page':
+                if namespace == '0' and title:
+                    yield title, redirect, text
+                title = redirect = text = None
+                namespace = '0'
+                # Cleared pages would still hang off the root: drop them too to keep
+                # memory flat over multi-gigabyte dumps
+                root.clear()
+
+
+def read_xml_dump(path, wanted=None):
+    """
+    Reads a pages-articles dump. With a `wanted` set of titles, two passes are
+    made: the first resolves redirects whose source is wanted, the second keeps
+    only articles that are wanted directly or through such a redirect.
+
+    Returns:
+        (articles, redirects) dicts as expected by write_store.
+    """
+    wanted_keys = {normalize_title(t) for t in wanted} if wanted else None
+    redirects = {}
+    if wanted_keys is not None:
+        for title, target, _ in _iter_dump_pages(path):
+            if target and normalize_title(title) in wanted_keys:
+                redirects[title] = target
+        wanted_keys |= {normalize_title(t) for t in redirects.values()}
+
+    articles = {}
+    for title, target, text in _iter_dump_pages(path):
+        if target:
+            if wanted_keys is None:
+                redirects[title] = target
+            continue
+        if wanted_keys is None or normalize_title(title) in wanted_keys:
+            summary = wikitext_summary(text)
+            if summary:
+                articles[title] = summary
+    return articles, redirects
+
+
+def build(lang, input_path, output_dir=WIKI_STORE_DIR, wanted=None):
+    """Builds the store for one language from a JSON export or an XML dump."""
+    if input_path.endswith(('.xml', '.xml.bz2')):
+        articles, redirects = read_xml_dump(input_path, wanted)
+    else:
+        articles, redirects = read_json_export(input_path)
+        if wanted:
+            wanted_keys = {normalize_title(t) for t in wanted}
+            redirects = {s: t for s, t in redirects.items()
+                         if normalize_title(s) in wanted_keys or normalize_title(t) in wanted_keys}
+            keep = wanted_keys | {normalize_title(t) for t in redirects.values()}
+            articles = {t: s for t, s in articles.items() if normalize_title(t) in keep}
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"{lang}{STORE_EXTENSION}")
+    count = write_store(path, articles, redirects)
+    print(f"[{lang}] {len(articles)} articles, {count} keys -> {path}")
+    return path
+
+
+def main(argv=None):
+    """Command-line interface for building offline summary stores."""
+    parser = argparse.ArgumentParser(description="Build offline Wikipedia summary stores.")
+    parser.add_argument('--output', default=WIKI_STORE_DIR, help="Store directory.")
+    parser.add_argument('--labels', help="Text file of wanted titles, one per line (default: keep all).")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    one = sub.add_parser('build', help="Build the store of one language.")
+    one.add_argument('lang')
+    one.add_argument('input', help="Pages-articles XML(.bz2) dump or JSON/JSON-lines export.")
+
+    every = sub.add_parser('build-all', help="Build every language in languages.json.")
+    every.add_argument('input_dir', help="Directory with one '<lang>.json', '<lang>.jsonl', "
+                                         "'<lang>.xml' or '<lang>.xml.bz2' file per language.")
+
+    lookup = sub.add_parser('lookup', help="Look a title up in a built store.")
+    lookup.add_argument('lang')
+    lookup.add_argument('title')
+    args = parser.parse_args(argv)
+
+    wanted = None
+    if args.labels:
+        with open(args.labels, 'r', encoding='utf-8') as f:
+            wanted = {line.strip() for line in f if line.strip()}
+
+    if args.command == 'build':
+        build(args.lang, args.input, args.output, wanted)
+    elif args.command == 'build-all':
+        with open(os.path.join(BASE_DIR, 'languages.json'), 'r', encoding='utf-8') as f:
+            languages = list(json.load(f).keys())
+        for lang in languages:
+            candidates = [os.path.join(args.input_dir, f"{lang}{ext}") for ext in ('.xml.bz2', '.xml', '.jsonl', '.json')]
+            found = next((c for c in candidates if os.path.exists(c)), None)
+            if found is None:
+                print(f"[{lang}] no input found in {args.input_dir}; skipped.")
+                continue
+            build(lang, found, args.output, wanted)
+    else:
+        store = SummaryStore(os.path.join(args.output, f"{args.lang}{STORE_EXTENSION}"))
+        result = store.lookup(args.title)
+        print(f"{result[0]}\n\n{result[1]}" if result else "Not found.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())